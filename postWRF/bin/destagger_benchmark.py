@@ -0,0 +1,82 @@
+"""Time and peak memory of reading staggered fields (U, W) with
+WRFOut.load, against reading the whole staggered dimension and
+destaggering afterwards with 0.5*(data[:-1]+data[1:]).
+
+Selections: the whole domain, a subdomain, one level, and one column.
+Memory is the peak of numpy allocations traced by tracemalloc.
+
+Usage: python destagger_benchmark.py [nt] [nz] [ny] [nx] [repeats]
+"""
+import sys
+import time
+import datetime
+import tempfile
+import shutil
+import os
+import tracemalloc
+
+import numpy as N
+
+from WEM.postWRF.postWRF.wrfout import WRFOut
+from dtype_memory_benchmark import write_wrfout
+
+def full_read(W,vrbl,tidx,lvidx,lonidx,latidx):
+    """Read the whole staggered dimension, destagger, then subset.
+    """
+    ax = W.check_destagger(vrbl)
+    dim_names = W.get_dims(vrbl)
+    sl = W.create_slice(vrbl,tidx,lvidx,lonidx,latidx,dim_names)
+    keep = sl[ax]
+    sl[ax] = slice(None)
+    data = W.nc.variables[vrbl][tuple(sl)]
+    sl0 = [slice(None),]*data.ndim
+    sl1 = [slice(None),]*data.ndim
+    sl0[ax] = slice(None,-1)
+    sl1[ax] = slice(1,None)
+    data = 0.5*(data[tuple(sl0)]+data[tuple(sl1)])
+    sub = [slice(None),]*data.ndim
+    sub[ax] = keep
+    return data[tuple(sub)]
+
+def measure(func,repeats):
+    func()
+    t = time.perf_counter()
+    for n in range(repeats):
+        func()
+    elapsed = (time.perf_counter()-t)/repeats
+    tracemalloc.start()
+    out = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak/1024.0**2
+
+if __name__ == '__main__':
+    sizes = [4,50,300,300,5]
+    for n,a in enumerate(sys.argv[1:]):
+        sizes[n] = int(a)
+    nt, nz, ny, nx, repeats = sizes
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fpath = os.path.join(tmpdir,'wrfout_d01_2013-08-15_00:00:00')
+        write_wrfout(fpath,datetime.datetime(2013,8,15,0),nt,nz,ny,nx,
+                        stagger=True)
+        W = WRFOut(fpath)
+        sels = (('domain',dict(tidx=None,lvidx=None,lonidx=None,latidx=None)),
+                ('subdomain',dict(tidx=None,lvidx=None,
+                    lonidx=slice(nx//4,nx//2),latidx=slice(ny//4,ny//2))),
+                ('level',dict(tidx=None,lvidx=nz//2,lonidx=None,latidx=None)),
+                ('column',dict(tidx=None,lvidx=None,lonidx=nx//2,latidx=ny//2)),
+                )
+        print("{0:>3} {1:>10} {2:>20} {3:>20}".format('','','full read (ms, MB)',
+                                                    'load (ms, MB)'))
+        for vrbl in ('U','W'):
+            for name, kw in sels:
+                ref, t0, m0 = measure(lambda: full_read(W,vrbl,**kw),repeats)
+                new, t1, m1 = measure(lambda: W.load(vrbl,**kw),repeats)
+                assert N.allclose(ref,new,atol=1e-6)
+                print("{0:>3} {1:>10} {2:>11.1f} {3:>8.1f} {4:>11.1f} {5:>8.1f}".format(
+                        vrbl,name,t0*1000,m0,t1*1000,m1))
+        W.nc.close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,111 @@
+"""Peak memory of an ensemble array with float64 and float32 data.
+
+Writes a synthetic ensemble (float32 fields, as WRF writes them), then
+in a fresh process for each dtype builds the 5D ensemble array of a 3D
+field over every time, and the ensemble mean and standard deviation
+(Ensemble.mean and Ensemble.std).
+Prints the rise in peak resident set size (RSS) over the baseline.
+
+Usage: python dtype_memory_benchmark.py [nmem] [nt] [nz] [ny] [nx]
+"""
+import os
+import sys
+import resource
+import datetime
+import tempfile
+import shutil
+import subprocess
+
+import numpy as N
+from netCDF4 import Dataset
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+def write_wrfout(fpath,t0,nt,nz,ny,nx,dt=3600,stagger=False):
+    """Synthetic wrfout file with T on the mass grid, and (if stagger)
+    U and W on their staggered grids.
+    """
+    rs = N.random.RandomState(abs(hash(fpath)) % 2**31)
+    nc = Dataset(fpath,'w')
+    dims = [('Time',None),('DateStrLen',19),('bottom_top',nz),
+            ('south_north',ny),('west_east',nx)]
+    if stagger:
+        dims += [('bottom_top_stag',nz+1),('west_east_stag',nx+1)]
+    for dname, size in dims:
+        nc.createDimension(dname,size)
+    nc.DX = 3000.0
+    nc.DY = 3000.0
+    nc.CEN_LAT = 40.0
+    nc.CEN_LON = -100.0
+    nc.TRUELAT1 = 30.0
+    nc.TRUELAT2 = 60.0
+    nc.MAP_PROJ = 1
+    nc.STAND_LON = -100.0
+
+    times = nc.createVariable('Times','S1',('Time','DateStrLen'))
+    for n in range(nt):
+        t = t0 + datetime.timedelta(seconds=dt*n)
+        times[n,:] = N.array(list(t.strftime('%Y-%m-%d_%H:%M:%S')),dtype='S1')
+    lons, lats = N.meshgrid(N.linspace(-105,-95,nx),N.linspace(35,45,ny))
+    for vrbl, arr in (('XLAT',lats),('XLONG',lons)):
+        v = nc.createVariable(vrbl,'f4',('Time','south_north','west_east'))
+        v[:] = N.repeat(arr[N.newaxis,...],nt,axis=0)
+    v = nc.createVariable('P_TOP','f4',('Time',))
+    v[:] = 5000.0
+    v = nc.createVariable('T','f4',('Time','bottom_top','south_north','west_east'))
+    v[:] = rs.randn(nt,nz,ny,nx).astype(N.float32)
+    if stagger:
+        v = nc.createVariable('U','f4',('Time','bottom_top','south_north','west_east_stag'))
+        v[:] = rs.randn(nt,nz,ny,nx+1).astype(N.float32)
+        v = nc.createVariable('W','f4',('Time','bottom_top_stag','south_north','west_east'))
+        v[:] = rs.randn(nt,nz+1,ny,nx).astype(N.float32)
+    nc.close()
+
+def make_ensemble(root,nmem,nt,nz,ny,nx,initutc):
+    """Two data files per member, each with nt times.
+    """
+    for m in range(nmem):
+        memdir = os.path.join(root,'m{0:02d}'.format(m))
+        os.makedirs(memdir)
+        for f in range(2):
+            t0 = initutc + datetime.timedelta(hours=nt*f)
+            fname = 'wrfout_d01_{0}'.format(t0.strftime('%Y-%m-%d_%H:%M:%S'))
+            write_wrfout(os.path.join(memdir,fname),t0,nt,nz,ny,nx)
+
+def child(root,dtype,initutc,nt):
+    from WEM.postWRF.postWRF.wrfout import WRFOut
+    from WEM.postWRF.postWRF.ensemble import Ensemble
+
+    WRFOut.dtype = getattr(N,dtype)
+    E = Ensemble(root,initutc,ctrl=False,loadobj=False)
+    base = peak_rss_mb()
+
+    ftime = initutc + datetime.timedelta(hours=2*nt)
+    data = E.ensemble_array('T',itime=initutc,ftime=ftime)
+    mean = E.mean('T',itime=initutc,ftime=ftime,level=None)
+    std = E.std('T',itime=initutc,ftime=ftime,level=None)
+    E.close()
+    print("{0}: array {1} {2}, {3:.0f} MB; peak RSS rise {4:.0f} MB".format(
+            dtype,data.shape,data.dtype,data.nbytes/1024.0**2,
+            peak_rss_mb()-base))
+
+if __name__ == '__main__':
+    initutc = datetime.datetime(2013,8,15,0)
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2],sys.argv[3],initutc,int(sys.argv[4]))
+        sys.exit()
+
+    sizes = [10,6,40,150,150]
+    for n,a in enumerate(sys.argv[1:]):
+        sizes[n] = int(a)
+    nmem, nt, nz, ny, nx = sizes
+    root = tempfile.mkdtemp()
+    try:
+        make_ensemble(root,nmem,nt,nz,ny,nx,initutc)
+        for dtype in ('float64','float32'):
+            subprocess.check_call([sys.executable,__file__,'--child',root,
+                                    dtype,str(nt)])
+    finally:
+        shutil.rmtree(root)
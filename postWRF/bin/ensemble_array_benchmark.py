@@ -0,0 +1,47 @@
+"""Time Ensemble.ensemble_array with increasing numbers of worker
+processes, on a synthetic ensemble written by dtype_memory_benchmark.
+
+Usage: python ensemble_array_benchmark.py [nmem] [nt] [nz] [ny] [nx]
+"""
+import os
+import sys
+import time
+import datetime
+import tempfile
+import shutil
+
+import numpy as N
+
+from WEM.postWRF.postWRF.ensemble import Ensemble
+from dtype_memory_benchmark import make_ensemble
+
+if __name__ == '__main__':
+    initutc = datetime.datetime(2013,8,15,0)
+    sizes = [32,6,40,150,150]
+    for n,a in enumerate(sys.argv[1:]):
+        sizes[n] = int(a)
+    nmem, nt, nz, ny, nx = sizes
+
+    ncpu = os.cpu_count()
+    nprocs = [1,] + [2**n for n in range(1,8) if 2**n <= ncpu]
+    if ncpu not in nprocs:
+        nprocs.append(ncpu)
+
+    root = tempfile.mkdtemp()
+    try:
+        make_ensemble(root,nmem,nt,nz,ny,nx,initutc)
+        E = Ensemble(root,initutc,ctrl=False,loadobj=False)
+        ftime = initutc + datetime.timedelta(hours=2*nt)
+        ref = None
+        for nproc in nprocs:
+            t = time.perf_counter()
+            data = E.ensemble_array('T',itime=initutc,ftime=ftime,nproc=nproc)
+            elapsed = time.perf_counter() - t
+            if ref is None:
+                ref = (data,elapsed)
+            assert N.array_equal(data,ref[0])
+            print("{0:>3} processes: {1:6.2f} s, speedup {2:5.2f}".format(
+                    nproc,elapsed,ref[1]/elapsed))
+        E.close()
+    finally:
+        shutil.rmtree(root)
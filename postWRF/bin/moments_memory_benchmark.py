@@ -0,0 +1,59 @@
+"""Peak memory of the ensemble mean and standard deviation, from the
+whole ensemble array and streamed one member at a time
+(Ensemble.moments), for increasing numbers of members.
+
+Each case runs in a fresh process and prints the rise in peak resident
+set size (RSS) over the baseline. Files are read through a pool of two
+open files, as up to max_open files (each with its own netCDF buffers)
+are otherwise kept open.
+
+Usage: python moments_memory_benchmark.py [nt] [nz] [ny] [nx]
+"""
+import sys
+import datetime
+import tempfile
+import shutil
+import subprocess
+
+import numpy as N
+
+from dtype_memory_benchmark import make_ensemble, peak_rss_mb
+
+def child(root,mode,initutc,nt):
+    from WEM.postWRF.postWRF.ensemble import Ensemble
+
+    # Few open files, so their buffers don't grow with the ensemble
+    E = Ensemble(root,initutc,ctrl=False,loadobj=False,max_open=2)
+    base = peak_rss_mb()
+    ftime = initutc + datetime.timedelta(hours=2*nt)
+    if mode == 'array':
+        data = E.ensemble_array('T',itime=initutc,ftime=ftime)
+        mean = N.mean(data,axis=0,dtype=N.float64).astype(data.dtype)
+        std = N.sqrt(N.mean((data-mean)**2,axis=0,dtype=N.float64)).astype(data.dtype)
+    else:
+        M = E.moments('T',itime=initutc,ftime=ftime)
+        mean = M.mean.astype(M.min.dtype)
+        std = M.std().astype(M.min.dtype)
+    E.close()
+    print("{0:>3} members, {1:>7}: peak RSS rise {2:.0f} MB".format(
+            E.nmems,mode,peak_rss_mb()-base))
+
+if __name__ == '__main__':
+    initutc = datetime.datetime(2013,8,15,0)
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2],sys.argv[3],initutc,int(sys.argv[4]))
+        sys.exit()
+
+    sizes = [6,40,150,150]
+    for n,a in enumerate(sys.argv[1:]):
+        sizes[n] = int(a)
+    nt, nz, ny, nx = sizes
+    for nmem in (5,10,20):
+        root = tempfile.mkdtemp()
+        try:
+            make_ensemble(root,nmem,nt,nz,ny,nx,initutc)
+            for mode in ('array','moments'):
+                subprocess.check_call([sys.executable,__file__,'--child',root,
+                                        mode,str(nt)])
+        finally:
+            shutil.rmtree(root)
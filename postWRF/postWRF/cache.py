@@ -0,0 +1,302 @@
+"""Caches for loaded and computed data, and for file metadata.
+"""
+
+import os
+import collections
+import pickle
+import json
+import time
+import threading
+import hashlib
+
+class ArrayCache(object):
+    def __init__(self,max_mb=512):
+        """Store numpy arrays until a memory cap is reached, then evict
+        the least recently used.
+
+        Args:
+            max_mb (int,float): Memory cap in megabytes. Zero disables
+                the cache.
+        """
+        self.max_bytes = int(max_mb*1024**2)
+        self.nbytes = 0
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self,key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self,key):
+        """Return the array for key, or None if it isn't cached.
+        """
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        else:
+            self.misses += 1
+            return None
+
+    def put(self,key,arr):
+        """Add an array, evicting old entries to stay under the cap.
+        Arrays larger than the cap are not stored.
+        """
+        if arr.nbytes > self.max_bytes:
+            return
+        if key in self.data:
+            self.nbytes -= self.data.pop(key).nbytes
+        self.data[key] = arr
+        self.nbytes += arr.nbytes
+        while self.nbytes > self.max_bytes:
+            _, old = self.data.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def clear(self):
+        self.data.clear()
+        self.nbytes = 0
+
+def cache_dir():
+    """Directory for caches kept between runs: $WEM_CACHE_DIR if set,
+    else "wem" in $XDG_CACHE_HOME (default ~/.cache). Caches are kept
+    out of the data directories, whose modification times are used to
+    tell when a listing is stale.
+    """
+    d = os.environ.get('WEM_CACHE_DIR')
+    if not d:
+        d = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                            os.path.expanduser('~/.cache'),'wem')
+    return d
+
+def cache_path(kind,path,ext):
+    """Path of the kind of cache (e.g. 'meta') for path, a file or
+    directory, named by a hash of its absolute path.
+    """
+    path = os.path.abspath(path)
+    h = hashlib.sha1(path.encode('utf-8','surrogateescape')).hexdigest()
+    return os.path.join(cache_dir(),kind,h[:2],'{0}.{1}'.format(h,ext))
+
+def write_cache(fpath,dump,mode='wb'):
+    """Write a cache file with dump(f), creating its directory.
+    The file is replaced in one step, so readers never see part of
+    it. Errors (e.g. no permission) are silently ignored.
+
+    Returns:
+        True if the file was written.
+    """
+    tmp = '{0}.{1}.{2}'.format(fpath,os.getpid(),threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(fpath),exist_ok=True)
+        with open(tmp,mode) as f:
+            dump(f)
+        os.replace(tmp,fpath)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+class MetadataCache(object):
+    def __init__(self,persist=True):
+        """Store small per-file metadata (dimensions, times, projection)
+        so that reopening a file needs one os.stat and no reads.
+
+        Entries are keyed by absolute path, modification time and size,
+        so a rewritten file is never matched to stale metadata. Entries
+        are kept in memory and, if persist is True, also pickled in
+        cache_dir(), one file for each data file. Nothing is written
+        next to the data. A cache directory that cannot be written to
+        is silently skipped.
+
+        Args:
+            persist (bool): whether to read and write cache files.
+        """
+        self.persist = persist
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_key(fpath):
+        """Return (path, mtime, size) for fpath. Raises OSError
+        (as open() would) if the file doesn't exist.
+        """
+        st = os.stat(fpath)
+        return (os.path.abspath(fpath),st.st_mtime_ns,st.st_size)
+
+    @staticmethod
+    def cache_path(fpath):
+        return cache_path('meta',fpath,'wemmeta')
+
+    def get(self,key):
+        """Return the metadata dictionary for key from file_key(),
+        or None if it isn't cached.
+        """
+        if key in self.data:
+            self.hits += 1
+            return self.data[key]
+
+        if self.persist:
+            try:
+                with open(self.cache_path(key[0]),'rb') as f:
+                    skey, meta = pickle.load(f)
+            except Exception:
+                # Missing, unreadable or written by another version
+                pass
+            else:
+                if skey == key:
+                    self.data[key] = meta
+                    self.hits += 1
+                    return meta
+        self.misses += 1
+        return None
+
+    def put(self,key,meta):
+        self.data[key] = meta
+        if self.persist:
+            write_cache(self.cache_path(key[0]),lambda f: pickle.dump(
+                        (key,meta),f,protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        self.data.clear()
+
+class DirectoryManifest(object):
+    def __init__(self,fpath=None,settle=2.0):
+        """Store directory listings so that a re-run only lists the
+        directories that have changed.
+
+        Entries are keyed by directory path and modification time.
+        Adding, removing or renaming a file changes the modification
+        time, so a stale listing is never used. Listings are kept in
+        memory and, if fpath is given, saved there as JSON. A manifest
+        that cannot be read or written is silently ignored.
+
+        Args:
+            fpath (str, optional): JSON file to load and save. Keep it
+                out of the listed directories (see cache_path()), or
+                saving it changes their modification times.
+            settle (float): directories modified less than this many
+                seconds ago are listed but not stored, as a file added
+                in the same clock tick would not change the time.
+        """
+        self.fpath = fpath
+        self.settle_ns = int(settle*1e9)
+        self.data = {}
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if fpath is not None:
+            try:
+                with open(fpath,'r') as f:
+                    self.data = json.load(f)
+            except Exception:
+                # Missing, unreadable or written by another version
+                self.data = {}
+
+    def listdir(self,dirname):
+        """Return sorted lists of the files and subdirectories in
+        dirname, skipping hidden entries. Raises OSError if dirname
+        can't be listed.
+        """
+        dirname = os.path.abspath(dirname)
+        mtime = os.stat(dirname).st_mtime_ns
+        entry = self.data.get(dirname)
+        if (entry is not None) and (entry['mtime_ns'] == mtime):
+            with self.lock:
+                self.hits += 1
+            return entry['files'], entry['subdirs']
+
+        files = []
+        subdirs = []
+        with os.scandir(dirname) as it:
+            for e in it:
+                if e.name.startswith('.'):
+                    continue
+                elif e.is_dir():
+                    subdirs.append(e.name)
+                else:
+                    files.append(e.name)
+        files.sort()
+        subdirs.sort()
+        with self.lock:
+            self.misses += 1
+            if time.time_ns() - mtime > self.settle_ns:
+                self.data[dirname] = {'mtime_ns':mtime,'files':files,
+                                        'subdirs':subdirs}
+                self.changed = True
+        return files, subdirs
+
+    def save(self):
+        """Write the manifest to fpath if anything has changed.
+        """
+        if (self.fpath is None) or (not self.changed):
+            return
+        if write_cache(self.fpath,lambda f: json.dump(self.data,f),'w'):
+            self.changed = False
+
+    def clear(self):
+        self.data.clear()
+
+class FilePool(object):
+    def __init__(self,opener,max_open=32):
+        """Keep up to max_open data file objects open for reuse, closing
+        the least recently used when a new one is needed.
+
+        Objects must have a close() method. Use as a context manager to
+        close everything at the end of a batch job::
+
+            with FilePool(WRFOut) as pool:
+                W = pool.get(fpath)
+
+        Args:
+            opener: callable that takes a file path (and keyword
+                arguments) and returns an object, e.g. WRFOut.
+            max_open (int): maximum number of objects kept open.
+        """
+        self.opener = opener
+        self.max_open = max_open
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def __contains__(self,fpath):
+        return any(k[0] == os.path.abspath(fpath) for k in self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self,fpath,**kwargs):
+        """Return the pooled object for fpath, opening it if needed.
+        """
+        key = (os.path.abspath(fpath),tuple(sorted(kwargs.items())))
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+
+        self.misses += 1
+        obj = self.opener(fpath,**kwargs)
+        self.data[key] = obj
+        while len(self.data) > self.max_open:
+            _, old = self.data.popitem(last=False)
+            old.close()
+        return obj
+
+    def close(self):
+        """Close and forget every pooled object.
+        """
+        while self.data:
+            _, old = self.data.popitem(last=False)
+            old.close()
@@ -1,11 +1,17 @@
 import os
+import re
 import pdb
 import datetime
+import concurrent.futures
+from multiprocessing import shared_memory
 
 import numpy as N
 
 import WEM.utils as utils
 from .wrfout import WRFOut
+from .cache import FilePool, DirectoryManifest, cache_path
+from . import precip
+from .moments import Moments, Exceedance, Neighbourhood
 
 """This module contains the Ensemble class only.
 
@@ -20,10 +26,98 @@ Todo:
 # Dummy variable in place of proper subclass of WRFOut
 AuxWRFOut = object
 
+# Default WRF history file name, e.g. wrfout_d01_2013-08-15_00:00:00
+WRFOUT_RE = re.compile(r'^wrfout_d(\d{2})_(\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2})$')
+
+def parse_wrfout_fname(fname):
+    """Domain number and first time of a WRF history file from its
+    name, or None if it isn't a history file.
+    """
+    m = WRFOUT_RE.match(fname)
+    if m is None:
+        return None
+    return (int(m.group(1)),
+            datetime.datetime.strptime(m.group(2),'%Y-%m-%d_%H:%M:%S'))
+
+def station_series(fpath,vrbls,weights,level=None,other=False):
+    """Station time series from one data file. Module-level so it can
+    run in worker processes; see Ensemble.get_stations().
+    """
+    W = WRFOut(fpath)
+    try:
+        return W.get_stations(vrbls,level=level,other=other,weights=weights)
+    finally:
+        W.close()
+
+def file_times(tidxs):
+    """Time indices within one data file as a slice if they are
+    consecutive (faster to read), else as an array.
+    """
+    tidxs = N.asarray(tidxs,dtype=int)
+    if N.all(N.diff(tidxs) == 1):
+        return slice(int(tidxs[0]),int(tidxs[-1])+1)
+    return tidxs
+
+def ensemble_chunk(shm_name,shape,dtype,mn,tns,fpath,tidxs,vrbl,kwargs):
+    """Read the times tns (indices tidxs in the file) of member mn into
+    an ensemble array in shared memory. Module-level so it can run in
+    worker processes; see Ensemble.ensemble_array().
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = N.ndarray(shape,dtype=dtype,buffer=shm.buf)
+        W = WRFOut(fpath)
+        try:
+            out[mn,tns,...] = W.get(vrbl,utc=file_times(tidxs),dtype=dtype,
+                                    **kwargs)
+        finally:
+            W.close()
+        del out
+    finally:
+        shm.close()
+
+def member_array(mjobs,nt,vrbl,kwargs,dtype=None,datafile=None):
+    """All times of one member's data in one array.
+
+    Args:
+        mjobs (list): (times, file path, time indices in that file) for
+            each data file, as from Ensemble.file_jobs().
+        nt (int): number of times.
+        datafile (optional): function returning the (pooled) data file
+            object for a path. Default opens and closes each file.
+    """
+    data = None
+    for tns,fpath,tidxs in mjobs:
+        if datafile is None:
+            W = WRFOut(fpath)
+            try:
+                d = W.get(vrbl,utc=file_times(tidxs),dtype=dtype,**kwargs)
+            finally:
+                W.close()
+        else:
+            W = datafile(fpath)
+            d = W.get(vrbl,utc=file_times(tidxs),dtype=dtype,**kwargs)
+            # Each file is read once, so cached arrays would only
+            # make memory grow with the number of members
+            W.cache.clear()
+        if data is None:
+            data = N.empty((nt,)+d.shape[1:],dtype=d.dtype)
+        data[tns,...] = d
+    return data
+
+def accumulate(stats,jobs,nt,vrbl,kwargs,dtype=None):
+    """Add some members, one at a time, to stats (e.g. a Moments
+    object). Module-level so it can run in worker processes; see
+    Ensemble.stream().
+    """
+    for mjobs in jobs:
+        stats.add(member_array(mjobs,nt,vrbl,kwargs,dtype))
+    return stats
+
 class Ensemble(object):
     def __init__(self,rootdir,initutc,doms=1,ctrl='ctrl',aux=False,
         model='wrf',fmt='em_real',f_prefix=None,loadobj=True,
-        ncf=False,debug=False):
+        ncf=False,debug=False,max_open=32,manifest=True,scan_threads=16):
         """Class containing all ensemble members. Default is a
             deterministic forecast (i.e. ensemble of one control member).
             Each ensemble member needs to have a separate folder (named
@@ -51,6 +145,16 @@ class Ensemble(object):
                 ensemble member's main data files. Must be length /doms/.
                 Default is None, which then uses a method to determine
                 the file name using default outputs from e.g. WRF.
+            max_open (int, optional): Number of data files kept open for
+                reuse. The least recently used is closed when another
+                is needed. Use the Ensemble as a context manager, or
+                call close(), to close all of them.
+            manifest (bool, optional): Whether to keep the listings of
+                the ensemble's directories in the cache directory (see
+                cache.cache_dir()), so that later runs only list
+                directories that changed.
+            scan_threads (int, optional): Number of directories listed
+                at once when finding the members.
         """
         self.debug = debug
         self.ctrl = ctrl
@@ -62,6 +166,9 @@ class Ensemble(object):
         self.loadobj = loadobj
         self.aux = aux
         self.ncf = ncf
+        self.pool = FilePool(self.open_datafile,max_open=max_open)
+        self.manifest = manifest
+        self.scan_threads = scan_threads
 
         self.isaux = True if isinstance(self.aux,dict) else False
         if f_prefix is not None and len(f_prefix) is not doms:
@@ -76,6 +183,8 @@ class Ensemble(object):
 
         # Get start and end of whole dataset (inclusive)
         self.filetimes = self.list_of_filetimes(arb=True)
+        # Index for fast lookup of the file holding each time
+        self.filetimes64 = N.array(self.filetimes,dtype='datetime64[s]')
         self.nt_per_file = self.compute_nt_per_file()
         self.itime = self.filetimes[0]
         self.hdt = self.compute_history_dt()
@@ -100,100 +209,135 @@ class Ensemble(object):
         f_diff = self.filetimes[1] - self.filetimes[0]
         return f_diff.seconds
 
+    def scan_dirs(self):
+        """List the root directory, each member's directory, and their
+        subdirectories (e.g. an ensemble grouped by perturbation type),
+        listing all directories at each depth at once.
+
+        Returns:
+            dirs (dict): Directory and list of files for each member
+                name. Member names of subdirectories are joined with an
+                underscore, e.g. 'ICBC_m01'.
+        """
+        if self.manifest:
+            M = DirectoryManifest(cache_path('manifest',self.rootdir,'json'))
+        else:
+            M = DirectoryManifest()
+
+        def listdir(dirname):
+            try:
+                return M.listdir(dirname)
+            except OSError:
+                return [], []
+
+        dirs = {}
+        _, subdirs = M.listdir(self.rootdir)
+        names = [(s,) for s in subdirs]
+        with concurrent.futures.ThreadPoolExecutor(self.scan_threads) as ex:
+            for depth in range(2):
+                paths = [os.path.join(self.rootdir,*n) for n in names]
+                listings = list(ex.map(listdir,paths))
+                for n, path, (files, subdirs) in zip(names,paths,listings):
+                    dirs['_'.join(n)] = (path,files)
+                names = [n+(s,) for n, (_,subdirs) in zip(names,listings)
+                                    for s in subdirs]
+        M.save()
+        return dirs
+
     def get_members(self,):
         """Create a dictionary with all data.
 
         Format is:
         members[member][domain][time][data]
 
+        Files are found from one listing of each directory (see
+        scan_dirs). For each member and domain, the history files
+        from initutc onwards are used, up to the first missing file.
+
         Returns:
             members (dict): Dictionary of ensemble members
             fdt (int): Seconds between output files.
         """
         members = {}
         fdt = None
+        dirs = self.scan_dirs()
         for dom in range(1,self.doms+1):
             # Get file name for initialisation time and domain
-            # main_fname = self.get_data_fname(dom=dom,prod='main')
             if not self.ncf:
                 main_fname  = utils.get_netcdf_naming(self.model,self.initutc,dom)
             else:
                 main_fname = self.ncf
-            # if dom in self.aux:
-                # aux_fname = self.get_data_fname(dom=dom,prod='aux')
-            # Each ensemble member has a domain
-            for dirname,subdirs,files in os.walk(self.rootdir):
-                # If ensemble size = 1, there will be no subdirs.
-                # pdb.set_trace()
-                if main_fname in files:
-                    # pdb.set_trace()
-                    dsp =  dirname.split('/')
-                    rsp = self.rootdir.split('/')
-
-                    # The following logic merges subdir names
-                    # e.g. ensemble grouped twice by perturbation type?
-                    if dsp[:-1] == rsp:
-                        member = dirname.split('/')[-1]
-                    elif dsp[:-2] == rsp:
-                        member = '_'.join(dirname.split('/')[-2:])
+            for member in sorted(dirs):
+                dirname, files = dirs[member]
+                if main_fname not in files:
+                    continue
+                if self.debug:
+                    print("Looking at member {0}".format(member))
+                members.setdefault(member,{})[dom] = {}
+                if dom==1:
+                    self.member_names.append(member)
+
+                if self.ncf:
+                    fnames = {self.initutc:self.ncf}
+                else:
+                    fnames = {}
+                    for f in files:
+                        dt = parse_wrfout_fname(f)
+                        if (dt is not None) and (dt[0] == dom):
+                            fnames[dt[1]] = f
+                    if fdt is None:
+                        later = sorted(t for t in fnames if t > self.initutc)
+                        if later:
+                            fdt = int((later[0]-self.initutc).total_seconds())
+
+                t = self.initutc
+                while t in fnames:
+                    fpath = os.path.join(dirname,fnames[t])
+                    if self.loadobj:
+                        dataobj = self.datafile_object(fpath,loadobj=True)
                     else:
-                        # pdb.set_trace()
-                        # raise Exception("What is this folder structure?", dsp, rsp, dirname)
-                        print("Skipping file in {}".format(dirname))
-                        continue
-                    if self.debug:
-                        print("Looking at member {0}".format(member))
-                    if member not in members:
-                        members[member] = {dom:{}}
-                    if dom==1:
-                        self.member_names.append(member)
-                    t = self.initutc
-                    while True:
-                        if not self.ncf:
-                            t_fname = utils.get_netcdf_naming(self.model,t,dom)
-                        else:
-                            t_fname = self.ncf
-                        # Check for history output time
-                        fpath = os.path.join(self.rootdir,dirname,t_fname)
-                        try:
-                            dataobj = self.datafile_object(fpath,loadobj=self.loadobj)
-                        except IOError:
-                            # All wrfout files have been found
-                            break
-                        else:
-                            # print("Assigning file path and maybe object.")
-                            members[member][dom][t] = {'dataobj':dataobj,
-                                                'fpath':fpath,
-                                                'control': (member is self.ctrl)}
-                            # print("Done.")
-                        if (self.aux is not False) and (dom in self.aux):
-                            # TODO: implement
-                            fpath = os.path.join(self.rootdir,dirname,aux_fname)
-                            dataobj = self.datafile_object(fpath,loadobj=self.loadobj)
-                            members[member][dom][t]['auxdataobj'] = dataobj
-                            members[member][dom][t]['auxfpath'] = fpath
-                            members[member][dom][t]['control'] = member is self.ctrl
-                        # Move to next time
-                        if not self.ncf:
-                            if fdt is None:
-                                f1, f2 = sorted(files)[:2]
-                                fdt = utils.dt_from_fnames(f1,f2,'wrf')
-
-                                # Loop through files and estimate dt based on fname
-                            else:
-                                t = t + datetime.timedelta(seconds=fdt)
-                        else:
-                            break
+                        dataobj = False
+                    members[member][dom][t] = {'dataobj':dataobj,
+                                        'fpath':fpath,
+                                        'control': (member is self.ctrl)}
+                    if (self.aux is not False) and (dom in self.aux):
+                        # TODO: implement
+                        fpath = os.path.join(self.rootdir,dirname,aux_fname)
+                        dataobj = self.datafile_object(fpath,loadobj=self.loadobj)
+                        members[member][dom][t]['auxdataobj'] = dataobj
+                        members[member][dom][t]['auxfpath'] = fpath
+                        members[member][dom][t]['control'] = member is self.ctrl
+                    if self.ncf or (fdt is None):
+                        break
+                    t = t + datetime.timedelta(seconds=fdt)
 
         return members, fdt
 
-    def datafile_object(self,fpath,loadobj=False,**kwargs):
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        """Close all data files held open by the ensemble.
+        """
+        self.pool.close()
+
+    def open_datafile(self,fpath,**kwargs):
         #Extend to include other files (GEFS, RUC etc)
         #TODO: Implement auxiliary wrfout files
+        ops = {'wrf':WRFOut,'aux':AuxWRFOut}
+        return ops[self.model](fpath,**kwargs)
+
+    def datafile_object(self,fpath,loadobj=False,**kwargs):
+        """Return the data file object for fpath from the shared pool
+        of open files, or False if loadobj is False (after checking the
+        file exists).
+        """
         # print(fpath)
         if loadobj:
-            ops = {'wrf':WRFOut,'aux':AuxWRFOut}
-            answer = ops[self.model](fpath,**kwargs)
+            answer = self.pool.get(fpath,**kwargs)
         else:
             os.stat(fpath)
             answer = False
@@ -230,52 +374,107 @@ class Ensemble(object):
                             dom=1):
         """
         Return probability of exceeding or reaching a threshold.
+
+        For many thresholds or time windows, use probabilities().
         
         Arguments:
             vrbl (str,N.array): variable. If N.array, use provided data
                 (i.e. override the loading)
-            overunder (str): 'over' or 'under' for threshold evaluation
-            threshold (float,int): the threshold in SI units
+            overunder (str): 'over', 'under' or 'between' for threshold
+                evaluation (see moments.Exceedance)
+            threshold (float,int,tuple): the threshold in SI units, or
+                (low, high) for 'between'
             itime (datetime.datetime): initial time
             ftime (datetime.datetime): final time
             Nlim, Elim, Slim, Wlim (float,optional): bounding box
         """
         if isinstance(vrbl,N.ndarray):
-            all_ens_data = vrbl
+            P = Exceedance((threshold,),overunder=overunder)
+            for data in vrbl:
+                P.add(data)
         else:
-            all_ens_data = self.ensemble_array(vrbl,level=level,itime=itime,ftime=ftime,
-                            fcsttime=fcsttime,Nlim=Nlim,Elim=Elim,
-                            Slim=Slim,Wlim=Wlim,dom=dom)
+            if isinstance(itime,datetime.datetime) and isinstance(
+                        ftime,datetime.datetime):
+                window = (itime,ftime)
+            else:
+                window = fcsttime
+            P = self.probabilities(vrbl,(threshold,),(window,),
+                            overunder=overunder,level=level,Nlim=Nlim,
+                            Elim=Elim,Slim=Slim,Wlim=Wlim,dom=dom)
 
         if Nlim:
-            all_ens_data,lats,lons = all_ens_data
+            P,lats,lons = P
 
-        if overunder is 'over':
-            # True/False if member meets condition
-            bool_arr = N.where(all_ens_data > threshold,1,0)
-            # Find maximum for all times
-            max_arr = N.amax(bool_arr,axis=1)
-            # Count members that exceed the threshold
-            # And convert to percentage
-            count_arr = N.sum(max_arr,axis=0)
-            percent_arr = 100*(count_arr/self.nmems)
-        elif overunder is 'under':
-            # True/False if member meets condition
-            bool_arr = N.where(all_ens_data < threshold,1,0)
-            # Find minimum for all times
-            min_arr = N.amin(bool_arr,axis=1)
-            # Count members that exceed the threshold
-            # And convert to percentage
-            count_arr = N.sum(min_arr,axis=0)
-            percent_arr = 100*(count_arr/self.nmems)
-        else:
-            raise Exception("Pick over or under for threshold comparison.")
+        percent_arr = P.probability()[0,0,...]
 
         if Nlim:
             return percent_arr[0,:,:],lats,lons
         else:
             return percent_arr[0,:,:]
 
+    def probabilities(self,vrbl,thresholds,windows,overunder='over',
+                        level=None,Nlim=None,Elim=None,Slim=None,Wlim=None,
+                        inclusive=False,lats=None,lons=None,dom=1,
+                        members=None,dtype=None,nproc=1,radii=None):
+        """Probabilities for many thresholds and time windows, loading
+        each member once (see stream()).
+
+        Args:
+            vrbl (str): variable.
+            thresholds (list,tuple): values, or (low, high) pairs for
+                'between'.
+            windows (list,tuple): (itime, ftime) pairs, like itime and
+                ftime of ensemble_array(), or single times.
+            overunder (str, optional): 'over', 'under' or 'between'
+                (see moments.Exceedance).
+            nproc (int, optional): Number of worker processes, each
+                given some of the members.
+            radii (list,tuple, optional): Neighbourhood radii in km. If
+                given, compute neighbourhood probabilities for every
+                radius (see moments.Neighbourhood).
+
+        Returns:
+            Exceedance object; probability() gives percentages with
+            dimensions (threshold, window, level, lat, lon). If radii
+            are given, Neighbourhood object; nep() and nmep() give
+            percentages with dimensions (threshold, window, radius,
+            level, lat, lon). If Nlim is given, also lats and lons.
+        """
+        if members is None:
+            members = self.member_names
+        elif isinstance(members,str):
+            members = (members,)
+        members = [m for m in members if m is not self.ctrl]
+
+        wtimes = []
+        for w in windows:
+            if isinstance(w,(tuple,list)):
+                wtimes.append(utils.generate_times(w[0],w[1],self.hdt,
+                        inclusive=inclusive,fmt='datetime'))
+            else:
+                wtimes.append([w,])
+        # All windows are read together
+        fts = sorted(set(t for ts in wtimes for t in ts))
+        wins = [file_times([fts.index(t) for t in ts]) for ts in wtimes]
+
+        kwargs = dict(level=level,lons=lons,lats=lats,Nlim=Nlim,Elim=Elim,
+                        Slim=Slim,Wlim=Wlim)
+        if radii is None:
+            P = Exceedance(thresholds,wins,overunder)
+        else:
+            dx = self.arbitrary_pick(dataobj=True).dx
+            P = Neighbourhood(thresholds,[1000.0*r/dx for r in radii],wins,
+                                overunder)
+        P = self.stream(P,vrbl,fts,kwargs,dom=dom,members=members,
+                        dtype=dtype,nproc=nproc)
+
+        if Nlim:
+            DF = self.arbitrary_pick(dataobj=True)
+            lats, lons = DF.get_limited_domain({'Nlim':Nlim,'Elim':Elim,
+                            'Slim':Slim,'Wlim':Wlim},return_array='latlon')
+            return P,lats,lons
+        else:
+            return P
 
     def closest_to_mean(self,vrbl,level,fcsttime,Nlim=False,Elim=False,
                             Slim=False,Wlim=False,):
@@ -310,14 +509,69 @@ class Ensemble(object):
         returns = self.ensemble_array(*args,**kwargs)
         return returns
 
+    def get_stations(self,vrbls,lats,lons,level=None,other=False,dom=1,
+                        members=None,method='nearest',nproc=1):
+        """Time series at many stations for every member.
+
+        Neighbouring grid points are found once for all members (they
+        share a grid), then each data file is read once per variable.
+
+        Args:
+            vrbls (str,list,tuple): Variable(s) to extract.
+            lats, lons (N.ndarray): Station latitudes and longitudes.
+            level (optional): Level, as for WRFOut.get().
+            other (optional): As for WRFOut.get().
+            dom (int, optional): Domain number.
+            members (list, optional): Members to extract. Default is all.
+            method (str, optional): 'nearest' grid point, or inverse-
+                distance weighting of neighbours ('idw').
+            nproc (int, optional): Number of worker processes reading
+                data files in parallel. Default is 1 (no workers).
+
+        Returns:
+            Array with dimensions (member, station, time, variable).
+            Times are every history time, in file order.
+        """
+        if isinstance(vrbls,str):
+            vrbls = (vrbls,)
+        if members is None:
+            members = self.member_names
+        weights = self.arbitrary_pick(dataobj=True).station_weights(
+                                    lats,lons,method=method)
+
+        jobs = [(mem,t) for mem in members
+                    for t in sorted(self.members[mem][dom].keys())]
+        args = [(self.members[mem][dom][t]['fpath'],vrbls,weights,level,other)
+                    for mem,t in jobs]
+        if nproc > 1:
+            with concurrent.futures.ProcessPoolExecutor(nproc) as pool:
+                results = list(pool.map(station_series,*zip(*args)))
+        else:
+            results = []
+            for a in args:
+                W = self.datafile_object(a[0],loadobj=True)
+                results.append(W.get_stations(vrbls,level=level,other=other,
+                                weights=weights))
+                # Each file is read once, so cached arrays would only
+                # make memory grow with the number of members
+                W.cache.clear()
+
+        data = []
+        for mem in members:
+            series = [r for (m,t),r in zip(jobs,results) if m == mem]
+            data.append(N.concatenate(series,axis=1))
+        return N.array(data)
+
     def ensemble_array(self,vrbl,level=None,itime=False,ftime=False,
                         fcsttime=False,Nlim=None,Elim=None,
                         Slim=None,Wlim=None,inclusive=False,
-                        lats=None,lons=None,dom=1,members=None):
+                        lats=None,lons=None,dom=1,members=None,dtype=None,
+                        nproc=1,chunksize=1):
         """
         Returns 5D array of data for ranges.
 
-        Needs to load WRFOut files if self.loadobj is False.
+        Each data file is read once per member, for all the times
+        wanted from it, straight into the preallocated array.
 
         Ordered in descending order on pert. members
         First dimension is ensemble members.
@@ -325,19 +579,25 @@ class Ensemble(object):
         Arguments:
             inclusive (bool, optional): if True, included time specified
                 at ftime in the time range. Default is False (like Python).
+            dtype (optional): floating-point type of the array. Default
+                is that of the data files (see WRFOut.dtype).
+            nproc (int, optional): Number of worker processes reading
+                data files in parallel, into an array in shared memory.
+                Default is 1 (no workers).
+            chunksize (int, optional): Number of data files sent to a
+                worker at a time. Larger chunks cut overheads when there
+                are many small reads.
 
         TODO: lat/lon box is in the correct projection?
-        TODO: Implement bounding lat/lon box.
         TODO: rename to "get()" or "ensemble_get()"?
         """
 
-        ens_no = 0
         # pdb.set_trace()
         if vrbl is 'accum_precip':
             qpf = self.accumulated(vrbl='RAINNC',itime=itime,ftime=ftime,
                             level=level,Nlim=Nlim,Elim=Elim,
                             Slim=Slim,Wlim=Wlim,inclusive=inclusive,
-                            lons=lons,lats=lats)
+                            lons=lons,lats=lats,dom=dom)
             return qpf
         if members is None:
             members = self.member_names
@@ -345,108 +605,299 @@ class Ensemble(object):
             members = (members,)
         else:
             pass
-            
-
-        for nm,mem in enumerate(members):
-            if self.debug:
-                print("Working on member {0}".format(mem))
-            if mem is self.ctrl:
-                print("Skipping control member.")
-                continue
-            else:
-                ens_no += 1
-
-               # if itime and ftime:
-                if isinstance(itime,datetime.datetime) and isinstance(
-                            ftime,datetime.datetime):
-                    # fts = N.arange(itime,ftime,self.hdt)
-                    fts = utils.generate_times(itime,ftime,self.hdt,
-                                inclusive=inclusive)
-                else:
-                    fts = [fcsttime,]
-
-                # if Nlim:
-                    # data = self.members[mem][dom][t]['data'].get(
-                                                        # vrbl,level=level)
-                    # ens_data,lats,lons = utils.return_subdomain(
-                                                    # data,self.examplenc.lats1D,
-                                                    # self.examplenc.lons1D,Nlim,
-                                                    # Elim,Slim,Wlim,fmt='latlon')
-                # else:
-                # pdb.set_trace()
-                for tn, ft in enumerate(fts):
-                    # if len(fts) > 1:
-                    t, tidx = self.find_file_for_t(ft,mem,dom=dom)
-                    # else:
-                        # t = self.initutc
-                        # tidx = ft
-                    if self.debug:
-                        print("Loading data for time {0}".format(ft))
-                    # pdb.set_trace()
-                    fpath = self.members[mem][dom][t]['fpath']
-                    # print("Filepath",fpath)
-                    # print("tidx",tidx)
-                    # pdb.set_trace()
-                    DF = self.datafile_object(fpath,loadobj=True)
-                    m_t_data = DF.get(vrbl,utc=tidx,level=level,lons=lons,lats=lats)[0,...]
-
-                if ens_no == 1:
-                    nz,nlats,nlons = m_t_data.shape
-                    nt = len(fts)
-                    all_ens_data = N.zeros((len(members),nt,nz,nlats,nlons))
-                    # all_ens_data = N.zeros((self.nperts,nt,nz,nlats,nlons))
-
-                all_ens_data[ens_no-1,tn,:,:,:] = m_t_data
+        if any(m is self.ctrl for m in members):
+            print("Skipping control member.")
+            members = [m for m in members if m is not self.ctrl]
+
+        # if itime and ftime:
+        if isinstance(itime,datetime.datetime) and isinstance(
+                    ftime,datetime.datetime):
+            # fts = N.arange(itime,ftime,self.hdt)
+            fts = utils.generate_times(itime,ftime,self.hdt,
+                        inclusive=inclusive,fmt='datetime')
+        else:
+            fts = [fcsttime,]
+        jobs = self.file_jobs(members,fts,dom)
+        kwargs = dict(level=level,lons=lons,lats=lats,Nlim=Nlim,Elim=Elim,
+                        Slim=Slim,Wlim=Wlim)
+
+        # The first read gives the shape and type of the array
+        mn, tns, fpath, tidxs = jobs[0]
+        if self.debug:
+            print("Loading data for member {0}".format(members[mn]))
+        DF = self.datafile_object(fpath,loadobj=True)
+        data = DF.get(vrbl,utc=file_times(tidxs),dtype=dtype,**kwargs)
+        shape = (len(members),len(fts)) + data.shape[1:]
+
+        if nproc > 1:
+            nbytes = int(N.prod(shape))*data.dtype.itemsize
+            shm = shared_memory.SharedMemory(create=True,size=max(nbytes,1))
+            try:
+                out = N.ndarray(shape,dtype=data.dtype,buffer=shm.buf)
+                out[mn,tns,...] = data
+                args = [(shm.name,shape,data.dtype,mn,tns,fpath,tidxs,vrbl,
+                            kwargs) for mn,tns,fpath,tidxs in jobs[1:]]
+                with concurrent.futures.ProcessPoolExecutor(nproc) as pool:
+                    list(pool.map(ensemble_chunk,*zip(*args),
+                                    chunksize=chunksize))
+                # Copied out so the shared block can be freed
+                all_ens_data = out.copy()
+                del out
+            finally:
+                shm.close()
+                shm.unlink()
+        else:
+            all_ens_data = N.empty(shape,dtype=data.dtype)
+            all_ens_data[mn,tns,...] = data
+            for mn,tns,fpath,tidxs in jobs[1:]:
+                if self.debug:
+                    print("Loading data for member {0}".format(members[mn]))
+                # Only the bounding box (if any) is read from disk
+                all_ens_data[mn,tns,...] = self.datafile_object(fpath,
+                        loadobj=True).get(vrbl,utc=file_times(tidxs),
+                        dtype=dtype,**kwargs)
 
         if Nlim:
+            lats, lons = DF.get_limited_domain({'Nlim':Nlim,'Elim':Elim,
+                            'Slim':Slim,'Wlim':Wlim},return_array='latlon')
             return all_ens_data,lats,lons
         else:
             return all_ens_data
 
+    def file_jobs(self,members,fts,dom=1):
+        """Reads needed for the given times of some members: one per
+        member and data file, for all the times in that file.
+
+        Returns:
+            List of (member index, indices in fts, file path, time
+            indices in that file).
+        """
+        # Members share the same times, so look up files once
+        file_ts, file_tidxs = self.find_files_for_t(fts,dom=dom)
+        jobs = []
+        for mn,mem in enumerate(members):
+            for t in sorted(set(file_ts)):
+                tns = [tn for tn,ft in enumerate(file_ts) if ft == t]
+                jobs.append((mn,tns,self.members[mem][dom][t]['fpath'],
+                                file_tidxs[tns]))
+        return jobs
+
+    def stream(self,stats,vrbl,fts,kwargs,dom=1,members=None,dtype=None,
+                    nproc=1):
+        """Add each member's data, one at a time, to stats.
+
+        Args:
+            stats: object with add(data) and merge(other) methods, e.g.
+                Moments. Data is (time, level, lat, lon) for one member.
+            fts (list): times (datetime.datetime) to read.
+            kwargs (dict): selection (level, lats, Nlim etc) passed to
+                the data file's get().
+            nproc (int, optional): Number of worker processes, each
+                given some of the members and an empty copy of stats.
+                Their results are merged into stats.
+
+        Returns:
+            stats
+        """
+        if members is None:
+            members = self.member_names
+        jobs = [[] for mem in members]
+        for mn,tns,fpath,tidxs in self.file_jobs(members,fts,dom):
+            jobs[mn].append((tns,fpath,tidxs))
+
+        if nproc > 1:
+            nproc = min(nproc,len(members))
+            with concurrent.futures.ProcessPoolExecutor(nproc) as pool:
+                futures = [pool.submit(accumulate,stats,jobs[n::nproc],
+                            len(fts),vrbl,kwargs,dtype)
+                            for n in range(nproc)]
+                partials = [f.result() for f in futures]
+            for p in partials:
+                stats.merge(p)
+        else:
+            datafile = lambda f: self.datafile_object(f,loadobj=True)
+            for mn,mjobs in enumerate(jobs):
+                if self.debug:
+                    print("Loading data for member {0}".format(members[mn]))
+                stats.add(member_array(mjobs,len(fts),vrbl,kwargs,dtype,
+                                        datafile))
+        return stats
+
+    def moments(self,vrbl,level=None,itime=False,ftime=False,
+                    fcsttime=False,Nlim=None,Elim=None,Slim=None,Wlim=None,
+                    inclusive=False,lats=None,lons=None,dom=1,members=None,
+                    thresholds=(),dtype=None,nproc=1):
+        """Ensemble statistics, reading one member at a time.
+
+        Memory needed is a few times that of one member's data, however
+        many members there are. Arguments are as for ensemble_array().
+
+        Args:
+            thresholds (list,tuple, optional): Values for which to count
+                the members exceeding them.
+            nproc (int, optional): Number of worker processes, each
+                given some of the members. Their results are merged.
+                Default is 1 (no workers).
+
+        Returns:
+            Moments object with count, mean, variance(), std(), min,
+            max, sum and above(threshold), each with dimensions (time,
+            level, lat, lon). If Nlim is given, also lats and lons.
+        """
+        if members is None:
+            members = self.member_names
+        elif isinstance(members,str):
+            members = (members,)
+        members = [m for m in members if m is not self.ctrl]
+        if isinstance(itime,datetime.datetime) and isinstance(
+                    ftime,datetime.datetime):
+            fts = utils.generate_times(itime,ftime,self.hdt,
+                        inclusive=inclusive,fmt='datetime')
+        else:
+            fts = [fcsttime,]
+
+        kwargs = dict(level=level,lons=lons,lats=lats,Nlim=Nlim,Elim=Elim,
+                        Slim=Slim,Wlim=Wlim)
+        M = self.stream(Moments(thresholds),vrbl,fts,kwargs,dom=dom,
+                        members=members,dtype=dtype,nproc=nproc)
+
+        if Nlim:
+            DF = self.arbitrary_pick(dataobj=True)
+            lats, lons = DF.get_limited_domain({'Nlim':Nlim,'Elim':Elim,
+                            'Slim':Slim,'Wlim':Wlim},return_array='latlon')
+            return M,lats,lons
+        else:
+            return M
+
     def accumulated(self,vrbl='RAINNC',itime=0,ftime=-1,level=False,Nlim=False,
                     Elim=False,Slim=False,Wlim=False,inclusive=False,
-                    lons=None,lats=None):
+                    lons=None,lats=None,dom=1):
         """Accumulate, for every ensemble member, at each grid point,
         the variable specified. Usually precipitation.
 
-        TODO:
-            Logic to work out if values are for each history output
-                timestep, from the start of the simulation, from the 
-                start of the data file...
+        Precipitation (vrbl 'RAINNC' or a type in precip.PRECIP_FIELDS)
+        is the difference of the cumulative fields at ftime and itime,
+        which may be in different data files. Other variables are
+        summed over every history time, at level.
 
+        Args:
+            dom (int, optional): Domain number.
+            Nlim, Elim, Slim, Wlim (float, optional): Bounding box. If
+                given, latitudes and longitudes of the box are also
+                returned.
         """
         if itime==0:
             itime = self.itime
         if ftime==-1:
             ftime = self.ftime
 
-        if vrbl is 'RAINNC':
-            itime_rainnc = self.ensemble_array('RAINNC',fcsttime=itime,
-                    lons=lons,lats=lats)
-            ftime_rainnc = self.ensemble_array('RAINNC',fcsttime=ftime,
-                    lons=lons,lats=lats)
-            accum = ftime_rainnc - itime_rainnc
+        if (vrbl == 'RAINNC') or (vrbl in precip.PRECIP_FIELDS):
+            ptype = 'rainnc' if vrbl == 'RAINNC' else vrbl
+            accum = []
+            for fcsttime in (itime,ftime):
+                ts, tidxs = self.find_files_for_t((fcsttime,),dom=dom)
+                DFs = [self.datafile_object(
+                        self.members[mem][dom][ts[0]]['fpath'],loadobj=True)
+                        for mem in self.member_names if mem != self.ctrl]
+                accum.append(N.array([DF.cumulative_precip(ptype,utc=tidxs,
+                        lats=lats,lons=lons,Nlim=Nlim,Elim=Elim,Slim=Slim,
+                        Wlim=Wlim) for DF in DFs]))
+            accum = accum[1] - accum[0]
+            if Nlim:
+                lats, lons = DFs[0].get_limited_domain({'Nlim':Nlim,
+                                'Elim':Elim,'Slim':Slim,'Wlim':Wlim},
+                                return_array='latlon')
         else:
-            all_ens_data = self.ensemble_array(vrbl,itime=itime,ftime=ftime,
-                                        inclusive=inclusive,lats=lats,lons=lons)
+            all_ens_data = self.ensemble_array(vrbl,level=level,itime=itime,
+                                        ftime=ftime,Nlim=Nlim,Elim=Elim,
+                                        Slim=Slim,Wlim=Wlim,inclusive=inclusive,
+                                        lats=lats,lons=lons,dom=dom)
+            if Nlim:
+                all_ens_data, lats, lons = all_ens_data
             # time axis is 1
             accum = N.sum(all_ens_data,axis=1)
 
         # Resulting matrix is size (nperts,1,nz,nlats,nlons).
+        if Nlim:
+            return accum, lats, lons
         return accum
 
+    def cumulative_precip(self,ptype='total',dom=1,members=None,
+                            lats=None,lons=None,Nlim=None,Elim=None,
+                            Slim=None,Wlim=None):
+        """Precipitation accumulated since initialisation at every
+        history time, for every member. Each field is read once from
+        each data file; series are joined across file boundaries.
+
+        Args:
+            ptype (str, optional): 'total', 'rainnc', 'snow' or 'graupel'.
+                See precip.PRECIP_FIELDS.
+            dom (int, optional): Domain number.
+            members (list, optional): Members to read. Default is all
+                but the control.
+            lats, lons, Nlim, Elim, Slim, Wlim (optional): Subdomain,
+                as for WRFOut.get().
+
+        Returns:
+            times (N.ndarray): datetime64 history times.
+            cumul (N.ndarray): Array with dimensions (member, time, 1,
+                lat, lon).
+        """
+        if members is None:
+            members = [m for m in self.member_names if m != self.ctrl]
+        cumul = []
+        for mem in members:
+            times = []
+            data = []
+            for t in sorted(self.members[mem][dom].keys()):
+                DF = self.datafile_object(self.members[mem][dom][t]['fpath'],
+                                            loadobj=True)
+                times.append(DF.times64)
+                data.append(DF.cumulative_precip(ptype,lats=lats,lons=lons,
+                        Nlim=Nlim,Elim=Elim,Slim=Slim,Wlim=Wlim))
+            # Files may repeat the time at their boundary
+            times, idx = N.unique(N.concatenate(times),return_index=True)
+            cumul.append(N.concatenate(data,axis=0)[idx])
+        return times, N.array(cumul)
+
+    def accumulated_windows(self,windows=('01h','06h','24h'),ptype='total',
+                            **kwargs):
+        """Precipitation over windows ending at each history time, for
+        every member, from one read of the cumulative fields. Windows
+        are named as for StageIV so the two can be compared directly.
+
+        Args:
+            windows (tuple, optional): Window lengths in hours, or names
+                such as '06h'.
+            ptype (str, optional): As for cumulative_precip().
+            **kwargs: Other arguments as for cumulative_precip().
+
+        Returns:
+            times (list): history times (datetime.datetime), i.e. the
+                end of each window.
+            accum (dict): For each window name (e.g. '01h'), array with
+                dimensions (member, time, 1, lat, lon). NaN where the
+                window starts before the first history time.
+        """
+        times, cumul = self.cumulative_precip(ptype,**kwargs)
+        accum = {}
+        for window in windows:
+            accum[precip.window_key(window)] = precip.rolling_accum(
+                    cumul.swapaxes(0,1),times,window).swapaxes(0,1)
+        return list(times.astype(datetime.datetime)), accum
+
     def mean(self,vrbl,fcsttime=False,level=False,Nlim=False,Elim=False,
-             Slim=False,Wlim=False,itime=False,ftime=False):
+             Slim=False,Wlim=False,itime=False,ftime=False,nproc=1):
         """
-        Returns mean.
+        Returns mean, computed one member at a time (see moments()).
         """
-        all_ens_data = self.ensemble_array(vrbl,level=level,fcsttime=fcsttime,
+        M = self.moments(vrbl,level=level,fcsttime=fcsttime,
                                     Nlim=Nlim,Elim=Elim,Slim=Slim,Wlim=Wlim,
-                                    itime=itime,ftime=ftime)
+                                    itime=itime,ftime=ftime,nproc=nproc)
         if Nlim:
-            all_ens_data, lats, lons = all_ens_data
+            M, lats, lons = M
 
-        mean = N.mean(all_ens_data,axis=0)
+        mean = M.mean.astype(M.min.dtype)
 
         if Nlim:
             return mean, lats, lons
@@ -454,16 +905,17 @@ class Ensemble(object):
             return mean
 
     def std(self,vrbl,fcsttime=False,itime=False,ftime=False,level=False,
-            Nlim=False,Elim=False,Slim=False,Wlim=False):
-        """Return standard devation
+            Nlim=False,Elim=False,Slim=False,Wlim=False,nproc=1):
+        """Return standard devation, computed one member at a time
+        (see moments()).
         """
-        all_ens_data = self.ensemble_array(vrbl,level=level,fcsttime=fcsttime,
+        M = self.moments(vrbl,level=level,fcsttime=fcsttime,
                                     Nlim=Nlim,Elim=Elim,Slim=Slim,Wlim=Wlim,
-                                    itime=itime,ftime=ftime)
+                                    itime=itime,ftime=ftime,nproc=nproc)
         if Nlim:
-            all_ens_data, lats, lons = all_ens_data
+            M, lats, lons = M
 
-        std = N.std(all_ens_data,axis=0)
+        std = M.std().astype(M.min.dtype)
 
         if Nlim:
             return std, lats, lons
@@ -552,27 +1004,31 @@ class Ensemble(object):
         TODO:
             Give nearest time (and/or file object) if time doesn't exist.
         """
-        if member == 'arb':
-            member = self.member_names[0]
+        ts, tidxs = self.find_files_for_t((simutc,),dom=dom)
+        return ts[0], int(tidxs[0])
 
-        if not ((simutc <= self.ftime) and (simutc >= self.itime)):
-            raise Exception("Time outside range of data times.")
-        
-        # Returns index of file containing data
-        ftidx, tdiff = utils.closest_datetime(self.filetimes,simutc,round='beforeinc')
+    def find_files_for_t(self,simutcs,dom=1):
+        """Determine files to load for many times at once, with a
+        binary search of the data files' start times.
 
-        # Make positive
-        tdiff = abs(tdiff)
+        Raises exception if any time is outside the data.
 
-        if tdiff == 0:
-            assert self.filetimes[ftidx] == simutc
-            t = simutc
-            tidx = 0
-        else:
-            t = self.filetimes[ftidx]
-            # tidx = int(self.hdt/(self.hdt + tdiff))
-            tidx = int(tdiff/self.hdt)
+        Arguments:
+            simutcs (list,tuple): Desired times (datetime.datetime)
+            dom (int, optional): Domain number to look up
 
-        # pdb.set_trace()
+        Returns:
+            ts (list): members dictionary key for right file, per time.
+            tidxs (N.ndarray): Index in that file, per time.
+        """
+        times = N.array(simutcs,dtype='datetime64[s]')
+        if (times > N.datetime64(self.ftime,'s')).any() or (
+                    times < N.datetime64(self.itime,'s')).any():
+            raise Exception("Time outside range of data times.")
 
-        return t, tidx
+        # Index of file containing data: last start time <= time
+        ftidxs = N.searchsorted(self.filetimes64,times,side='right') - 1
+        tdiffs = (times - self.filetimes64[ftidxs]).astype(int)
+        tidxs = (tdiffs // self.hdt).astype(int)
+        ts = [self.filetimes[i] for i in ftidxs]
+        return ts, tidxs
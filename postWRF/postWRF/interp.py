@@ -0,0 +1,87 @@
+"""Vectorised interpolation of gridded data onto vertical surfaces.
+
+Data are 4D arrays with dimensions (time, level, lat, lon), as returned
+by :func:`WRFOut.get`. Every column and every time is handled in one
+numpy operation rather than a Python loop over grid points.
+"""
+
+import numpy as N
+
+def column_weights(coord,targets,log=False):
+    """Find bracketing levels and weights for interpolating every column
+    of a vertical coordinate onto one or more surfaces.
+
+    The bracketing search counts, for each column, how many levels lie
+    below the target: a searchsorted over the whole cube at once.
+
+    Args:
+        coord (N.ndarray): 4D vertical coordinate, e.g. pressure. Columns
+            should be monotonic (increasing or decreasing with index).
+        targets (float,list,N.ndarray): value(s) of the surface(s),
+            in the same units as coord.
+        log (bool, optional): if True, weights are linear in the log
+            of the coordinate (log-p). Default is False.
+
+    Returns:
+        idx (N.ndarray): 4D (time, target, lat, lon) integer index of the
+            lower bracketing level.
+        wgt (N.ndarray): 4D weight given to level idx+1. Targets outside
+            a column are clamped to the end levels, like numpy.interp.
+    """
+    coord = N.ma.getdata(coord)
+    targets = N.atleast_1d(N.asarray(targets,dtype=float))
+    if log:
+        coord = N.log(coord)
+        targets = N.log(targets)
+
+    nt,nz,ny,nx = coord.shape
+    descending = coord[:,0,...].mean() > coord[:,-1,...].mean()
+
+    idx = N.empty((nt,targets.size,ny,nx),dtype=N.intp)
+    for n, tgt in enumerate(targets):
+        if descending:
+            nbelow = N.sum(coord > tgt,axis=1)
+        else:
+            nbelow = N.sum(coord < tgt,axis=1)
+        idx[:,n,...] = N.clip(nbelow-1,0,nz-2)
+
+    c0 = N.take_along_axis(coord,idx,axis=1)
+    dc = N.take_along_axis(coord,idx+1,axis=1) - c0
+    with N.errstate(divide='ignore',invalid='ignore'):
+        wgt = (targets[N.newaxis,:,N.newaxis,N.newaxis] - c0)/dc
+    wgt[dc==0] = 0.0
+    wgt = N.clip(wgt,0.0,1.0)
+    return idx, wgt
+
+def apply_weights(data,idx,wgt):
+    """Interpolate 4D data with weights from :func:`column_weights`.
+
+    Args:
+        data (N.ndarray): 4D data on the same levels as the coordinate
+            used to create the weights.
+        idx, wgt (N.ndarray): output of :func:`column_weights`.
+
+    Returns:
+        4D array with dimensions (time, target, lat, lon).
+    """
+    lo = N.take_along_axis(data,idx,axis=1)
+    hi = N.take_along_axis(data,idx+1,axis=1)
+    if N.issubdtype(lo.dtype,N.floating):
+        # Keep the precision of the data (e.g. float32)
+        wgt = wgt.astype(lo.dtype,copy=False)
+    return lo + wgt*(hi-lo)
+
+def interp_columns(data,coord,targets,log=False):
+    """Interpolate 4D data onto surface(s) of a vertical coordinate.
+
+    Args:
+        data (N.ndarray): 4D data.
+        coord (N.ndarray): 4D vertical coordinate, same shape as data.
+        targets (float,list,N.ndarray): value(s) of the surface(s).
+        log (bool, optional): interpolate linearly in log(coord).
+
+    Returns:
+        4D array with dimensions (time, target, lat, lon).
+    """
+    idx, wgt = column_weights(coord,targets,log=log)
+    return apply_weights(data,idx,wgt)
@@ -20,6 +20,7 @@ from netCDF4 import Dataset
 import calendar
 import collections
 import copy
+import datetime
 import pickle as pickle
 import fnmatch
 import glob
@@ -210,6 +211,7 @@ class WRFEnviron(object):
             if not Nlim:
                 Nlim, Elim, Slim, Wlim = MATCH.get_limits()
 
+        cropped = False
         if data is None:
             # Data
             W = self.get_dataobj(dom=dom,utc=utc,member=member)
@@ -219,6 +221,14 @@ class WRFEnviron(object):
                 if not accum_hr:
                     raise Exception("Set accumulation period")
                 data = W.compute_accum_rain(utc,accum_hr)[0,0,:,:]
+            elif isinstance(Nlim,float):
+                # Only read the subdomain from disk
+                data = W.get(vrbl,utc=utc,level=level,other=other,
+                                Nlim=Nlim,Elim=Elim,Slim=Slim,
+                                Wlim=Wlim)[0,0,:,:]
+                lats, lons = W.get_limited_domain({'Nlim':Nlim,'Elim':Elim,
+                                'Slim':Slim,'Wlim':Wlim},return_array='latlon')
+                cropped = True
             else:
                 data = W.get(vrbl,utc=utc,level=level,lons=None,lats=None,
                                 other=other)[0,0,:,:]
@@ -229,12 +239,12 @@ class WRFEnviron(object):
         if smooth>1:
             data = stats.gauss_smooth(data,smooth)
 
-        if isinstance(Nlim,float):
-            data,lats,lons = utils.return_subdomain(data,W.lats1D,W.lons1D,
-                                Nlim,Elim,Slim,Wlim,fmt='latlon')
-        else:
+        if not isinstance(Nlim,float):
             lats = False
             lons = False
+        elif not cropped:
+            data,lats,lons = utils.return_subdomain(data,W.lats1D,W.lons1D,
+                                Nlim,Elim,Slim,Wlim,fmt='latlon')
 
         # Scales for plotting
         cmap, clvs = self.get_cmap_clvs(vrbl,level,cmap=cmap,clvs=clvs)
@@ -274,10 +284,30 @@ class WRFEnviron(object):
         # if not dataobj:
             # fpath = self.ensemble.members[member][dom][t]['fpath']
         # dataobj = self.ensemble.datafile_object(self,fpath,loadobj=True)
-        dataobj = self.ensemble.return_DF_for_t(utc,member,dom=1)
+        # Shares the ensemble's pool of open files
+        dataobj = self.ensemble.return_DF_for_t(utc,member,dom=dom)
             # dataobj = WRFOut(fpath)
         return dataobj
 
+    def get_stations(self,vrbls,lats,lons,**kwargs):
+        """Time series at many stations for every ensemble member.
+        Returns array (member, station, time, variable). See
+        Ensemble.get_stations() for keyword arguments.
+        """
+        return self.ensemble.get_stations(vrbls,lats,lons,**kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        """Close all data files held open by the ensemble.
+        """
+        if hasattr(self,'ensemble'):
+            self.ensemble.close()
+
     def get_cmap_clvs(self,vrbl,level,clvs=False,cmap=False):
         if clvs is False and cmap is False:
             S = Scales(vrbl,level)
@@ -1045,20 +1075,41 @@ class WRFEnviron(object):
                     level=None,outdir=False,fname=False,dom=1,
                     clvs=False,fig=False,ax=False,cb=True,accum_hr=False,
                     Nlim=False,Elim=False,Slim=False,Wlim=False,
-                    return_figax=False,verif=False):
-        """Docs.
+                    return_figax=False,verif=False,radius=None,
+                    product='nmep'):
+        """Plot the probability of meeting a threshold between itime
+        and ftime.
+
+        radius (float): neighbourhood radius in km. Default is the
+                        point probability.
+        product (str):  with a radius, 'nmep' (neighbourhood maximum
+                        ensemble probability) or 'nep' (neighbourhood
+                        ensemble probability).
         """
-        pc_arr = self.ensemble.get_prob_threshold(vrbl,overunder,threshold,
-                    itime=itime,level=level,Nlim=Nlim,Elim=Elim,
-                    Slim=Slim,Wlim=Wlim,dom=dom,ftime=ftime)
+        if radius is None:
+            pc_arr = self.ensemble.get_prob_threshold(vrbl,overunder,threshold,
+                        itime=itime,level=level,Nlim=Nlim,Elim=Elim,
+                        Slim=Slim,Wlim=Wlim,dom=dom,ftime=ftime)
+        else:
+            if product not in ('nep','nmep'):
+                raise Exception("Pick nep or nmep for neighbourhood product.")
+            window = (itime,ftime) if ftime else itime
+            P = self.ensemble.probabilities(vrbl,(threshold,),(window,),
+                        overunder=overunder,level=level,Nlim=Nlim,Elim=Elim,
+                        Slim=Slim,Wlim=Wlim,dom=dom,radii=(radius,))
+            if Nlim:
+                P = P[0]
+            pc_arr = getattr(P,product)()[0,0,0,0,:,:]
         if verif is not False:
             obsdata = verif.return_array(ftime,accum_hr=accum_hr)
+            cont2 = dict(cont2_data=obsdata,cont2_clvs=[threshold,],
+                        cont2_lats=verif.lats,cont2_lons=verif.lons)
+        else:
+            cont2 = {}
 
         ff = self.plot2D('probs',data=pc_arr,outdir=outdir,fname=fname,
                         match_nc=self.ensemble.arbitrary_pick(give_path=True),
-                        return_figax=return_figax,cont2_data=obsdata,
-                        cont2_clvs=[threshold,],cont2_lats=verif.lats,
-                        cont2_lons=verif.lons)
+                        return_figax=return_figax,**cont2)
 
         return ff
 
@@ -1067,58 +1118,20 @@ class WRFEnviron(object):
                             dom=1,clvs=False,fig=False,ax=False,cb=True,accum_hr=False):
         """
         Create threshold contour plots.
-        """
-        enssize = len(ensemble)
-        self.ensemble = ensemble # Dictionary
-        nens = 0
-        for ens in self.ensemble:
-            print(("Computing for ensemble member {0}.".format(ens)))
-            # pdb.set_trace()
-            if self.ensemble[ens]['control']:
-                continue
-
-            nens += 1.0
-
-            self.ensemble[ens]['data'] = WRFOut(self.ensemble[ens]['path'])
-            if nens==1:
-                examplewrf = self.ensemble[ens]['data']
-            tidx = self.ensemble[ens]['data'].return_tidx_range(itime,ftime)
-            ens_data = self.ensemble[ens]['data'].get(vrbl,utc=tidx,level=level,
-                                                lons=False,lats=False)
-            for n in range(ens_data.shape[0]):
-                if isinstance(smooth,str):
-                    if smooth == 'maxfilter':
-                        ens_data[n,0,:,:] = stats.max_filter(ens_data[n,0,:,:],size=11)
-            if nens == 1:
-                w,x,y,z = ens_data.shape
-                all_ens_data = N.zeros((enssize,w,x,y,z))
-                del w,x,y,z
-            all_ens_data[nens-1,...] = ens_data
-
-        if overunder == 'over':
-            # True/False if member meets condition
-            bool_arr = N.where(all_ens_data > threshold,1,0)
-            # Find maximum for all times
-            max_arr = N.amax(bool_arr,axis=1)
-            # Count members that exceed the threshold
-            # And convert to percentage
-            count_arr = N.sum(max_arr,axis=0)
-            percent_arr = 100*(count_arr/nens)
-
-        elif overunder == 'under':
-            # True/False if member meets condition
-            bool_arr = N.where(all_ens_data < threshold,1,0)
-            # Find maximum for all times
-            max_arr = N.amin(bool_arr,axis=1)
-            # Count members that exceed the threshold
-            # And convert to percentage
-            count_arr = N.sum(max_arr,axis=0)
-            percent_arr = 100*(count_arr/nens)
 
+        Probabilities stream over members (see Ensemble.probabilities).
+        smooth='maxfilter' takes each member's maximum within 5.5 grid
+        lengths, as stats.max_filter with its default size.
+        """
+        examplewrf = self.ensemble.arbitrary_pick(dataobj=True)
+        if smooth == 'maxfilter':
+            P = self.ensemble.probabilities(vrbl,(threshold,),((itime,ftime),),
+                        overunder=overunder,level=level,dom=dom,
+                        radii=(5.5*examplewrf.dx/1000.0,))
+            output = P.nmep()[0,0,0,0,:,:]
         else:
-            raise Exception("Pick over or under for threshold comparison.")
-
-        output = percent_arr[0,:,:]
+            output = self.ensemble.get_prob_threshold(vrbl,overunder,threshold,
+                        level=level,itime=itime,ftime=ftime,dom=dom)
 
         # fname = self.create_fname(vrbl,utc,level,f_suffix=f_suffix, f_prefix=f_prefix,other=other)
         F = BirdsEye(examplewrf,fig=fig,ax=ax)
@@ -1349,7 +1362,7 @@ class WRFEnviron(object):
         # C.click_x_y()
         # Here, it is the end of the cross-section
         lon_env, lat_env = C.bmap(C.x1, C.y1, inverse=True)
-        y_env,x_env,exactlat,exactlon = utils.getXY(self.W.lats1D,self.W.lons1D,lat_env,lon_env)
+        y_env,x_env = self.W.get_latlon_idx(lat_env,lon_env)
         # Create the cross-section object
         X = CrossSection(self.W,lat0,lon0,lat1,lon1)
 
@@ -1647,7 +1660,8 @@ class WRFEnviron(object):
         :param utc:         one date/time. The tuple/list format is
                             YYYY,MM,DD,HH,MM,SS (ready for calendar.timegm).
                             Integer format is epoch/datenum (ready for
-                            time.gmtime).
+                            time.gmtime). A list of datetime.datetime
+                            computes all times in one pass and plots each.
         :type utc:          tuple,list,int
         :param level:       required level.
                             Lowest model level is integer 2000.
@@ -1708,7 +1722,22 @@ class WRFEnviron(object):
             MATCH = WRFOut(match_nc)
             Nlim, Elim, Slim, Wlim = MATCH.get_limits()
 
+        if isinstance(utc,list) and isinstance(utc[0],datetime.datetime):
+            # Many times: compute in one pass, then plot each
+            lv = '2000hPa' if level == 2000 else level
+            allfront = self.W.get('frontogenesis',utc=self.W.get_time_idx(utc),
+                                    level=lv)[:,0,...]
+            for t,Front in zip(utc,allfront):
+                self.plot_frontogenesis(Front,t,level,outdir,Nlim,Elim,Slim,
+                                    Wlim,smooth,clvs,cmap,fig,ax,cb)
+            return
+
         Front = self.W.compute_frontogenesis(utc,level)
+        self.plot_frontogenesis(Front,utc,level,outdir,Nlim,Elim,Slim,Wlim,
+                                    smooth,clvs,cmap,fig,ax,cb)
+
+    def plot_frontogenesis(self,Front,utc,level,outdir,Nlim,Elim,Slim,Wlim,
+                                smooth,clvs,cmap,fig,ax,cb):
         if isinstance(Front,N.ndarray):
             if Nlim:
                 data,lats,lons = utils.return_subdomain(Front,self.W.lats1D,self.W.lons1D,
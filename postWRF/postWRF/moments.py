@@ -0,0 +1,291 @@
+"""Ensemble statistics accumulated one member at a time.
+
+Mean and variance are updated with Welford's algorithm, so memory
+depends on the size of one member, not on the number of members.
+Partial results (e.g. from worker processes, each given some of the
+members) are combined with the parallel formulae of Chan et al. (1979).
+Sums are accumulated in double precision.
+
+Exceedance counts, for many thresholds and time windows at once, the
+members meeting each threshold, for probabilities. Neighbourhood does
+the same within circles of several radii around each grid point, for
+neighbourhood ensemble probabilities (Schwartz and Sobash 2017, MWR).
+"""
+
+import numpy as N
+import scipy.fft
+
+class Moments(object):
+    def __init__(self,thresholds=()):
+        """Running count, mean, variance, minimum and maximum, and
+        number of members exceeding each threshold.
+
+        Args:
+            thresholds (list,tuple): values for which to count the
+                members exceeding them (see above()).
+        """
+        self.thresholds = tuple(thresholds)
+        self.n = 0
+        self.mean = None
+        self.M2 = None
+        self.min = None
+        self.max = None
+        self.counts = None
+
+    def add(self,data):
+        """Add one member.
+        """
+        data = N.ma.getdata(data)
+        if self.n == 0:
+            self.n = 1
+            self.mean = data.astype(N.float64)
+            self.M2 = N.zeros(data.shape)
+            self.min = data.copy()
+            self.max = data.copy()
+            self.counts = N.zeros((len(self.thresholds),)+data.shape,
+                                    dtype=N.int32)
+        else:
+            self.n += 1
+            delta = data - self.mean
+            self.mean += delta/self.n
+            # (data-old mean)*(data-new mean), in place
+            N.square(delta,out=delta)
+            delta *= (self.n-1)/self.n
+            self.M2 += delta
+            N.minimum(self.min,data,out=self.min)
+            N.maximum(self.max,data,out=self.max)
+        for n,th in enumerate(self.thresholds):
+            self.counts[n] += data > th
+        return self
+
+    def merge(self,other):
+        """Combine with the statistics of other members.
+        """
+        if other.thresholds != self.thresholds:
+            raise Exception("Thresholds of both sets of statistics must match.")
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n = other.n
+            self.mean = other.mean.copy()
+            self.M2 = other.M2.copy()
+            self.min = other.min.copy()
+            self.max = other.max.copy()
+            self.counts = other.counts.copy()
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.M2 += other.M2 + delta**2*(self.n*other.n/n)
+        self.mean += delta*(other.n/n)
+        self.n = n
+        N.minimum(self.min,other.min,out=self.min)
+        N.maximum(self.max,other.max,out=self.max)
+        self.counts += other.counts
+        return self
+
+    @property
+    def sum(self):
+        return self.mean*self.n
+
+    def variance(self,ddof=0):
+        """Variance, with divisor n - ddof (default is the population
+        variance, as N.var).
+        """
+        return self.M2/(self.n-ddof)
+
+    def std(self,ddof=0):
+        return N.sqrt(self.variance(ddof))
+
+    def above(self,threshold):
+        """Number of members exceeding threshold.
+        """
+        return self.counts[self.thresholds.index(threshold)]
+
+class Exceedance(object):
+    def __init__(self,thresholds,windows=(slice(None),),overunder='over'):
+        """Number of members meeting each threshold in each time window.
+
+        Args:
+            thresholds (list,tuple): values for 'over' and 'under', or
+                (low, high) pairs for 'between'.
+            windows (list,tuple): slices (or arrays of indices) of the
+                time axis of each member's data. Default is all times.
+            overunder (str): 'over' counts members exceeding the
+                threshold at any time in the window; 'under' those below
+                it at every time; 'between' those with low <= value < high
+                at any time.
+        """
+        if overunder not in ('over','under','between'):
+            raise Exception("Pick over, under or between for threshold comparison.")
+        self.thresholds = tuple(thresholds)
+        self.windows = tuple(windows)
+        self.overunder = overunder
+        self.n = 0
+        self.counts = None
+
+    def met(self,data):
+        """Where one member meets each threshold in each window.
+
+        Yields:
+            Index of threshold, index of window, and boolean array
+            with dimensions (level, lat, lon).
+        """
+        for w,sl in enumerate(self.windows):
+            wdata = data[sl]
+            if self.overunder == 'between':
+                for n,(lo,hi) in enumerate(self.thresholds):
+                    yield n, w, ((wdata >= lo) & (wdata < hi)).any(axis=0)
+            else:
+                # Over at any time, or under at every time, depends only
+                # on the maximum, so all thresholds share one reduction
+                wmax = wdata.max(axis=0)
+                for n,th in enumerate(self.thresholds):
+                    if self.overunder == 'over':
+                        yield n, w, wmax > th
+                    else:
+                        yield n, w, wmax < th
+
+    def add(self,data):
+        """Add one member, with time on the first axis.
+        """
+        data = N.ma.getdata(data)
+        if self.counts is None:
+            self.counts = N.zeros((len(self.thresholds),len(self.windows))+
+                                    data.shape[1:],dtype=N.int32)
+        for n,w,met in self.met(data):
+            self.counts[n,w] += met
+        self.n += 1
+        return self
+
+    def merge(self,other):
+        """Combine with the counts of other members.
+        """
+        if ((other.thresholds,other.overunder,len(other.windows)) !=
+                    (self.thresholds,self.overunder,len(self.windows))):
+            raise Exception("Thresholds and windows of both counts must match.")
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.counts = other.counts.copy()
+        else:
+            self.counts += other.counts
+        self.n += other.n
+        return self
+
+    def probability(self):
+        """Percentage of members meeting each threshold, with dimensions
+        (threshold, window, level, lat, lon).
+        """
+        return 100*(self.counts/self.n)
+
+def disk(radius):
+    """Footprint of the points within radius (in grid lengths) of the
+    centre point.
+    """
+    r = int(radius)
+    y, x = N.ogrid[-r:r+1,-r:r+1]
+    return (x**2 + y**2 <= radius**2).astype(N.float32)
+
+class CircularFilter(object):
+    def __init__(self,shape,radii):
+        """Number of points within each radius of every grid point,
+        by FFT convolution with a disk. A field is transformed once for
+        all radii. Points beyond the edge of the grid count as zero.
+
+        Args:
+            shape (tuple): (lat, lon) size of the grid.
+            radii (list,tuple): radii in grid lengths.
+        """
+        self.shape = tuple(shape)
+        self.radii = tuple(radii)
+        R = int(max(self.radii))
+        # Padded so the convolution doesn't wrap around
+        self.fshape = tuple(scipy.fft.next_fast_len(n+2*R,real=True)
+                                for n in self.shape)
+        self.kernels = [scipy.fft.rfft2(disk(r),s=self.fshape)
+                                for r in self.radii]
+        self.npoints = self.apply(N.ones(self.shape,dtype=N.float32))
+
+    def apply(self,field):
+        """Counts (or sums) of field (..., lat, lon) within each radius.
+
+        Returns:
+            List with an array the shape of field for each radius.
+        """
+        ny, nx = self.shape
+        F = scipy.fft.rfft2(N.asarray(field,dtype=N.float32),s=self.fshape)
+        out = []
+        for r,K in zip(self.radii,self.kernels):
+            r = int(r)
+            conv = scipy.fft.irfft2(F*K,s=self.fshape)[...,r:r+ny,r:r+nx]
+            # Single precision is exact once rounded for binary fields
+            out.append(N.rint(conv))
+        return out
+
+class Neighbourhood(Exceedance):
+    def __init__(self,thresholds,radii,windows=(slice(None),),
+                    overunder='over'):
+        """Neighbourhood probabilities for each threshold, radius and
+        time window, from each member's binary field (see Exceedance).
+
+        Two products are accumulated:
+            * nep: neighbourhood ensemble probability, the mean over
+              members of the fraction of points within the radius where
+              the member meets the threshold.
+            * nmep: neighbourhood maximum ensemble probability, the
+              fraction of members meeting the threshold anywhere within
+              the radius.
+
+        Args:
+            radii (list,tuple): radii in grid lengths. Zero gives the
+                point probability.
+        """
+        super(Neighbourhood,self).__init__(thresholds,windows,overunder)
+        self.radii = tuple(radii)
+        self.filter = None
+        self.fractions = None
+
+    def add(self,data):
+        """Add one member, with time on the first axis.
+        """
+        data = N.ma.getdata(data)
+        if self.counts is None:
+            shape = (len(self.thresholds),len(self.windows),
+                        len(self.radii)) + data.shape[1:]
+            self.counts = N.zeros(shape,dtype=N.int32)
+            self.fractions = N.zeros(shape,dtype=N.float32)
+        if (self.filter is None) or (self.filter.shape != data.shape[-2:]):
+            self.filter = CircularFilter(data.shape[-2:],self.radii)
+        for n,w,met in self.met(data):
+            for r,c in enumerate(self.filter.apply(met)):
+                self.counts[n,w,r] += c > 0
+                self.fractions[n,w,r] += c/self.filter.npoints[r]
+        self.n += 1
+        return self
+
+    def merge(self,other):
+        """Combine with the probabilities of other members.
+        """
+        if other.radii != self.radii:
+            raise Exception("Radii of both sets of probabilities must match.")
+        fractions = self.fractions
+        super(Neighbourhood,self).merge(other)
+        if other.n == 0:
+            pass
+        elif fractions is None:
+            self.fractions = other.fractions.copy()
+        else:
+            self.fractions += other.fractions
+        return self
+
+    def nep(self):
+        """Neighbourhood ensemble probability (%), with dimensions
+        (threshold, window, radius, level, lat, lon).
+        """
+        return 100*(self.fractions/self.n)
+
+    def nmep(self):
+        """Neighbourhood maximum ensemble probability (%), with
+        dimensions (threshold, window, radius, level, lat, lon).
+        """
+        return self.probability()
@@ -1,3 +1,5 @@
+import functools
+
 from netCDF4 import Dataset
 
 from WEM.postWRF.postWRF.datafile import DataFile
@@ -6,7 +8,19 @@ class NC(DataFile):
     def __init__(self,fpath):
         """Generic netCDF import.
 
-        Subclass of generic DataFile class.
+        Subclass of generic DataFile class. The file is opened on first
+        access to self.nc, not here.
         """
         super().__init__(fpath)
-        self.nc = Dataset(fpath,'r')
+
+    @functools.cached_property
+    def nc(self):
+        return Dataset(self.fpath,'r')
+
+    def close(self):
+        """Close the netCDF file if it is open. It is reopened on the
+        next access to self.nc.
+        """
+        nc = self.__dict__.pop('nc',None)
+        if nc is not None:
+            nc.close()
@@ -532,10 +532,18 @@ class StageIV(GribFile):
         return self.load_accum(G)
 
     def return_point(self,utc,lat,lon,accum_hr='01h'):
-        lats, lons = self.return_latlon(None)
-        latidx,lonidx = utils.get_latlon_idx(lats,lons,lat,lon)
+        """Value at the grid point closest to lat/lon. If lat and lon
+        are arrays, return an array of values at each location.
+        """
+        if not hasattr(self,'gridindex'):
+            # All files share one grid; index it once
+            lats, lons = self.return_latlon(None)
+            self.gridindex = utils.GridIndex.for_grid(lats,lons)
+        latidx,lonidx = self.gridindex.nearest(lat,lon)
         arr = self.return_array(utc,accum_hr=accum_hr)
         # pdb.set_trace()
+        if N.ndim(lat) == 0:
+            return arr[latidx[0],lonidx[0]]
         return arr[latidx,lonidx]
 
 
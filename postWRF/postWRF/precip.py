@@ -0,0 +1,59 @@
+"""Accumulated precipitation from WRF's cumulative fields.
+
+WRF writes precipitation accumulated since the start of the simulation.
+Totals over any window are therefore differences of one cumulative
+series, which is read once (see WRFOut.cumulative_precip and
+Ensemble.accumulated_windows) and differenced here for every window.
+"""
+
+import numpy as N
+
+# Cumulative fields (mm) summed for each type of precipitation.
+# Note that RAINNC already includes snow and graupel.
+PRECIP_FIELDS = {'total':('RAINNC','RAINC'),
+                 'rainnc':('RAINNC',),
+                 'snow':('SNOWNC',),
+                 'graupel':('GRAUPELNC',),
+                 }
+
+# Bucket counters for the fields above, if bucket_mm is set in WRF
+BUCKET_FIELDS = {'RAINNC':'I_RAINNC','RAINC':'I_RAINC'}
+
+def window_key(hours):
+    """Name of an accumulation window as used by StageIV,
+    e.g. 1 -> '01h', 24 -> '24h'. Strings are returned unchanged.
+    """
+    if isinstance(hours,str):
+        return hours
+    return '{0:02d}h'.format(int(hours))
+
+def window_hours(window):
+    """Inverse of window_key: '06h' -> 6.
+    """
+    if isinstance(window,str):
+        return int(window.rstrip('h'))
+    return window
+
+def rolling_accum(cumul,times,window):
+    """Totals over a window ending at each time.
+
+    Args:
+        cumul (N.ndarray): cumulative field, time on the first axis.
+        times (N.ndarray): datetime64 times of the first axis, ascending.
+        window (int,str): length of window in hours, or a name like '06h'.
+
+    Returns:
+        Array the same shape as cumul. Times with no output exactly one
+        window earlier are NaN.
+    """
+    times = N.asarray(times,dtype='datetime64[s]')
+    start = times - N.timedelta64(int(window_hours(window)*3600),'s')
+    idx = N.searchsorted(times,start)
+    valid = idx < len(times)
+    valid[valid] = times[idx[valid]] == start[valid]
+
+    accum = N.full(cumul.shape,N.nan)
+    accum[valid] = cumul[valid] - cumul[idx[valid]]
+    # Small negatives from rounding in the model output
+    valid = valid.reshape((-1,)+(1,)*(cumul.ndim-1))
+    return N.maximum(accum,0.0,where=valid,out=accum)
@@ -9,6 +9,7 @@ from mpl_toolkits.basemap import Basemap
 import time
 import glob
 import calendar 
+import collections
 
 import sys
 #sys.path.append('/home/jrlawson/gitprojects/')
@@ -17,6 +18,8 @@ from WEM.utils import metconstants as mc
 from .figure import Figure
 from .defaults import Defaults
 from .wrfout import WRFOut
+from . import interp
+from .cache import ArrayCache
 
 """
 RUC/RAP data will probably need to be cut down to fit the WRF domain
@@ -40,6 +43,9 @@ class RUC(WRFOut):
         # import pdb; pdb.set_trace()
         self.nc = Dataset(self.fpath)
         self.fields = [v for v in self.nc.variables]
+        self.cache = ArrayCache()
+        self.vweights = collections.OrderedDict()
+        self.vweights_max = 8
 
         self.timekey = 'dummy'
         self.lvkey = 'lv_ISBL'
@@ -513,18 +519,16 @@ class RUC(WRFOut):
         # Duck-typing for the win
 
         if vrbl=='pressure':
-            dshape = self.get('U',utc=tidx,lons=lonidx,lats=latidx)[0,:,:,:].shape
-            dataout = N.ones([nlv,dshape[-2],dshape[-1]])*hPa
+            dshape = self.get('U',utc=tidx,lons=lonidx,lats=latidx).shape
+            dataout = N.ones([dshape[0],nlv,dshape[-2],dshape[-1]])
+            dataout *= N.reshape(hPa,(1,nlv,1,1))
         else:
-            levels = 100*self.levels.flatten()
-            datain = self.get(vrbl,utc=tidx,lons=lonidx,lats=latidx)[0,:,:,:]
-            dataout = N.zeros([nlv,datain.shape[-2],datain.shape[-1]])
-            for (i,j), p in N.ndenumerate(dataout[0,:,:]):
-                # dataout[:,i,j] = N.interp(hPa,levels,datain[:,i,j])
-                dataout[:,i,j] = N.interp(hPa,levels,datain[:,i,j][::-1])
-        # pdb.set_trace()
-        # data = N.expand_dims(dataout,axis=0)
-        # import pdb; pdb.set_trace()
+            datain = self.get(vrbl,utc=tidx,lons=lonidx,lats=latidx)
+            # Data is flipped on load to match WRF, so flip levels too
+            levels = 100*self.levels.flatten()[::-1]
+            P = N.broadcast_to(levels[N.newaxis,:,N.newaxis,N.newaxis],
+                                datain.shape)
+            dataout = interp.interp_columns(datain,P,hPa)
         return dataout
 
     def get_key(self,vrbl):
@@ -585,8 +589,8 @@ class RUC(WRFOut):
     def compute_theta(self,tidx,lvidx,lonidx,latidx,other):
         """Override due to lack of "T" in RUC.
         """
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx)
-        T = self.get('drybulb',tidx,lvidx,lonidx,latidx)
+        P = self.get('pressure',tidx,lvidx,latidx,lonidx)
+        T = self.get('drybulb',tidx,lvidx,latidx,lonidx)
         theta = T*((P/100000.0)**(-mc.R/mc.cp))
         # pdb.set_trace()
         return theta
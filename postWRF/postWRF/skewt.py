@@ -71,14 +71,15 @@ class Profile(Figure):
         lat, lon = plot_latlon
         datestr = utils.string_from_time('output',plot_time)
         t_idx = W.get_time_idx(plot_time,)
-        y, x, exact_lat, exact_lon = utils.getXY(W.lats1D,W.lons1D,lat,lon)
-        slices = {'t': t_idx, 'la': y, 'lo': x}
+        # Members share a grid, so this index is built once
+        y, x = W.get_latlon_idx(lat,lon)
+        slices = {'utc': t_idx, 'lats': y, 'lons': x}
         #var_slices = {'t': t_idx, 'lv':0, 'la':y, 'lo':x}
 
         # Initialise array
         # Number of levels and ensembles:
         nPlevs = W.z_dim
-        data = W.get(va,slices)
+        data = W.get(va,**slices)
         nvarlevs = data.shape[1]
         nens = len(wrfouts)
 
@@ -96,12 +97,12 @@ class Profile(Figure):
             W = WRFOut(wrfout)
 
             # Get pressure levels
-            composite_P[:,n] = W.get('pressure',slices)[0,:,0,0]
+            composite_P[:,n] = W.get('pressure',**slices)[0,:,0,0]
             #elev = self.W.get('HGT',H_slices)
 
             #pdb.set_trace()
             # Grab variable
-            profile_arr[:,n] = W.get(va,slices)[0,:,0,0]
+            profile_arr[:,n] = W.get(va,**slices)[0,:,0,0]
 
             # Plot variable on graph
             self.ax.plot(profile_arr[:,n],composite_P[:,n],color=colourlist[n])
@@ -194,7 +195,7 @@ class SkewT(Figure):
         prof_lat, prof_lon = plot_latlon
         datestr = utils.string_from_time('output',plot_time)
         t_idx = self.W.get_time_idx(plot_time)
-        y,x, exact_lat, exact_lon = utils.getXY(self.W.lats1D,self.W.lons1D,prof_lat,prof_lon)
+        y, x = self.W.get_latlon_idx(prof_lat,prof_lon)
 
 
         # Create figure
@@ -28,11 +28,14 @@ def std(ncfiles,vrbl,utc=False,level=False,other=False,axis=0):
 
         if n==0:
             dims = [len(ncfiles),] + list(vrbl_array.shape)
-            all_members = N.zeros(dims)
+            all_members = N.zeros(dims,dtype=vrbl_array.dtype)
         all_members[n,...] = vrbl_array[...]
         # import pdb; pdb.set_trace()
 
-    std = N.std(all_members,axis=axis)
+    # Sum in double precision, without a double-precision copy
+    mean = N.mean(all_members,axis=axis,dtype=N.float64,keepdims=True)
+    std = N.sqrt(N.mean((all_members-mean.astype(all_members.dtype))**2,
+                    axis=axis,dtype=N.float64)).astype(all_members.dtype)
     return std
 
 def std_ttest(ncfiles1,ncfiles2,vrbl,utc=False,level=False,other=False,th=0):
@@ -53,7 +56,7 @@ def std_ttest(ncfiles1,ncfiles2,vrbl,utc=False,level=False,other=False,th=0):
 
             if n==0:
                 dims = [len(ncfiles),] + list(vrbl_array.shape)
-                all_members = N.zeros(dims)
+                all_members = N.zeros(dims,dtype=vrbl_array.dtype)
             all_members[n,...] = vrbl_array[...]
             # sample[n,...] = vrbl_array[
             # import pdb; pdb.set_trace()
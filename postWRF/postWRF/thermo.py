@@ -0,0 +1,191 @@
+"""Vectorised thermodynamics and parcel theory.
+
+All functions work element-wise on numpy arrays of any shape, in SI
+units: pressure in Pa, temperature in K, water vapour mixing ratio in
+kg/kg and height in m. Formulae for the lifting condensation level and
+equivalent potential temperature are from Bolton (1980, MWR).
+
+:func:`lift_parcels` lifts a parcel from every column of 4D data
+(time, level, lat, lon) at once, one level at a time.
+"""
+
+import numpy as N
+
+from WEM.utils import metconstants as mc
+
+eps = mc.Rd/mc.Rv
+
+def theta(p,T):
+    """Potential temperature.
+    """
+    return T*(mc.P0/p)**(mc.Rd/mc.cp)
+
+def temperature(p,th):
+    """Temperature from potential temperature.
+    """
+    return th*(p/mc.P0)**(mc.Rd/mc.cp)
+
+def sat_vappres(T):
+    """Saturation vapour pressure over water (Pa).
+    """
+    return 611.2*N.exp(17.67*(T-mc.Tz)/(T-29.65))
+
+def sat_mixing_ratio(p,T):
+    """Saturation mixing ratio (kg/kg).
+    """
+    es = sat_vappres(T)
+    return eps*es/(p-es)
+
+def dewpoint(p,w):
+    """Dewpoint (K) from pressure and mixing ratio.
+    """
+    e = N.maximum(w*p/(eps+w),1e-10)
+    lne = N.log(e/611.2)
+    return mc.Tz + (243.5*lne)/(17.67-lne)
+
+def virtual_temperature(T,w):
+    """Virtual temperature, ignoring condensate.
+    """
+    return T*(w+eps)/(eps*(1+w))
+
+def lcl(p,T,Td):
+    """Temperature and pressure of the lifting condensation level.
+
+    Returns:
+        T_lcl, p_lcl
+    """
+    T_lcl = 1.0/((1.0/(Td-56.0)) + (N.log(T/Td)/800.0)) + 56.0
+    p_lcl = p*(T_lcl/T)**(mc.cp/mc.Rd)
+    return T_lcl, p_lcl
+
+def theta_e(p,T,w,T_lcl=None):
+    """Equivalent potential temperature (Bolton 1980, eq. 43).
+
+    Args:
+        p, T, w: pressure, temperature, mixing ratio.
+        T_lcl (optional): LCL temperature. Computed from p, T, w if
+            not given; equal to T for saturated air.
+    """
+    if T_lcl is None:
+        T_lcl, _ = lcl(p,T,dewpoint(p,w))
+    r = 1000.0*w
+    return (T*(mc.P0/p)**(0.2854*(1-0.00028*r)) *
+                N.exp((3.376/T_lcl - 0.00254)*r*(1+0.00081*r)))
+
+def moist_temperature(p,thetae,T_guess,niter=8):
+    """Temperature of saturated air at pressure p on the pseudo-adiabat
+    with equivalent potential temperature thetae, by Newton's method.
+
+    Args:
+        T_guess: first guess, e.g. the parcel temperature at the level
+            below.
+    """
+    T = N.array(T_guess,dtype=float)
+    dT = 0.01
+    for n in range(niter):
+        f0 = theta_e(p,T,sat_mixing_ratio(p,T),T) - thetae
+        f1 = theta_e(p,T+dT,sat_mixing_ratio(p,T+dT),T+dT) - thetae
+        T = T - N.clip(f0*dT/(f1-f0),-20.0,20.0)
+    return T
+
+def _start_parcel(p,T,w,parcel):
+    """Starting level index, pressure, temperature and mixing ratio
+    (each 3D: time, lat, lon) of surface-based ('SB'), 100 hPa mixed-layer
+    ('ML') or most-unstable in the lowest 300 hPa ('MU') parcels.
+    """
+    nt,nz,ny,nx = p.shape
+    kstart = N.zeros((nt,ny,nx),dtype=int)
+    if parcel == 'SB':
+        return kstart, p[:,0,...], T[:,0,...], w[:,0,...]
+    elif parcel == 'ML':
+        outside = p < (p[:,:1,...]-10000.0)
+        th = N.ma.array(theta(p,T),mask=outside).mean(axis=1)
+        wml = N.ma.array(w,mask=outside).mean(axis=1)
+        p0 = p[:,0,...]
+        return kstart, p0, temperature(p0,N.ma.getdata(th)), N.ma.getdata(wml)
+    elif parcel == 'MU':
+        outside = p < (p[:,:1,...]-30000.0)
+        the = N.ma.array(theta_e(p,T,w),mask=outside)
+        kstart = the.argmax(axis=1)
+        k = kstart[:,N.newaxis,...]
+        take = lambda x: N.take_along_axis(x,k,axis=1)[:,0,...]
+        return kstart, take(p), take(T), take(w)
+    else:
+        raise Exception("Parcel type must be 'SB', 'ML' or 'MU'.")
+
+def lift_parcels(p,T,w,z,parcel='SB'):
+    """Lift a parcel in every column and integrate its buoyancy.
+
+    All columns are lifted together, one level at a time: dry
+    adiabatically to the LCL, then along the pseudo-adiabat. Buoyancy
+    uses virtual temperature. Layers where buoyancy changes sign are
+    split at the zero crossing.
+
+    Args:
+        p, T, w, z (N.ndarray): 4D (time, level, lat, lon) pressure,
+            temperature, mixing ratio and height above ground.
+        parcel (str): 'SB', 'ML' or 'MU'.
+
+    Returns:
+        CAPE, CIN (J/kg), LCL and LFC height above ground (m) as
+        3D arrays (time, lat, lon). CIN is zero and LFC is NaN where
+        the parcel has no level of free convection.
+    """
+    p, T, w, z = [N.ma.getdata(x).astype(float) for x in (p,T,w,z)]
+    nt,nz,ny,nx = p.shape
+    kstart, p0, T0, w0 = _start_parcel(p,T,w,parcel)
+
+    T_lcl, p_lcl = lcl(p0,T0,dewpoint(p0,w0))
+    th0 = theta(p0,T0)
+    the0 = theta_e(p0,T0,w0,T_lcl)
+
+    cape = N.zeros((nt,ny,nx))
+    cin = N.zeros((nt,ny,nx))
+    z0 = N.take_along_axis(z,kstart[:,N.newaxis,...],axis=1)[:,0,...]
+    zlcl = z0.copy()
+    lfc = N.full((nt,ny,nx),N.nan)
+    found = N.zeros((nt,ny,nx),dtype=bool)
+
+    Tp = T_lcl.copy()
+    B1 = None
+    for k in range(nz):
+        pk = p[:,k,...]
+        moist = pk < p_lcl
+        # Newton's method only where the parcel is saturated
+        Tk = temperature(pk,th0)
+        Tk[moist] = moist_temperature(pk[moist],the0[moist],Tp[moist])
+        Tp = Tk
+        wp = N.where(moist,sat_mixing_ratio(pk,Tp),w0)
+        Tve = virtual_temperature(T[:,k,...],w[:,k,...])
+        B2 = mc.g*(virtual_temperature(Tp,wp)-Tve)/Tve
+        active = k > kstart
+
+        if k > 0:
+            # Height of the LCL, interpolated in log-pressure
+            pkm = p[:,k-1,...]
+            cross = active & (pkm >= p_lcl) & moist
+            r = N.log(pkm/p_lcl)/N.log(pkm/pk)
+            zlcl = N.where(cross,z[:,k-1,...]+r*(z[:,k,...]-z[:,k-1,...]),zlcl)
+
+            dz = z[:,k,...] - z[:,k-1,...]
+            with N.errstate(divide='ignore',invalid='ignore'):
+                r = N.where(B1*B2 < 0,B1/(B1-B2),0.0)
+            # Positive and negative areas of the layer
+            pos = N.where((B1 >= 0) & (B2 >= 0),0.5*(B1+B2)*dz,
+                    N.where(B1 > 0,0.5*B1*r*dz,
+                    N.where(B2 > 0,0.5*B2*(1-r)*dz,0.0)))
+            neg = 0.5*(B1+B2)*dz - pos
+
+            # First layer above the LCL where the parcel becomes buoyant
+            newlfc = active & ~found & moist & (B2 > 0)
+            zc = N.where(B1 < 0,z[:,k-1,...]+r*dz,z[:,k-1,...])
+            lfc = N.where(newlfc,N.maximum(zc,zlcl),lfc)
+
+            cin = N.where(active & ~found,cin+neg,cin)
+            found = found | newlfc
+            cape = N.where(active & found,cape+pos,cape)
+        B1 = B2
+
+    cin = N.where(found,cin,0.0)
+    cape = N.where(found,cape,0.0)
+    return cape, cin, zlcl, lfc
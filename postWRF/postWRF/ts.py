@@ -24,7 +24,9 @@ class TimeSeries:
             # W = self.get_netcdf(enspath,ncf=ncf,nct=nct,dom=dom)
             # W = WRFOut(enspath)
             times = W.utc
-            ts = W.get(vrbl,utc=False,lats=self.lat,lons=self.lon)[:,0,0,0]
+            # Members share a grid, so the spatial index is built once
+            latidx, lonidx = W.get_latlon_idx(self.lat,self.lon)
+            ts = W.get(vrbl,utc=None,lats=latidx,lons=lonidx)[:,0,0,0]
             if vrbl == 'T2':
                 ts -= 273.15
             # import pdb; pdb.set_trace()
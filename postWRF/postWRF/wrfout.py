@@ -12,8 +12,16 @@ import numpy as N
 import calendar
 import pdb
 from . import constants as cc
+from . import interp
+from . import thermo
+from . import precip
+from .cache import ArrayCache, MetadataCache
 import scipy.ndimage
-import collections
+import collections.abc
+import functools
+import copy
+import threading
+import concurrent.futures
 import scipy.interpolate
 import datetime
 
@@ -29,29 +37,68 @@ class WRFOut(NC):
     An instance of WRFOut contains all the methods that are used to
     access and process netCDF data.
     """
-    def __init__(self,fpath,fmt='em_real',ncks=False):
+    # Metadata for every file opened, shared by all instances
+    metacache = MetadataCache()
+
+    # Serialises reads from netCDF files, which aren't thread-safe,
+    # e.g. when iter_chunks() prefetches on a background thread
+    nclock = threading.RLock()
+
+    # Floating-point type of loaded and computed data. WRF stores most
+    # fields as float32; set WRFOut.dtype = N.float64 to change for all
+    # files, or use the dtype arguments of __init__() and get().
+    dtype = N.float32
+
+    def __init__(self,fpath,fmt='em_real',ncks=False,cache_mb=512,dtype=None):
         """
-        Initialisation fetches and computes basic user-friendly
-        variables that are most oftenly accessed.
+        Initialisation fetches basic user-friendly variables that are
+        most oftenly accessed. These come from a metadata cache keyed
+        by the file's path, modification time and size, so reopening a
+        file only costs an os.stat. The netCDF file itself, and the
+        full 2D latitude/longitude arrays, are loaded on first access.
 
         :param fpath:   absolute path to netCDF4 (wrfout) file
         :type fpath:    str
 
         ncks (bool): whether WRFOut file has been stripped to a few variables.
                         Hence check for KeyErrors for variables
+        cache_mb (int): memory cap for loaded and computed arrays that
+                        are kept for reuse by later calls to get().
+                        Zero disables the cache.
+        dtype:          floating-point type of data from this file.
+                        Default is WRFOut.dtype.
 
         """
         super().__init__(fpath)
-        
-        self.dx = self.nc.DX
-        self.dy = self.nc.DY
+        self.fmt = fmt
+        self.ncks = ncks
+        if dtype is not None:
+            self.dtype = dtype
+
+        # Column interpolation weights for vertical surfaces, reused
+        # for every variable requested on the same surface and time
+        self.vweights = collections.OrderedDict()
+        self.vweights_max = 8
+
+        # Loaded and computed fields, keyed by variable and selection
+        self.cache = ArrayCache(cache_mb)
+
+        # Number of times loaded at once by time-chunked computations
+        self.chunk_t = 6
+        # Columns per side of the spatial tiles used by lift_parcels()
+        self.tile = 128
+
+        # Raises OSError if the file doesn't exist
+        key = self.metacache.file_key(fpath)
+        meta = self.metacache.get(key)
+        if meta is None:
+            meta = self.read_metadata(fmt,ncks)
+            self.metacache.put(key,meta)
+        self.__dict__.update(meta)
 
         self.get_dimensions(fmt)
 
-        # if ncks:
-        try:
-            self.wrf_times = self.nc.variables['Times'][:]
-        except KeyError:
+        if 'wrf_times' not in meta:
             self.wrf_times = N.arange(self.t_dim)
         else:
             # Get times in nicer format
@@ -61,96 +108,103 @@ class WRFOut(NC):
             else:
                 self.dt = self.utc[1]-self.utc[0]
 
-        if (ncks is False) and (fmt is 'em_real'):
-            self.P_top = self.nc.variables['P_TOP'][0]
-
-        # Loads variable lists
-        self.fields = list(self.nc.variables.keys())
-        self.computed_fields = list(self.return_tbl().keys())
-        self.available_vrbls = self.fields + self.computed_fields
+    def read_metadata(self,fmt='em_real',ncks=False):
+        """Read everything that __init__ needs from the netCDF file.
 
-        # Now do specific loads for idealised or real runs
-        if fmt is "em_real":
-            self.em_real_init()
-
-        elif fmt is "ideal":
-            self.ideal_init()
-        elif fmt is "met_em":
-            self.ideal_init()
+        Returns:
+            Dictionary of attribute names and values, small enough to
+            store in the metadata cache.
+        """
+        meta = {}
+        meta['dims'] = {k:len(v) for k,v in self.nc.dimensions.items()}
+        meta['fields'] = list(self.nc.variables.keys())
+        meta['dx'] = self.nc.DX
+        meta['dy'] = self.nc.DY
+        if 'Times' in self.nc.variables:
+            meta['wrf_times'] = N.ma.getdata(self.nc.variables['Times'][:])
+
+        if (ncks is False) and (fmt == 'em_real'):
+            meta['P_top'] = self.nc.variables['P_TOP'][0]
+
+        if fmt == 'em_real':
+            # 1D lat/lon vectors through the middle of the domain
+            lats = self.nc.variables['XLAT'][0,...]
+            lons = self.nc.variables['XLONG'][0,...]
+            meta['lats1D'] = N.ma.getdata(lats[:,int(len(lats)/2)])
+            meta['lons1D'] = N.ma.getdata(lons[int(len(lons)/2),:])
+
+            meta['cen_lat'] = float(self.nc.CEN_LAT)
+            meta['cen_lon'] = float(self.nc.CEN_LON)
+            meta['truelat1'] = float(self.nc.TRUELAT1)
+            meta['truelat2'] = float(self.nc.TRUELAT2)
+            for attr in ('MAP_PROJ','STAND_LON'):
+                if hasattr(self.nc,attr):
+                    meta[attr.lower()] = self.nc.getncattr(attr)
+        return meta
 
     def get_dimensions(self,fmt='em_real'):
-        self.t_dim = len(self.nc.dimensions['Time'])
-        self.x_dim = len(self.nc.dimensions['west_east'])
-        self.y_dim = len(self.nc.dimensions['south_north'])
+        self.t_dim = self.dims['Time']
+        self.x_dim = self.dims['west_east']
+        self.y_dim = self.dims['south_north']
 
         self.timekey = 'Time'
         self.lonkey = 'west'
         self.latkey = 'north'
 
         if fmt == 'met_em':
-            self.z_dim = len(self.nc.dimensions['num_metgrid_levels'])
+            self.z_dim = self.dims['num_metgrid_levels']
             self.lvkey = 'num_metgrid'
         else:
-            self.z_dim = len(self.nc.dimensions['bottom_top'])
+            self.z_dim = self.dims['bottom_top']
             self.lvkey = 'bottom'
         
         return
 
-    def em_real_init(self):
-        self.lats = self.nc.variables['XLAT'][0,...] # Might fail if only one time?
-        self.lons = self.nc.variables['XLONG'][0,...]
+    @functools.cached_property
+    def lats(self):
+        return self.nc.variables['XLAT'][0,...] # Might fail if only one time?
 
-        self.lats1D = self.lats[:,int(len(self.lats)/2)]
-        self.lons1D = self.lons[int(len(self.lons)/2),:]
+    @functools.cached_property
+    def lons(self):
+        return self.nc.variables['XLONG'][0,...]
 
-        self.cen_lat = float(self.nc.CEN_LAT)
-        self.cen_lon = float(self.nc.CEN_LON)
-        self.truelat1 = float(self.nc.TRUELAT1)
-        self.truelat2 = float(self.nc.TRUELAT2)
-
-
-    def ideal_init(self):
-        pass
+    @functools.cached_property
+    def computed_fields(self):
+        return list(self.return_tbl().keys())
 
+    @functools.cached_property
+    def available_vrbls(self):
+        return self.fields + self.computed_fields
 
     def wrftime_to_datenum(self):
         """
         Convert wrf's weird Times variable to datenum time.
 
         """
-        times = self.wrf_times
-        wrf_times_epoch = N.zeros([times.shape[0]])
-
-        for n,t in enumerate(times):
-            tstr = ''.join(t.astype(str))
-
-            yr = int(tstr[0:4])
-            mth = int(tstr[5:7])
-            day = int(tstr[8:10])
-            hr = int(tstr[11:13])
-            mins = int(tstr[14:16])
-            sec = int(tstr[17:19])
-
-            wrf_times_epoch[n] = calendar.timegm([yr,mth,day,hr,mins,sec])
-
+        times = N.ascontiguousarray(self.wrf_times)
+        # Each row of characters becomes one 'YYYY-MM-DD_HH:MM:SS' string
+        tstrs = times.view('S{0}'.format(times.shape[-1])).ravel()
+        dt64 = N.char.replace(tstrs,b'_',b'T').astype('datetime64[s]')
+        wrf_times_epoch = dt64.astype(N.int64).astype(float)
         return wrf_times_epoch
 
 
     def get_time_idx(self,utc):
 
         """
-        :param utc:     time
-        :type utc:      tuple,list,int
-        :returns tidx:  int -- closest index to desired time
+        :param utc:     time(s)
+        :type utc:      tuple,list,int,datetime.datetime
+        :returns tidx:  N.ndarray -- closest index to each desired time
 
         """
         # import pdb; pdb.set_trace()
-        dn = utils.ensure_datenum(utc)
-        dns = utils.get_sequence(dn)
-        tidx = []
-        for t in dns:
-            tidx.append(utils.closest(self.utc,t))
-        return N.array(tidx)
+        if isinstance(utc,datetime.datetime) or (
+                isinstance(utc,(list,tuple)) and
+                isinstance(utc[0],datetime.datetime)):
+            dns = N.array(utc,dtype='datetime64[s]').astype(N.int64)
+        else:
+            dns = utils.ensure_datenum(utc,fmt='list')
+        return utils.closest_sorted(self.utc,N.ravel(dns))
 
 
     def check_compute(self,vrbl):
@@ -170,17 +224,30 @@ class WRFOut(NC):
 
     def return_tidx_range(self,utc0,utc1):
         """
-        Give a start and end time. Returns an array of
+        Give a start and end time. Returns a slice of
         all indices. Useful for self.get() to return an
         array of data with all times between utc0 and utc1.
         """
-        idx0 = self.get_time_idx(utc0)
-        idx1 = self.get_time_idx(utc1)
-        return N.arange(idx0,idx1)
+        idx0 = self.get_time_idx(utc0)[0]
+        idx1 = self.get_time_idx(utc1)[0]
+        return slice(int(idx0),int(idx1))
+
+    def time_indices(self,tidx):
+        """
+        Array of the time indices selected by tidx: None (all times),
+        an index, an array of indices, or a slice.
+        """
+        if tidx is None:
+            return N.arange(self.t_dim)
+        elif isinstance(tidx,slice):
+            return N.arange(self.t_dim)[tidx]
+        else:
+            return N.atleast_1d(tidx)
 
 
     def get(self,vrbl,utc=None,level=None,lats=None,lons=None,
-                smooth=1,other=False):
+                smooth=1,other=False,Nlim=None,Elim=None,Slim=None,
+                Wlim=None,dtype=None):
         """
         Get data.
 
@@ -207,8 +274,208 @@ class WRFOut(NC):
         Lons:
         * indices: integer or N.ndarray of integers
         * lons: float or N.ndarray of floats
+
+        Nlim, Elim, Slim, Wlim:
+        * bounding box (floats) of the subdomain to read from disk.
+          Use instead of lats/lons.
+
+        dtype:
+        * floating-point type of the returned data, e.g. N.float64
+          where precision matters. Default is self.dtype.
         """
+        tidx, lvidx, lonidx, latidx = self.parse_selection(utc,level,
+                                        lats,lons,Nlim,Elim,Slim,Wlim)
+
+        # Shared intermediates (e.g. pressure, theta) are only
+        # read and computed once per call tree
+        key = self.cache_key(vrbl,tidx,level,lvidx,lonidx,latidx,other)
+        data = self.cache.get(key)
+        if data is not None:
+            return self.copy_as(data,dtype)
+
+        # Check if computing required
+        # When data is loaded from nc, it is destaggered
+
+        if debug_get:
+            print(("Computing {0} for level {1} of index {2}".format(vrbl,level,lvidx)))
+
+        if self.check_compute(vrbl):
+            if debug_get:
+                print(("Variable {0} exists in dataset.".format(vrbl)))
+            if (isinstance(lvidx,str) and (vrbl in self.fields) and
+                    not any(self.lvkey in d for d in self.get_dims(vrbl))):
+                # No vertical dimension (e.g. HGT) so nothing to interpolate
+                data = self.load(vrbl,tidx,None,lonidx,latidx)
+            elif lvidx is 'isobaric':
+                data = self.get_p(vrbl,tidx,level,lonidx,latidx)
+            elif isinstance(lvidx,str) and (lvidx in ('geometric','isentropic')):
+                data = self.get_surface(vrbl,tidx,level,lvidx,lonidx,latidx)
+            elif isinstance(lvidx,(tuple,list,N.ndarray,int,type(None))):
+                data = self.load(vrbl,tidx,lvidx,lonidx,latidx)
+            else:
+                raise Exception
+        else:
+            if debug_get:
+                print(("Variable {0} needs to be computed.".format(vrbl)))
+            if isinstance(lvidx,str):
+                # Pressure, height or isentropic level. Fields are
+                # interpolated when they are loaded.
+                data = self.compute(vrbl,tidx,level,lonidx,latidx,other)
+            else:
+                data = self.compute(vrbl,tidx,lvidx,lonidx,latidx,other)
+
+        # if len(data.shape) == 2:
+            # data = data[N.newaxis,N.newaxis,:,:]
+        # elif len(data.shape) == 3:
+            # data = data[N.newaxis,:,:,:]
+        # if len(data.shape) == 3:
+            # data = N.expand_dims(data,axis=0)
         # import pdb; pdb.set_trace()
+        data = self.cast(self.make_4D(data,vrbl=vrbl))
+        self.cache.put(key,data)
+
+        return self.copy_as(data,dtype)
+
+    def cast(self,data,dtype=None):
+        """
+        Convert floating-point data to dtype (default self.dtype).
+        Other data, and data already of that type, are returned as is.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        if N.issubdtype(data.dtype,N.floating):
+            return data.astype(dtype,copy=False)
+        return data
+
+    def copy_as(self,data,dtype=None):
+        """
+        Copy of data (e.g. from the cache), converted to dtype.
+        """
+        out = self.cast(data,dtype)
+        if out is data:
+            out = data.copy()
+        return out
+
+    def get_many(self,vrbls,utc=None,level=None,lats=None,lons=None,
+                    other=False,Nlim=None,Elim=None,Slim=None,Wlim=None,
+                    dtype=None):
+        """
+        Get several variables for the same time, level and lat/lon
+        selection.
+
+        The selection is parsed once. The fields needed by all requested
+        variables (see resolve_deps) are read from the file once each,
+        then shared through the cache by every computation.
+
+        :param vrbls:       WRF or computed variables required
+        :type vrbls:        list,tuple
+
+        Other arguments are as for get().
+
+        :returns:           dict -- 4D array for each variable
+        """
+        tidx, lvidx, lonidx, latidx = self.parse_selection(utc,level,
+                                        lats,lons,Nlim,Elim,Slim,Wlim)
+        # Pass on indices, so the selection isn't parsed again
+        if not isinstance(lvidx,str):
+            level = lvidx
+
+        fields, computed = self.resolve_deps(vrbls)
+        for vrbl in fields:
+            key = self.cache_key(vrbl,tidx,level,lvidx,lonidx,latidx,False)
+            if key not in self.cache:
+                self.get(vrbl,utc=tidx,level=level,lats=latidx,lons=lonidx)
+
+        data = {}
+        for vrbl in vrbls:
+            data[vrbl] = self.get(vrbl,utc=tidx,level=level,lats=latidx,
+                                    lons=lonidx,other=other,dtype=dtype)
+        return data
+
+    def iter_chunks(self,vrbls,chunk_t=6,level=None,bbox=None,utc=None,
+                        lats=None,lons=None,other=False,prefetch=False):
+        """
+        Generator that walks through the file a block of times at a time.
+
+        Each block is fetched with its own short-lived cache (see
+        get_chunk), so memory use depends on chunk_t and the size of
+        the domain, not on the number of times in the file.
+
+        :param vrbls:       WRF or computed variable(s)
+        :type vrbls:        str,list,tuple
+        :param chunk_t:     number of times in each block
+        :type chunk_t:      int
+        :param level:       as for get()
+        :param bbox:        bounding box with keys Nlim, Elim, Slim, Wlim
+        :type bbox:         dict
+        :param utc:         time indices to walk through. Default is all.
+        :type utc:          N.ndarray,list,slice
+        :param prefetch:    if True, fetch the next block on a background
+                            thread while the current one is used.
+        :type prefetch:     bool
+
+        Other arguments are as for get().
+
+        :returns:           generator of (time indices, data) tuples,
+                            where data is a 4D array if vrbls is a string,
+                            else a dict of 4D arrays.
+        """
+        tidxs = self.time_indices(utc)
+        blocks = [tidxs[n:n+chunk_t] for n in range(0,len(tidxs),chunk_t)]
+        kwargs = dict(level=level,bbox=bbox,lats=lats,lons=lons,other=other)
+
+        # Open the file now, so that block workers share one handle
+        self.nc
+
+        if not blocks:
+            return
+        if not prefetch:
+            for tidx in blocks:
+                yield tidx, self.get_chunk(vrbls,tidx,**kwargs)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(self.get_chunk,vrbls,blocks[0],**kwargs)
+            for n,tidx in enumerate(blocks):
+                data = future.result()
+                if n+1 < len(blocks):
+                    future = pool.submit(self.get_chunk,vrbls,blocks[n+1],
+                                            **kwargs)
+                yield tidx, data
+
+    def get_chunk(self,vrbls,tidx,level=None,bbox=None,lats=None,lons=None,
+                    other=False):
+        """
+        Fetch variable(s) for a block of times, with a cache that only
+        lives as long as the block. Used by iter_chunks() and
+        get_stations().
+
+        :returns:           4D array if vrbls is a string, else a dict
+                            of 4D arrays.
+        """
+        # A shallow copy shares the open file but not the caches
+        W = copy.copy(self)
+        W.cache = ArrayCache(self.cache.max_bytes/1024**2)
+        W.vweights = collections.OrderedDict()
+
+        if bbox is None:
+            bbox = {}
+        if isinstance(vrbls,str):
+            return W.get(vrbls,utc=tidx,level=level,lats=lats,lons=lons,
+                            other=other,**bbox)
+        else:
+            return W.get_many(vrbls,utc=tidx,level=level,lats=lats,
+                                lons=lons,other=other,**bbox)
+
+    def parse_selection(self,utc=None,level=None,lats=None,lons=None,
+                            Nlim=None,Elim=None,Slim=None,Wlim=None):
+        """
+        Convert the time, level and lat/lon arguments of get() into
+        indices (or a vertical coordinate name for interpolation).
+
+        Returns:
+            tidx, lvidx, lonidx, latidx
+        """
         # Time
 
         if utc is None:
@@ -222,7 +489,7 @@ class WRFOut(NC):
                 tidx = utc
         elif isinstance(utc,(list,tuple,int,datetime.datetime)): # and len(utc[0])==6:
             tidx = self.get_time_idx(utc)
-        elif isinstance(utc,N.ndarray): #and isinstance(utc[0],int):
+        elif isinstance(utc,(N.ndarray,slice)): #and isinstance(utc[0],int):
             tidx = utc
         else:
             print("Invalid time selection.")
@@ -249,61 +516,47 @@ class WRFOut(NC):
         if not type(lats)==type(lons):
             # What about case where all lats with one lon?
             raise Exception
-        if lats is None:
+        if (Nlim is not None) and (Nlim is not False):
+            if lats is not None:
+                raise Exception("Give either lats/lons or a bounding box.")
+            latidx, lonidx = self.get_limited_domain({'Nlim':Nlim,
+                    'Elim':Elim,'Slim':Slim,'Wlim':Wlim},return_array='slice')
+        elif lats is None:
             lonidx = None
             latidx = None
         elif isinstance(lons,(list,tuple,N.ndarray)):
-            if isinstance(lons[0],int):
+            if isinstance(lons[0],(int,N.integer)):
                 lonidx = lons
                 latidx = lats
-            elif isinstance(lons[0],float):
+            elif isinstance(lons[0],(float,N.floating)):
                 # Interpolate to lat/lon
                 lonidx = None
                 latidx = None
-        elif isinstance(lons,(int,N.int64)):
+        elif isinstance(lons,(int,N.int64,slice)):
             lonidx = lons
             latidx = lats
         elif isinstance(lons,float):
-            # Interpolate to lat/lon
-            lonidx = utils.closest(self.lons1D,lons)
-            latidx = utils.closest(self.lats1D,lats)
+            # Closest grid point to lat/lon
+            latidx, lonidx = self.get_latlon_idx(lats,lons)
         else:
             print("Invalid lat/lon selection.")
             raise Exception
-        # Check if computing required
-        # When data is loaded from nc, it is destaggered
 
-        if debug_get:
-            print(("Computing {0} for level {1} of index {2}".format(vrbl,level,lvidx)))
+        return tidx, lvidx, lonidx, latidx
 
-        if self.check_compute(vrbl):
-            if debug_get:
-                print(("Variable {0} exists in dataset.".format(vrbl)))
-            if lvidx is 'isobaric':
-                data = self.get_p(vrbl,tidx,level,lonidx,latidx)
-            elif isinstance(lvidx,(tuple,list,N.ndarray,int,type(None))):
-                data = self.load(vrbl,tidx,lvidx,lonidx,latidx)
-            else:
-                raise Exception
-        else:
-            if debug_get:
-                print(("Variable {0} needs to be computed.".format(vrbl)))
-            if lvidx is 'isobaric':
-                # data = self.get_p(vrbl,tidx,level,lonidx, latidx)[N.newaxis,N.newaxis,:,:]
-                data = self.compute(vrbl,tidx,level,lonidx,latidx,other)
-            else:
-                data = self.compute(vrbl,tidx,lvidx,lonidx,latidx,other)
-
-        # if len(data.shape) == 2:
-            # data = data[N.newaxis,N.newaxis,:,:]
-        # elif len(data.shape) == 3:
-            # data = data[N.newaxis,:,:,:]
-        # if len(data.shape) == 3:
-            # data = N.expand_dims(data,axis=0)
-        # import pdb; pdb.set_trace()
-        data = self.make_4D(data,vrbl=vrbl)
+    def cache_key(self,vrbl,tidx,level,lvidx,lonidx,latidx,other):
+        """
+        Key for the cache of loaded and computed fields.
 
-        return data
+        Index levels are keyed by lvidx, so e.g. '2000hPa' and 0
+        share an entry; pressure, height and isentropic levels by level.
+        """
+        if not isinstance(lvidx,str):
+            level = lvidx
+        key = (vrbl,self._selection_key(tidx),self._selection_key(level),
+                self._selection_key(lonidx),self._selection_key(latidx),
+                self._selection_key(other))
+        return key
 
     def load(self,vrbl,tidx,lvidx,lonidx,latidx):
         """
@@ -320,7 +573,6 @@ class WRFOut(NC):
         TODO: Get rid of integer arguments earlier in the method chain, and
         make them single-element numpy arrays.
         """
-        # import pdb; pdb.set_trace()
         # First, check dimension that is staggered (if any)
         destag_dim = self.check_destagger(vrbl)
 
@@ -329,14 +581,41 @@ class WRFOut(NC):
 
         vrbldata = self.nc.variables[vrbl]
         sl = self.create_slice(vrbl,tidx,lvidx,lonidx,latidx,dim_names)
-        # If that dimension has a slice of indices, it doesn't need staggering.
-        if destag_dim and isinstance(sl[destag_dim],N.ndarray):
-            destag_dim = None
-
-        # import pdb; pdb.set_trace()
-        data = self.destagger(vrbldata[sl],destag_dim)
-        return data
+        if destag_dim is None:
+            with self.nclock:
+                data = self.cast(vrbldata[sl])
+            return data
 
+        # Only the staggered points either side of those requested are read
+        sl[destag_dim], lo, hi = self.stagger_indices(sl[destag_dim],
+                                        vrbldata.shape[destag_dim])
+        with self.nclock:
+            data = vrbldata[sl]
+        return self.destagger(data,destag_dim,lo,hi)
+
+    def stagger_indices(self,sl,size):
+        """
+        Staggered points needed for a selection of unstaggered points.
+
+        sl      :   slice or array of indices of unstaggered points
+        size    :   number of staggered points
+
+        Returns the selection of staggered points to read, and the
+        indices (within those read) of the points either side of
+        each unstaggered point.
+        """
+        if isinstance(sl,slice):
+            start, stop, step = sl.indices(size-1)
+            if step == 1:
+                # n unstaggered points are the average of n+1 staggered points
+                return slice(start,max(start,stop)+1), slice(None,-1), slice(1,None)
+        idx = N.arange(size-1)[sl]
+        need = N.union1d(idx,idx+1)
+        lo = N.searchsorted(need,idx)
+        if need.size and (need[-1]-need[0]+1 == need.size):
+            # Contiguous points are read faster as a slice
+            need = slice(need[0],need[-1]+1)
+        return need, lo, lo+1
 
     def create_slice(self,vrbl,tidx,lvidx,lonidx,latidx,dim_names):
         """
@@ -347,43 +626,51 @@ class WRFOut(NC):
         sl = []
         # if vrbl.startswith('RAINNC'):
             # pdb.set_trace()
+        # Slices are appended in the variable's own dimension order
+        sls = {}
         if any(self.timekey in p for p in dim_names):
             if tidx is None:
-                sl.append(slice(None,None))
+                sls[self.timekey] = slice(None,None)
             elif isinstance(tidx,slice) or isinstance(tidx,N.ndarray):
-                sl.append(tidx)
+                sls[self.timekey] = tidx
             else:
-                sl.append(slice(tidx,tidx+1))
+                sls[self.timekey] = slice(tidx,tidx+1)
 
         if any(self.lvkey in p for p in dim_names):
             if lvidx is None:
-                sl.append(slice(None,None))
+                sls[self.lvkey] = slice(None,None)
             elif isinstance(lvidx,int):
-                sl.append(slice(lvidx,lvidx+1))
+                sls[self.lvkey] = slice(lvidx,lvidx+1)
             elif isinstance(lvidx,N.ndarray):
-                sl.append(lvidx)
+                sls[self.lvkey] = lvidx
             else:
-                sl.append(slice(None,None))
+                sls[self.lvkey] = slice(None,None)
 
         if any(self.lonkey in p for p in dim_names):
             if lonidx is None:
-                sl.append(slice(None,None))
+                sls[self.lonkey] = slice(None,None)
             elif isinstance(lonidx,slice) or isinstance(lonidx,N.ndarray):
-                sl.append(lonidx)
+                sls[self.lonkey] = lonidx
             elif isinstance(lonidx,(int,N.int64)):
-                sl.append(slice(lonidx,lonidx+1))
+                sls[self.lonkey] = slice(lonidx,lonidx+1)
             else:
-                sl.append(slice(None,None))
+                sls[self.lonkey] = slice(None,None)
 
         if any(self.latkey in p for p in dim_names):
             if latidx is None:
-                sl.append(slice(None,None))
+                sls[self.latkey] = slice(None,None)
             elif isinstance(latidx,slice) or isinstance(latidx,N.ndarray):
-                sl.append(latidx)
+                sls[self.latkey] = latidx
             elif isinstance(latidx,(int,N.int64)):
-                sl.append(slice(latidx,latidx+1))
+                sls[self.latkey] = slice(latidx,latidx+1)
             else:
-                sl.append(slice(None,None))
+                sls[self.latkey] = slice(None,None)
+
+        for dname in dim_names:
+            for key, dsl in sls.items():
+                if key in dname:
+                    sl.append(dsl)
+                    break
 
         return sl
 
@@ -404,47 +691,36 @@ class WRFOut(NC):
         dims = self.nc.variables[var].dimensions
         return dims
 
-    def destagger(self,data,ax):
+    def destagger(self,data,ax,lo=slice(None,-1),hi=slice(1,None)):
         """ Destagger data which needs it doing.
 
         data    :   numpy array of data requiring destaggering
         ax      :   axis requiring destaggering
+        lo, hi  :   indices on that axis of the points either side of each
+                    unstaggered point (see stagger_indices). Default is
+                    every point.
 
         Theta always has unstaggered points in all three spatial dimensions (axes=1,2,3).
 
         Data should be 4D but just the slice required to reduce unnecessary computation time.
 
-        Don't destagger in x/y for columns
-
+        The average is written straight into the output array, so no
+        temporaries the size of the staggered data are made.
         """
-        # Check for dimensions of 1.
-        # If it exists, don't destagger it.
-
-        shp = data.shape
-        for n,size in enumerate(shp):
-            if (size==1) and (n==ax):
-                ax = None
-                break
-
-        #pdb.set_trace()
-
-        if ax==None:
-            return data
-        else:
-            nd = data.ndim
-            sl0 = []     # Slices to take place on staggered axis
-            sl1 = []
-
-            for n in range(nd):
-                if n is not ax:
-                    sl0.append(slice(None))
-                    sl1.append(slice(None))
-                else:
-                    sl0.append(slice(None,-1))
-                    sl1.append(slice(1,None))
+        if ax is None:
+            return self.cast(data)
 
-            data_unstag = 0.5*(data[sl0] + data[sl1])
-            return data_unstag
+        sl0 = [slice(None),]*data.ndim
+        sl1 = [slice(None),]*data.ndim
+        sl0[ax] = lo
+        sl1[ax] = hi
+        data = N.ma.getdata(data)
+        a = data[tuple(sl0)]
+        b = data[tuple(sl1)]
+        data_unstag = N.empty(a.shape,dtype=self.dtype)
+        N.add(a,b,out=data_unstag)
+        data_unstag *= 0.5
+        return data_unstag
 
     def return_tbl(self):
         """
@@ -456,7 +732,13 @@ class WRFOut(NC):
         tbl['cref'] = self.compute_comp_ref
         tbl['wind10'] = self.compute_wind10
         tbl['wind'] = self.compute_wind
-        tbl['CAPE'] = self.compute_CAPE
+        for field in ('CAPE','CIN','LCL','LFC'):
+            # Parcel type given by other, e.g. get('CAPE',other='MU')
+            tbl[field] = functools.partial(self.compute_parcel_field,
+                                                field,None)
+            for parcel in ('SB','ML','MU'):
+                tbl[parcel+field] = functools.partial(
+                            self.compute_parcel_field,field,parcel)
         tbl['Td'] = self.compute_Td
         tbl['pressure'] = self.compute_pressure
         tbl['drybulb'] = self.compute_drybulb
@@ -487,9 +769,111 @@ class WRFOut(NC):
         tbl['T2_gradient'] = self.compute_T2_gradient
         tbl['Q_pert'] = self.compute_Q_pert
         tbl['vorticity'] = self.return_vorticity
+        tbl['divergence'] = self.return_divergence
+        tbl['deformation'] = self.return_deformation
+        tbl['frontogenesis'] = self.return_frontogenesis
+        tbl['coldpool_depth'] = self.compute_cold_pool_depth
+        tbl['coldpool_strength'] = self.compute_cold_pool_strength
 
         return tbl
 
+    def return_deps(self):
+        """
+        Returns a dictionary of the variables that each entry in
+        return_tbl() fetches with self.get().
+        """
+        qall = ('QVAPOR','QCLOUD','QRAIN','QICE','QSNOW','QGRAUP')
+        deps = {}
+        deps['shear'] = ('U','V','Z')
+        deps['thetae'] = ('pressure','drybulb','Td')
+        deps['cref'] = ('T2','QRAIN','PSFC','QSNOW')
+        deps['wind10'] = ('U10','V10')
+        deps['wind'] = ('U','V')
+        for field in ('CAPE','CIN','LCL','LFC'):
+            for parcel in ('','SB','ML','MU'):
+                deps[parcel+field] = ('pressure','drybulb','QVAPOR','Z','HGT')
+        deps['Td'] = ('QVAPOR','pressure')
+        deps['pressure'] = ('P','PB')
+        deps['drybulb'] = ('theta','pressure')
+        deps['theta'] = ('T',)
+        deps['geopot'] = ('PH','PHB')
+        deps['Z'] = ('PH','PHB')
+        deps['dptp'] = ('dpt',)
+        deps['T2p'] = ('T2',)
+        deps['dpt'] = ('theta',) + qall
+        deps['buoyancy'] = ('theta','QVAPOR')
+        deps['strongestwind'] = ('WSPD10MAX','wind10')
+        deps['PMSL'] = ('PSFC','T2','HGT')
+        deps['RH'] = ('drybulb','Td')
+        deps['dryairmass'] = ('MU','MUB')
+        deps['QTOTAL'] = qall
+        deps['olr'] = ('OLR',)
+        deps['es'] = ('drybulb',)
+        deps['e'] = ('RH','es')
+        deps['q'] = ('es','pressure')
+        deps['fluidtrapping'] = ('U10','V10','MAPFAC_M')
+        deps['lyapunov'] = ('U','V','MAPFAC_M')
+        deps['REFL_comp'] = ('REFL_10CM',)
+        deps['temp_advection'] = ('U','V','drybulb')
+        deps['omega'] = ('W','density')
+        deps['density'] = ('drybulb','pressure')
+        deps['PMSL_gradient'] = ('PMSL',)
+        deps['T2_gradient'] = ('T2',)
+        deps['Q_pert'] = ('QVAPOR',)
+        deps['vorticity'] = ('U','V','MAPFAC_M')
+        deps['divergence'] = ('U','V','MAPFAC_M')
+        deps['deformation'] = ('U','V','MAPFAC_M')
+        deps['frontogenesis'] = ('U','V','W','theta','pressure','MAPFAC_M')
+        deps['coldpool_depth'] = ('dpt','Z','HGT')
+        deps['coldpool_strength'] = ('dpt','Z','HGT')
+
+        return deps
+
+    def resolve_deps(self,vrbls):
+        """
+        Walk the dependency graph of one or more variables.
+
+        Returns:
+            fields (list): variables that are read from the file.
+            computed (list): variables to compute, ordered so that
+                every entry comes after the ones it depends on.
+        """
+        if isinstance(vrbls,str):
+            vrbls = [vrbls,]
+        deps = self.return_deps()
+        fields = []
+        computed = []
+
+        def walk(v):
+            if (v in fields) or (v in computed):
+                return
+            if self.check_compute(v):
+                fields.append(v)
+            elif v in deps:
+                for d in deps[v]:
+                    walk(d)
+                computed.append(v)
+            # Otherwise optional (e.g. QGRAUP) and absent from this file
+
+        for v in vrbls:
+            walk(v)
+        return fields, computed
+
+    def clear_cache(self):
+        """
+        Empty the cache of loaded and computed fields.
+        """
+        self.cache.clear()
+        self.vweights.clear()
+
+    def close(self):
+        """
+        Close the netCDF file and empty the caches. The file is
+        reopened if the object is used again.
+        """
+        super().close()
+        self.clear_cache()
+
     def compute(self,vrbl,tidx,lvidx,lonidx,latidx,other,lookup=0):
         """ Look up method needed to return array of data
         for required variable.
@@ -513,44 +897,44 @@ class WRFOut(NC):
 
     def compute_RH(self,tidx,lvidx,lonidx,latidx,other):
 
-        T = self.get('drybulb',tidx,lvidx,lonidx,latidx,other='C')
-        Td = self.get('Td',tidx,lvidx,lonidx,latidx)
+        T = self.get('drybulb',tidx,lvidx,latidx,lonidx,other='C')
+        Td = self.get('Td',tidx,lvidx,latidx,lonidx)
         RH = N.exp(0.073*(Td-T))
         # pdb.set_trace()
         return RH*100.0
 
     def compute_temp_advection(self,tidx,lvidx,lonidx,latidx,other):
-        U = self.get('U',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        V = self.get('V',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        T = self.get('drybulb',tidx,lvidx,lonidx,latidx)[0,0,:,:]
+        U = self.get('U',tidx,lvidx,latidx,lonidx)[0,0,:,:]
+        V = self.get('V',tidx,lvidx,latidx,lonidx)[0,0,:,:]
+        T = self.get('drybulb',tidx,lvidx,latidx,lonidx)[0,0,:,:]
         dTdx, dTdy = N.gradient(T,self.DX,self.DY)
         field = -U*dTdx - V*dTdy
         # pdb.set_trace()
         return field
 
     def compute_PMSL_gradient(self,tidx,lvidx,lonidx,latidx,other):
-        P = self.get('PMSL',tidx,lvidx,lonidx,latidx)[0,0,:,:]
+        P = self.get('PMSL',tidx,lvidx,latidx,lonidx)[0,0,:,:]
         dPdx, dPdy = N.gradient(P,self.dx,self.dy)
         field = N.sqrt(dPdx**2 + dPdy**2)
         # import pdb; pdb.set_trace()
         return field
 
     def compute_T2_gradient(self,tidx,lvidx,lonidx,latidx,other):
-        T2 = self.get('T2',tidx,lvidx,lonidx,latidx)[0,0,:,:]
+        T2 = self.get('T2',tidx,lvidx,latidx,lonidx)[0,0,:,:]
         dTdx, dTdy = N.gradient(T2,self.dx,self.dy)
         field = N.sqrt(dTdx**2 + dTdy**2)
         # import pdb; pdb.set_trace()
         return field
 
     def compute_dryairmass(self,tidx,lvidx,lonidx,latidx,other):
-        MU = self.get('MU',tidx,lvidx,lonidx,latidx)
-        MUB = self.get('MUB',tidx,lvidx,lonidx,latidx)
+        MU = self.get('MU',tidx,lvidx,latidx,lonidx)
+        MUB = self.get('MUB',tidx,lvidx,latidx,lonidx)
         return MU + MUB
 
     def compute_pmsl(self,tidx,lvidx,lonidx,latidx,other):
-        P = self.get('PSFC',tidx,lvidx,lonidx,latidx)
-        T2 = self.get('T2',tidx,lvidx,lonidx,latidx)
-        HGT = self.get('HGT',tidx,lvidx,lonidx,latidx)
+        P = self.get('PSFC',tidx,lvidx,latidx,lonidx)
+        T2 = self.get('T2',tidx,lvidx,latidx,lonidx)
+        HGT = self.get('HGT',tidx,lvidx,latidx,lonidx)
 
         temp = T2 + (6.5*HGT)/1000.0
         pmsl = P*N.exp(9.81/(287.0*temp)*HGT)
@@ -564,33 +948,33 @@ class WRFOut(NC):
         """
         Method from Adams-Selin et al., 2013, WAF
         """
-        theta = self.get('theta',tidx,lvidx,lonidx,latidx)
+        theta = self.get('theta',tidx,lvidx,latidx,lonidx)
         thetabar = N.mean(theta)
-        qv = self.get('QVAPOR',tidx,lvidx,lonidx,latidx)
+        qv = self.get('QVAPOR',tidx,lvidx,latidx,lonidx)
         qvbar = N.mean(qv)
 
         B = cc.g * ((theta-thetabar)/thetabar + 0.61*(qv - qvbar))
         return B
 
     def compute_mixing_ratios(self,tidx,lvidx,lonidx,latidx,other=False):
-        qv = self.get('QVAPOR',tidx,lvidx,lonidx,latidx)
-        qc = self.get('QCLOUD',tidx,lvidx,lonidx,latidx)
-        qr = self.get('QRAIN',tidx,lvidx,lonidx,latidx)
+        qv = self.get('QVAPOR',tidx,lvidx,latidx,lonidx)
+        qc = self.get('QCLOUD',tidx,lvidx,latidx,lonidx)
+        qr = self.get('QRAIN',tidx,lvidx,latidx,lonidx)
 
         try:
-            qi = self.get('QICE',tidx,lvidx,lonidx,latidx)
+            qi = self.get('QICE',tidx,lvidx,latidx,lonidx)
         except KeyError:
             print("MP scheme has no ice data.")
             qi = 0
 
         try:
-            qs = self.get('QSNOW',tidx,lvidx,lonidx,latidx)
+            qs = self.get('QSNOW',tidx,lvidx,latidx,lonidx)
         except KeyError:
             print("MP scheme has no snow data.")
             qs = 0
 
         try:
-            qg = self.get('QGRAUP',tidx,lvidx,lonidx,latidx)
+            qg = self.get('QGRAUP',tidx,lvidx,latidx,lonidx)
         except KeyError:
             print("MP scheme has no graupel data.")
             qg = 0
@@ -605,19 +989,19 @@ class WRFOut(NC):
         return qtotal
 
     def compute_dptp(self,tidx,lvidx,lonidx,latidx,other):
-        dpt = self.get('dpt',tidx,lvidx,lonidx,latidx)
+        dpt = self.get('dpt',tidx,lvidx,latidx,lonidx)
         dpt_mean = N.mean(dpt)
         dptp = dpt - dpt_mean
         return dptp
 
     def compute_T2_pertub(self,tidx,lvidx,lonidx,latidx,other):
-        T2 = self.get('T2',tidx,lvidx,lonidx,latidx)
+        T2 = self.get('T2',tidx,lvidx,latidx,lonidx)
         T2_mean = N.mean(T2)
         T2p = T2-T2_mean
         return T2p
 
     def compute_Q_pert(self,tidx,lvidx,lonidx,latidx,other):
-        Q = self.get('QVAPOR',tidx,lvidx,lonidx,latidx)
+        Q = self.get('QVAPOR',tidx,lvidx,latidx,lonidx)
         Q_mean = N.mean(Q)
         Qp = Q-Q_mean
         return Qp
@@ -630,36 +1014,36 @@ class WRFOut(NC):
         """
         # if tidx,lvidx,lonidx,latidx['lv'] == 0:
             # tidx,lvidx,lonidx,latidx['lv'] = 0
-        theta = self.get('theta',tidx,lvidx,lonidx,latidx)
+        theta = self.get('theta',tidx,lvidx,latidx,lonidx)
         rh, rv = self.compute_mixing_ratios(tidx,lvidx,lonidx,latidx)
 
         dpt = theta * (1 + 0.61*rv - rh)
         return dpt
 
     def compute_geopotential_height(self,tidx,lvidx,lonidx,latidx,other):
-        geopotential = self.get('PH',tidx,lvidx,lonidx,latidx) + self.get('PHB',tidx,lvidx,lonidx,latidx)
+        geopotential = self.get('PH',tidx,lvidx,latidx,lonidx) + self.get('PHB',tidx,lvidx,latidx,lonidx)
         Z = geopotential/9.81
         return Z
 
     def compute_geopotential(self,tidx,lvidx,lonidx,latidx,other):
-        geopotential = self.get('PH',tidx,lvidx,lonidx,latidx) + self.get('PHB',tidx,lvidx,lonidx,latidx)
+        geopotential = self.get('PH',tidx,lvidx,latidx,lonidx) + self.get('PHB',tidx,lvidx,latidx,lonidx)
         return geopotential
 
     def compute_wind10(self,tidx,lvidx,lonidx,latidx,other):
-        u = self.get('U10',tidx,lvidx,lonidx,latidx)
-        v = self.get('V10',tidx,lvidx,lonidx,latidx)
+        u = self.get('U10',tidx,lvidx,latidx,lonidx)
+        v = self.get('V10',tidx,lvidx,latidx,lonidx)
         data = N.sqrt(u**2 + v**2)
         return data
 
     def compute_pressure(self,tidx,lvidx,lonidx,latidx,other):
-        PP = self.get('P',tidx,lvidx,lonidx,latidx)
-        PB = self.get('PB',tidx,lvidx,lonidx,latidx)
+        PP = self.get('P',tidx,lvidx,latidx,lonidx)
+        PB = self.get('PB',tidx,lvidx,latidx,lonidx)
         pressure = PP + PB
         return pressure
 
     def compute_drybulb(self,tidx,lvidx,lonidx,latidx,other='K'):
-        theta = self.get('theta',tidx,lvidx,lonidx,latidx)
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx)
+        theta = self.get('theta',tidx,lvidx,latidx,lonidx)
+        P = self.get('pressure',tidx,lvidx,latidx,lonidx)
 
         # Theta-e at level 2
         drybulb = theta*((P/100000.0)**(287.04/1004.0))
@@ -669,15 +1053,15 @@ class WRFOut(NC):
             return drybulb-273.15
 
     def compute_theta(self,tidx,lvidx,lonidx,latidx,other):
-        theta = self.get('T',tidx,lvidx,lonidx,latidx)
+        theta = self.get('T',tidx,lvidx,latidx,lonidx)
         Tbase = 300.0
         theta = Tbase + theta
         return theta
 
     def compute_wind(self,tidx,lvidx,lonidx,latidx,other):
         # pdb.set_trace()
-        u = self.get('U',tidx,lvidx,lonidx,latidx)
-        v = self.get('V',tidx,lvidx,lonidx,latidx)
+        u = self.get('U',tidx,lvidx,latidx,lonidx)
+        v = self.get('V',tidx,lvidx,latidx,lonidx)
         data = N.sqrt(u**2 + v**2)
         return data
 
@@ -698,9 +1082,9 @@ class WRFOut(NC):
             topm = other['top']*1000
             botm = other['bottom']*1000
 
-        u = self.get('U',tidx,lvidx,lonidx,latidx)
-        v = self.get('V',tidx,lvidx,lonidx,latidx)
-        Z = self.get('Z',tidx,lvidx,lonidx,latidx)
+        u = self.get('U',tidx,lvidx,latidx,lonidx)
+        v = self.get('V',tidx,lvidx,latidx,lonidx)
+        Z = self.get('Z',tidx,lvidx,latidx,lonidx)
 
         topidx = N.zeros((self.y_dim,self.x_dim))
         botidx = N.zeros((self.y_dim,self.x_dim))
@@ -728,16 +1112,8 @@ class WRFOut(NC):
         # pdb.set_trace()
         return shear
 
-    def compute_thetae(self,tidx,lvidx,lonidx,latidx,other):
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx) # Computed
-        Drybulb = self.get('temp',tidx,lvidx,lonidx,latidx)
-        Q = self.get('Q',tidx,lvidx,lonidx,latidx)
-
-        thetae = (Drybulb + (Q * cc.Lv/cc.cp)) * (cc.P0/P) ** cc.kappa
-        return thetae
-
     def compute_olr(self,tidx,lvidx,lonidx,latidx,other):
-        OLR = self.get('OLR',tidx,lvidx,lonidx,latidx)
+        OLR = self.get('OLR',tidx,lvidx,latidx,lonidx)
         sbc = 0.000000056704
         ir = ((OLR/sbc)**0.25) - 273.15
         return ir
@@ -745,67 +1121,64 @@ class WRFOut(NC):
     def compute_REFL_comp(self,tidx,lvidx,lonidx,latidx,other):
         # lvidx = None
         # pdb.set_trace()
-        refl = self.get('REFL_10CM',tidx,lvidx,lonidx,latidx,other)[0,:,:,:]
+        refl = self.get('REFL_10CM',tidx,lvidx,latidx,lonidx,other)[0,:,:,:]
         refl_comp = N.max(refl,axis=0)
         return refl_comp
 
     def compute_comp_ref(self,tidx,lvidx,lonidx,latidx,other):
-        """Amend this so variables obtain at start fetch only correct date, lats, lons
-        All levels need to be fetched as this is composite reflectivity
+        """Composite (column-maximum) simulated reflectivity from rain,
+        snow and graupel mixing ratios.
+
+        Times are processed self.chunk_t at a time so that only a few
+        3D fields of QRAIN/QSNOW/QGRAUP are in memory at once. Snow and
+        graupel are left out if QSNOW or QGRAUP isn't in the file.
+        Graupel is dry ice spheres with an exponential size distribution
+        (intercept no_grau), scaled for the dielectric factor and density
+        of ice.
         """
-        T2 = self.get('T2',tidx,False,lonidx,latidx)
-        # QR = self.nc.variables['QRAIN'][PS['t'],:,PS['la'],PS['lo']]
-        QR = self.get('QRAIN',tidx,False,lonidx,latidx) # This should get all levels
-        PSFC = self.get('PSFC',tidx,False,lonidx,latidx)
+        tidxs = self.time_indices(tidx)
+        has_snow = 'QSNOW' in self.fields
+        has_grau = 'QGRAUP' in self.fields
 
-        try:
-            QS = self.get('QSNOW',tidx,False,lonidx,latidx)
-        except:
-            QS = N.zeros(N.shape(QR))
         rhor = 1000.0
-        rhos = 100.0
         rhog = 400.0
-        rhoi = 917.0
-
         no_rain = 8.0E6
-        # How do I access this time?
-        no_snow = 2.0E6 * N.exp(-0.12*(T2-273.15))
         no_grau = 4.0E6
 
-        density = N.divide(PSFC,(287.0 * T2))
-        Qra_all = QR[0,...]
-        Qsn_all = QS[0,...]
-
-        for j in range(len(Qra_all[1,:,1])):
-            curcol_r = []
-            curcol_s = []
-            for i in range(len(Qra_all[1,1,:])):
-                    maxrval = N.max(Qra_all[:,j,i])
-                    maxsval = N.max(Qsn_all[:,j,i])
-                    curcol_r.append(maxrval)
-                    curcol_s.append(maxsval)
-            N_curcol_r = N.array(curcol_r)
-            N_curcol_s = N.array(curcol_s)
-            if j == 0:
-                Qra = N_curcol_r
-                Qsn = N_curcol_s
+        dBZ = []
+        for n in range(0,len(tidxs),self.chunk_t):
+            tchunk = tidxs[n:n+self.chunk_t]
+            T2 = self.get('T2',tchunk,False,latidx,lonidx)
+            PSFC = self.get('PSFC',tchunk,False,latidx,lonidx)
+            # Column maxima, keeping a singleton level axis
+            Qra = self.get('QRAIN',tchunk,None,latidx,lonidx).max(
+                                                axis=1,keepdims=True)
+            if has_snow:
+                Qsn = self.get('QSNOW',tchunk,None,latidx,lonidx).max(
+                                                axis=1,keepdims=True)
             else:
-                Qra = N.row_stack((Qra, N_curcol_r))
-                Qsn = N.row_stack((Qsn, N_curcol_s))
+                Qsn = N.zeros_like(Qra)
+
+            no_snow = 2.0E6 * N.exp(-0.12*(T2-273.15))
+            density = N.divide(PSFC,(287.0 * T2))
 
-        # Calculate slope factor lambda
-        lambr = (N.divide((3.14159 * no_rain * rhor), N.multiply(density, Qra)+N.nextafter(0,1))) ** 0.25
-        lambs = N.exp(-0.0536 * (T2 - 273.15))
+            # Calculate slope factor lambda
+            lambr = (N.divide((3.14159 * no_rain * rhor), N.multiply(density, Qra)+N.nextafter(0,1))) ** 0.25
+            lambs = N.exp(-0.0536 * (T2 - 273.15))
 
-        # Calculate equivalent reflectivity factor
-        Zer = (720.0 * no_rain * (lambr ** -7.0)) * 1E18
-        Zes = (0.224 * 720.0 * no_snow * (lambr ** -7.0) * (rhos/rhoi) ** 2) * 1E18
-        Zes_int = N.divide((lambs * Qsn * density), no_snow)
-        Zes = ((0.224 * 720 * 1E18) / (3.14159 * rhor) ** 2) * Zes_int ** 2
+            # Calculate equivalent reflectivity factor
+            Zer = (720.0 * no_rain * (lambr ** -7.0)) * 1E18
+            Zes_int = N.divide((lambs * Qsn * density), no_snow)
+            Zes = ((0.224 * 720 * 1E18) / (3.14159 * rhor) ** 2) * Zes_int ** 2
 
-        Ze = N.add(Zer, Zes)
-        dBZ = N.nan_to_num(10*N.log10(Ze))
-        return dBZ
+            Ze = N.add(Zer, Zes)
+            if has_grau:
+                Qgr = self.get('QGRAUP',tchunk,None,latidx,lonidx).max(
+                                                axis=1,keepdims=True)
+                lambg = (N.divide((3.14159 * no_grau * rhog), N.multiply(density, Qgr)+N.nextafter(0,1))) ** 0.25
+                Ze += 0.224 * (rhog/rhor)**2 * (720.0 * no_grau * (lambg ** -7.0)) * 1E18
+            dBZ.append(N.nan_to_num(10*N.log10(Ze)))
+        return N.concatenate(dBZ,axis=0)
 
     def compute_simref_atlevel(self,level=1):
         pass
@@ -828,12 +1201,12 @@ class WRFOut(NC):
         pass
 
     def compute_thetae(self,tidx,lvidx,lonidx,latidx,other):
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx)
-        T = self.get('drybulb',tidx,lvidx,lonidx,latidx,units='K')
-        Td = self.get('Td',tidx,lvidx,lonidx,latidx)
-        p2, t2 = thermo.drylift(P,T,Td)
-        x = thermo.wetlift(p2,t2,100.0)
-        thetae = thermo.theta(100.0, x, 1000.0)
+        P = self.get('pressure',tidx,lvidx,latidx,lonidx)
+        T = self.get('drybulb',tidx,lvidx,latidx,lonidx,other='K')
+        Td = self.get('Td',tidx,lvidx,latidx,lonidx) + 273.15
+        w = thermo.sat_mixing_ratio(P,Td)
+        T_lcl, _ = thermo.lcl(P,T,Td)
+        thetae = thermo.theta_e(P,T,w,T_lcl)
         return thetae
 
 
@@ -841,8 +1214,8 @@ class WRFOut(NC):
         """
         Using HootPy equation
         """
-        Q = self.get('QVAPOR',tidx,lvidx,lonidx,latidx)
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx)
+        Q = self.get('QVAPOR',tidx,lvidx,latidx,lonidx)
+        P = self.get('pressure',tidx,lvidx,latidx,lonidx)
         w = N.divide(Q, N.subtract(1,Q))
         e = N.divide(N.multiply(w,P), N.add(0.622,w))/100.0
         a = N.multiply(243.5,N.log(N.divide(e,6.112)))
@@ -851,105 +1224,67 @@ class WRFOut(NC):
         # pdb.set_trace()
         return Td
 
-    def compute_CAPE(self,tidx,lvidx,lonidx,latidx,other):
+    def compute_parcel_field(self,field,parcel,tidx,lvidx,lonidx,latidx,
+                                    other):
         """
-        INCOMPLETE!
-
-        CAPE method based on GEMPAK's pdsuml.f function
-
-        Inputs:
-
-        tidx,lvidx,lonidx,latidx  :   dictionary of level/time/lat/lon
-
-
+        One of the outputs of lift_parcels().
 
-        Outputs:
-        CAPE    :   convective available potential energy
-        CIN     :   convective inhibition
+        field   :   'CAPE', 'CIN', 'LCL' or 'LFC'
+        parcel  :   'SB', 'ML' or 'MU'. If None, use other
+                    (default 'SB'), e.g. get('LCL',other='ML').
         """
-        # Make sure all levels are obtained
-        #tidx,lvidx,lonidx,latidx['lv'] = slice(None,None)
+        if parcel is None:
+            parcel = other or 'SB'
+        n = ('CAPE','CIN','LCL','LFC').index(field)
+        return self.lift_parcels(tidx,lonidx,latidx,parcel)[n]
 
-        totalCAPE = 0
-        totalCIN = 0
-
-        theta = self.get('theta',tidx,lvidx,lonidx,latidx)
-        Z = self.get('Z',tidx,lvidx,lonidx,latidx)
-
-        for lvidx in range(theta.shape[1]-1):
-            if lvidx < 20:
-                continue
-            # This should loop over the levels?
-            """
-            z1      :   bottom of layer (index)
-            z2      :   top of layer (index)
-            th1     :   theta (environ) at z1
-            th2     :   theta (environ) at z2
-            thp1    :   theta (parcel) at z1
-            thp2    :   theta (parcel) at z2
-            """
-
-            z1 = Z[0,lvidx,...]
-            z2 = Z[0,lvidx+1,...]
-
-            th1 = theta[0,lvidx,...]
-            th2 = theta[0,lvidx+1,...]
-
-            thp1 = 0
-            thp2 = 0
-
-            capeT = 0.0
-            cinT = 0.0
-
-            dt2 = thp2 - th2
-            dt1 = thp1 - th1
-
-            dz = z2 - z1
-
-            dt1_pos_ma = N.ma.masked_greater(dt1,0)
-            dt1_neg_ma = N.ma.masked_less(dt1,0)
-
-            dt2_pos_ma = N.ma.masked_greater(dt2,0)
-            dt2_neg_ma = N.ma.masked_less(dt2,0)
-
-            dt1_pos = N.select([dt1>0],[dt1])
-            dt1_neg = N.select([dt1<0],[dt1])
-            dt2_pos = N.select([dt2>0],[dt1])
-            dt2_neg = N.select([dt2<0],[dt1])
-
-            pdb.set_trace()
-
-            if (dt1 > 0) and (dt2 > 0):
-                capeT = ((dt2 + dt1)*dz)/(th2+th1)
-            elif dt1 > 0:
-                ratio = dt1/(dt1-dt2)
-                zeq = z1 + (dz*ratio)
-                teq = th1 + ((th2-th1)*ratio)
-                capeT = (dt1*(zeq-z1))/(th1+teq)
-                cinT = (dt2*(z2-zeq))/(th2+teq)
-            elif dt2 > 0:
-                ratio = dt2/(dt2-dt1)
-                zfc = z2-(dz*ratio)
-                tfc = th2-((th2-th1)*ratio)
-                capeT = (dt2*(z2-zfc)/(tfc+th2))
-                cinT = (dt1*(zfc-z1)/(tfc+th1))
-            else:
-                cinT = ((dt2+dt1)*dz)/(th2+th1)
-
-            if capeT > 0:
-                CAPE = capeT * cc.g
-            else:
-                CAPE = 0
-
-            if cinT < 0:
-                CIN = cinT * cc.g
-            else:
-                CIN = 0
+    def lift_parcels(self,tidx,lonidx,latidx,parcel='SB'):
+        """
+        CAPE and CIN (J/kg), and LCL and LFC heights above ground (m),
+        for a surface-based, mixed-layer or most-unstable parcel.
+        See thermo.lift_parcels.
 
-                totalCAPE += CAPE
-                totalCIN += CIN
+        The domain is processed in tiles of self.tile x self.tile
+        columns, so only a few 3D fields for one tile are in memory.
 
-        return totalCAPE,totalCIN
+        Returns:
+            5D array: (CAPE/CIN/LCL/LFC, time, 1, lat, lon).
+        """
+        key = ('lift_parcels',parcel,self._selection_key(tidx),
+                    self._selection_key(lonidx),self._selection_key(latidx))
+        out = self.cache.get(key)
+        if out is not None:
+            return out
+
+        rows = []
+        for ysl in self.tile_slices(latidx,self.y_dim):
+            row = []
+            for xsl in self.tile_slices(lonidx,self.x_dim):
+                P = self.get('pressure',tidx,None,ysl,xsl)
+                T = self.get('drybulb',tidx,None,ysl,xsl,other='K')
+                Q = self.get('QVAPOR',tidx,None,ysl,xsl)
+                Z = (self.get('Z',tidx,None,ysl,xsl) -
+                        self.get('HGT',tidx,None,ysl,xsl))
+                row.append(N.array(thermo.lift_parcels(P,T,Q,Z,parcel)))
+            rows.append(N.concatenate(row,axis=-1))
+        out = N.concatenate(rows,axis=-2)[:,:,N.newaxis,...]
+        self.cache.put(key,out)
+        return out
+
+    def tile_slices(self,idx,n):
+        """
+        Split a lat or lon selection into slices of at most self.tile
+        points. Selections other than contiguous slices are one tile.
+        """
+        if idx is None:
+            idx = slice(0,n)
+        if not isinstance(idx,slice):
+            return [idx,]
+        start, stop, step = idx.indices(n)
+        if step != 1:
+            return [idx,]
+        return [slice(i,min(i+self.tile,stop))
+                    for i in range(start,stop,self.tile)]
 
     def compute_ave(self,va,z1,z2):
         """
@@ -971,19 +1306,28 @@ class WRFOut(NC):
         """
         Pass the array of time indices and it will find the max
         along that axis.
+
+        Times are streamed in blocks with iter_chunks(), so memory use
+        doesn't grow with the number of times.
         """
+        def stream_max(vrbl):
+            wind_max = None
+            for _, wind in self.iter_chunks(vrbl,chunk_t=self.chunk_t,
+                            level=lvidx,utc=tidx,lats=latidx,lons=lonidx):
+                wind = N.amax(wind,axis=0)
+                if wind_max is None:
+                    wind_max = wind
+                else:
+                    wind_max = N.maximum(wind_max,wind)
+            return wind_max
+
         if 'WSPD10MAX' in self.fields:
-            ww = self.get('WSPD10MAX',tidx,lvidx,lonidx,latidx)
-            if ww.max() > 0.1:
+            wind_max = stream_max('WSPD10MAX')
+            if wind_max.max() > 0.1:
                 print("Using WSPD10MAX data")
-                wind = ww
-            else:
-                print("Using wind10 data")
-                wind = self.get('wind10',tidx,lvidx,lonidx,latidx)
-        else:
-            print("Using wind10 data")
-            wind = self.get('wind10',tidx,lvidx,lonidx,latidx)
-        wind_max = N.amax(wind,axis=0)
+                return wind_max
+        print("Using wind10 data")
+        wind_max = stream_max('wind10')
         # wind_max_smooth = self.test_smooth(wind_max)
         # return wind_max_smooth
 
@@ -1056,8 +1400,9 @@ class WRFOut(NC):
         """
 
         if isinstance(da,dict):
-            N_idx = self.get_lat_idx(da['Nlim'])
-            E_idx = self.get_lon_idx(da['Elim'])
+            # Limits are inclusive, as with utils.return_subdomain
+            N_idx = self.get_lat_idx(da['Nlim'])+1
+            E_idx = self.get_lon_idx(da['Elim'])+1
             S_idx = self.get_lat_idx(da['Slim'])
             W_idx = self.get_lon_idx(da['Wlim'])
         else:
@@ -1084,30 +1429,109 @@ class WRFOut(NC):
             print("Invalid selection for return_array.")
             raise Exception
 
+    @functools.cached_property
+    def gridindex(self):
+        """
+        Spatial index of the grid (see utils.GridIndex), shared by all
+        files on the same grid.
+        """
+        return utils.GridIndex.for_grid(self.lats,self.lons)
+
     def get_latlon_idx(self,lat,lon):
-        latidx, lonidx = utils.get_latlon_idx(self.lats,self.lons,
-                                    lat,lon)
-        # coords = N.unravel_index(N.argmin((lat-self.lats)**2+
-                    # (lon-self.lons)**2),self.lons.shape)
-        # lon, lat
-        # return [int(c) for c in coords]
+        """
+        Indices (lat, lon) of the closest grid point. For arrays of
+        locations, returns arrays of indices.
+        """
+        latidx, lonidx = self.gridindex.nearest(lat,lon)
+        if N.ndim(lat) == 0:
+            return int(latidx[0]), int(lonidx[0])
         return latidx, lonidx
 
+    def station_weights(self,lats,lons,method='nearest',k=4):
+        """
+        Neighbouring grid points and weights for many stations, to
+        reuse with get_stations() for any number of files on this grid.
+
+        :param method:      'nearest' grid point, or inverse-distance
+                            weighting ('idw') of the k nearest.
+        :type method:       str
+        :returns:           yidx, xidx, wgt -- arrays of shape
+                            (station, neighbour)
+        """
+        if method == 'nearest':
+            yidx, xidx = self.gridindex.nearest(lats,lons)
+            return yidx[:,N.newaxis], xidx[:,N.newaxis], N.ones((len(yidx),1))
+        elif method == 'idw':
+            return self.gridindex.weights(lats,lons,k=k)
+        else:
+            raise Exception("Method must be 'nearest' or 'idw'.")
+
+    def get_stations(self,vrbls,lats=None,lons=None,utc=None,level=None,
+                        other=False,weights=None,method='nearest'):
+        """
+        Time series of variable(s) at many stations.
+
+        Each variable is read once, at only the rows and columns that
+        hold a station's neighbouring grid points. The read has its
+        own short-lived cache (see get_chunk), so nothing is kept
+        afterwards. Computed variables needing horizontal derivatives
+        are not supported, as neighbouring rows and columns are
+        generally not read.
+
+        :param vrbls:       WRF or computed variable(s)
+        :type vrbls:        str,list,tuple
+        :param lats:        station latitudes. Not needed if weights
+                            are given.
+        :type lats:         N.ndarray,list
+        :param weights:     output of station_weights(), computed once
+                            for many files on the same grid.
+        :type weights:      tuple
+
+        Other arguments are as for get() and station_weights(). Three-
+        dimensional variables need a single level.
+
+        :returns:           N.ndarray -- (station, time, variable)
+        """
+        if isinstance(vrbls,str):
+            vrbls = (vrbls,)
+        if weights is None:
+            weights = self.station_weights(lats,lons,method=method)
+        yidx, xidx, wgt = weights
+
+        # Positions of each neighbour among the rows and columns read
+        rows, yloc = N.unique(yidx,return_inverse=True)
+        cols, xloc = N.unique(xidx,return_inverse=True)
+        yloc = yloc.reshape(yidx.shape)
+        xloc = xloc.reshape(xidx.shape)
+        data = self.get_chunk(vrbls,utc,level=level,lats=rows,lons=cols,
+                                other=other)
+
+        nt = data[vrbls[0]].shape[0]
+        out = N.zeros((yidx.shape[0],nt,len(vrbls)),dtype=data[vrbls[0]].dtype)
+        for n,vrbl in enumerate(vrbls):
+            if data[vrbl].shape[1] > 1:
+                raise Exception("Pick a single level for {0} at stations; "
+                        "got {1} levels.".format(vrbl,data[vrbl].shape[1]))
+            out[:,:,n] = utils.interp_points(data[vrbl][:,0,...],
+                    yloc,xloc,wgt).T
+        return out
+
     def get_lat_idx(self,lat):
-        lat_idx = N.where(abs(self.lats-lat) == abs(self.lats-lat).min())[0][0]
+        lat_idx = utils.closest(self.lats1D,lat)
         return int(lat_idx)
 
     def get_lon_idx(self,lon):
-        lon_idx = N.where(abs(self.lons-lon) == abs(self.lons-lon).min())[0][0]
+        lon_idx = utils.closest(self.lons1D,lon)
         return int(lon_idx)
 
-    def get_p(self,vrbl,tidx=None,level=None,lonidx=None,latidx=None):
+    def get_p(self,vrbl,tidx=None,level=None,lonidx=None,latidx=None,
+                logp=False):
         """
         Return an pressure level isosurface of given variable.
-        Interpolation is linear so watch out.
+        Interpolation is linear (or linear in log-p if logp is True)
+        and vectorised over all columns, levels and times.
 
-        Dimensions returns as (height,lat,lon)
-        Or is it (height,lon, lat!?)
+        Dimensions returned are (time,level,lat,lon).
 
         TODO: Need to include limited domain functionality
 
@@ -1130,28 +1554,105 @@ class WRFOut(NC):
         # If this breaks, user is requesting non-4D data
         # Duck-typing for the win
 
-        P = self.get('pressure',utc=tidx,lons=lonidx,lats=latidx)[...]
-
         if vrbl=='pressure':
-            dataout = N.ones([P.shape[0],nlv,P.shape[-2],P.shape[-1]])*hPa
+            P = self.get('pressure',utc=tidx,lons=lonidx,lats=latidx)
+            dataout = N.ones([P.shape[0],nlv,P.shape[-2],P.shape[-1]])
+            dataout *= N.reshape(hPa,(1,nlv,1,1))
         else:
+            idx, wgt = self.get_vertical_weights('isobaric',hPa,tidx,
+                                            lonidx,latidx,log=logp)
             datain = self.get(vrbl,utc=tidx,lons=lonidx,lats=latidx)[...]
-            # import pdb; pdb.set_trace()
-            # What about RUC, pressure coords
-            # dataout = N.zeros([nlv,P.shape[-1],P.shape[-2]])
-            dataout = N.zeros([P.shape[0],nlv,P.shape[-2],P.shape[-1]])
-            # pdb.set_trace()
-            for t in range(P.shape[0]):
-                for (i,j), p in N.ndenumerate(dataout[0,0,:,:]):
-                    dataout[t,:,i,j] = N.interp(hPa,P[t,:,i,j][::-1],datain[t,:,i,j][::-1])
-            # dataout = scipy.interpolate.griddata(P.flatten(),datain.flatten(),hPa)
-        # if nlv == 1:
-            # Return 2D if only one level requested
-            # return self.make_4D(dataout[:,0,:,:])
-        # else:
-            # return self.make_4D(dataout)
+            dataout = interp.apply_weights(datain,idx,wgt)
         return dataout
 
+    def get_surface(self,vrbl,tidx,level,coords,lonidx=None,latidx=None):
+        """
+        Return an isosurface of height above ground level or of
+        potential temperature for given variable.
+
+        :param level:       e.g. '4000m', '3km', '320K' or a list of these.
+        :param coords:      'geometric' or 'isentropic', as returned by
+                            utils.check_vertical_coordinate.
+
+        Dimensions returned are (time,level,lat,lon).
+        """
+        targets = self.get_level_values(level)
+        idx, wgt = self.get_vertical_weights(coords,targets,tidx,
+                                                lonidx,latidx)
+        datain = self.get(vrbl,utc=tidx,lons=lonidx,lats=latidx)
+        dataout = interp.apply_weights(datain,idx,wgt)
+        return dataout
+
+    def get_level_values(self,level):
+        """
+        Convert level string(s) such as '4000m', '3km' or '320K'
+        to a list of values in metres or Kelvin.
+        """
+        if isinstance(level,(list,tuple,N.ndarray)):
+            levels = level
+        else:
+            levels = [level,]
+
+        values = []
+        for lv in levels:
+            if lv.endswith('km'):
+                values.append(1000.0*float(lv[:-2]))
+            elif lv.endswith('m') or lv.endswith('K'):
+                values.append(float(lv[:-1]))
+            else:
+                print("Use XXXm, XXXkm or XXXK for level.")
+                raise Exception
+        return values
+
+    def get_vertical_weights(self,coords,targets,tidx,lonidx,latidx,
+                                log=False):
+        """
+        Return column interpolation weights onto surface(s) of pressure
+        ('isobaric', Pa), height AGL ('geometric', m) or potential
+        temperature ('isentropic', K).
+
+        Weights are computed once per time and domain selection, then
+        reused for every variable interpolated onto the same surface.
+        """
+        key = (coords,tuple(N.atleast_1d(targets)),log,
+                self._selection_key(tidx),self._selection_key(lonidx),
+                self._selection_key(latidx))
+        if key in self.vweights:
+            self.vweights.move_to_end(key)
+            return self.vweights[key]
+
+        if coords == 'isobaric':
+            vc = self.get('pressure',utc=tidx,lons=lonidx,lats=latidx)
+        elif coords == 'geometric':
+            vc = (self.get('Z',utc=tidx,lons=lonidx,lats=latidx) -
+                    self.get('HGT',utc=tidx,lons=lonidx,lats=latidx))
+        elif coords == 'isentropic':
+            vc = self.get('theta',utc=tidx,lons=lonidx,lats=latidx)
+        else:
+            print("Can't interpolate to {0} levels.".format(coords))
+            raise Exception
+
+        weights = interp.column_weights(vc,targets,log=log)
+        self.vweights[key] = weights
+        if len(self.vweights) > self.vweights_max:
+            self.vweights.popitem(last=False)
+        return weights
+
+    def _selection_key(self,idx):
+        """
+        Return a hashable version of a time, level or lat/lon selection.
+        """
+        if isinstance(idx,N.ndarray):
+            return tuple(idx.flatten().tolist())
+        elif isinstance(idx,slice):
+            return (idx.start,idx.stop,idx.step)
+        elif isinstance(idx,list):
+            return tuple(idx)
+        elif isinstance(idx,dict):
+            return tuple(sorted(idx.items()))
+        else:
+            return idx
+
     def interp_to_p_fortran(self,config,nc_path,var,lv):
         """ Uses p_interp fortran code to put data onto a pressure
         level specified.
@@ -1223,6 +1724,10 @@ class WRFOut(NC):
         """
         Returns array the same shape as WRF domain.
 
+        Every cross-section of the swath is handled at once: the gust
+        front is found along each section, and cold pool depth or
+        strength computed for all points behind it.
+
         X   :   cross-section object with given path
                 This path goes front-to-back through a bow
         km  :   width in the line-normal direction
@@ -1231,73 +1736,135 @@ class WRFOut(NC):
 
         # Set up slices
         tidx = self.get_time_idx(time)
-        lvidx = False
-        lonidx = False
-        latidx = False
 
         # Get wind data
-        wind10 = self.get('wind10',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        T2 = self.get('T2',tidx,lvidx,lonidx,latidx)[0,0,:,:]
+        wind10 = self.get('wind10',tidx,0,None,None)[0,0,:,:]
+        T2 = self.get('T2',tidx,0,None,None)[0,0,:,:]
 
         # This is the 2D plane for calculation data
         coldpooldata = N.zeros(wind10.shape)
 
-        # Compute required C2 fields to save time
-        dpt = self.get('dpt',tidx,lvidx,lonidx,latidx)[0,:,:,:]
-        Z = self.get('Z',tidx,lvidx,lonidx,latidx)[0,:,:,:]
-        HGT = self.get('HGT',tidx,lvidx,lonidx,latidx)[0,0,:,:]
+        dpt = self.get('dpt',tidx,None,None,None)[0,:,:,:]
+        Z = self.get('Z',tidx,None,None,None)[0,:,:,:]
+        HGT = self.get('HGT',tidx,None,None,None)[0,0,:,:]
         heights = Z-HGT
-        # pdb.set_trace()
 
-        if isinstance(env,collections.Sequence):
+        # All cross-sections (parallel), as (section, point), sampled
+        # with bilinear weights. X itself is not moved.
+        shifts = N.arange(1,swath_width+1) - swath_width/2
+        xx, yy = X.parallel_transects(shifts)
+        yidx, xidx, wgt = X.bilinear_weights(xx,yy)
+
+        def sample(data):
+            return utils.interp_points(data,yidx,xidx,wgt)
+
+        gfidx = self.find_gust_front(sample(wind10),sample(T2),X.angle)
+        behind = N.arange(xx.shape[1]) < gfidx[:,N.newaxis]
+
+        # Columns along every section: (level, section, point)
+        dpt_xs = sample(dpt)
+        if isinstance(env,collections.abc.Sequence):
             xx_env = N.arange(env[0]-2,env[0]+3)
             yy_env = N.arange(env[1]-2,env[1]+3)
-            dpt_env = N.mean(dpt[:,yy_env,xx_env],axis=1)
-
-        # All cross-sections (parallel)
-
-        # xxx = [X.xx,]
-        # yyy = [X.yy,]
-        X.translate_xs(-swath_width/2)
-        for n in range(swath_width):
-            print(("Cross section #{0}".format(n)))
-        # for xx, yy in zip(xxx, yyy):
-            X.translate_xs(1)
-            xx = X.xx
-            yy = X.yy
-            xx = xx.astype(int)
-            yy = yy.astype(int)
-            wind_slice = wind10[yy,xx]
-            T2_slice = T2[yy,xx]
-            slice_loc = self.find_gust_front(wind_slice,T2_slice,X.angle)
-
-            gfx = xx[slice_loc]
-            gfy = yy[slice_loc]
-            gf_pts = N.intersect1d(N.where(xx==gfx)[0],N.where(yy==gfy)[0])
-            gf_pt = gf_pts[int(len(gf_pts)/2.0)]
-            xx_cp = xx[:gf_pt]
-            yy_cp = yy[:gf_pt]
-            # pdb.set_trace()
-
-            # Compute enviromental dpt at each height
+            dpt_env = N.mean(dpt[:,yy_env,xx_env],axis=1)[:,N.newaxis,N.newaxis]
+        else:
             # Average all levels from the location of gust front
-            # forwards to the end of the cross-section.
-            if not env:
-                xx_env = xx[gf_pt+1:]
-                yy_env = yy[gf_pt+1:]
-                dpt_env = N.mean(dpt[:,yy_env,xx_env],axis=1)
-            # pdb.set_trace()
-
-            for x,y in zip(xx_cp,yy_cp):
-            #for x,y in zip(xx,yy):
-                if dz:
-                    coldpooldata[y,x] = self.compute_cpdz(x,y,dpt[:,y,x],heights[:,y,x],dpt_env)
-                    # pdb.set_trace()
-                else:
-                    coldpooldata[y,x] = N.sqrt(self.compute_C2(x,y,dpt[:,y,x],heights[:,y,x],dpt_env))
+            # forwards to the end of each cross-section.
+            ahead = N.broadcast_to(behind,dpt_xs.shape)
+            dpt_env = N.ma.array(dpt_xs,mask=ahead).mean(axis=2)
+            dpt_env = N.ma.getdata(dpt_env)[:,:,N.newaxis]
+
+        depth, C2 = self.cold_pool_columns(dpt_xs,sample(heights),dpt_env)
+
+        # Results go to the grid point nearest each section point
+        ny, nx = coldpooldata.shape
+        yi = N.clip(N.rint(yy),0,ny-1).astype(int)
+        xi = N.clip(N.rint(xx),0,nx-1).astype(int)
+        if dz:
+            coldpooldata[yi[behind],xi[behind]] = depth[behind]
+        else:
+            coldpooldata[yi[behind],xi[behind]] = N.sqrt(C2[behind])
 
         return coldpooldata
 
+    def cold_pool_columns(self,dpt,heights,dpt_env,thresh=-1.0):
+        """
+        Cold pool depth and C^2 (James et al. 2006 MWR) for any number
+        of columns at once.
+
+        The depth is the height of the highest level below the first
+        level (above the lowest) where the density potential temperature
+        perturbation exceeds thresh. C^2 is -2g times the vertical
+        integral of the fractional perturbation up to that depth,
+        from cumulative sums over the column.
+
+        dpt     :   density potential temperature, level as first axis
+        heights :   height AGL, the same shape as dpt
+        dpt_env :   environmental dpt, broadcastable to dpt
+
+        Returns depth (m) and C^2 (m^2/s^2), with the level axis removed.
+        """
+        dptp = dpt - dpt_env
+        frac = dptp/dpt_env
+        nz = dpt.shape[0]
+
+        warm = dptp[1:] > thresh
+        kd = N.where(warm.any(axis=0),warm.argmax(axis=0),nz-1)[N.newaxis,...]
+        depth = N.where(kd > 0,N.take_along_axis(heights,kd,axis=0),0.0)[0]
+
+        # Integral from the ground up to each level
+        layers = 0.5*(frac[1:]+frac[:-1])*N.diff(heights,axis=0)
+        integral = N.concatenate((frac[:1]*heights[:1],
+                        frac[:1]*heights[:1] + N.cumsum(layers,axis=0)),axis=0)
+        C2 = -2*mc.g*N.where(kd > 0,N.take_along_axis(integral,kd,axis=0),0.0)[0]
+        return depth, N.maximum(C2,0.0)
+
+    def cold_pool(self,tidx,lonidx,latidx,env=None):
+        """
+        Cold pool depth (m) and strength C (m/s) for every column and
+        time, processed in blocks of self.chunk_t times.
+
+        env :   (x,y) grid point; the environment is the mean of the
+                5x5 box around it. Default is the mean of the selection
+                at each level.
+
+        Returns:
+            5D array: (depth/C, time, 1, lat, lon).
+        """
+        key = ('cold_pool',self._selection_key(env),self._selection_key(tidx),
+                    self._selection_key(lonidx),self._selection_key(latidx))
+        out = self.cache.get(key)
+        if out is not None:
+            return out
+
+        times = self.time_indices(tidx)
+        blocks = []
+        for n in range(0,len(times),self.chunk_t):
+            t = times[n:n+self.chunk_t]
+            dpt = self.get('dpt',t,None,latidx,lonidx)
+            heights = (self.get('Z',t,None,latidx,lonidx) -
+                            self.get('HGT',t,None,latidx,lonidx))
+            if env is None:
+                dpt_env = dpt.mean(axis=(2,3),keepdims=True)
+            else:
+                box = (slice(env[1]-2,env[1]+3),slice(env[0]-2,env[0]+3))
+                dpt_env = self.get('dpt',t,None,*box).mean(axis=(2,3),
+                                            keepdims=True)
+            depth, C2 = self.cold_pool_columns(dpt.swapaxes(0,1),
+                            heights.swapaxes(0,1),dpt_env.swapaxes(0,1))
+            blocks.append(N.array((depth,N.sqrt(C2))))
+        out = N.concatenate(blocks,axis=1)[:,:,N.newaxis,...]
+        self.cache.put(key,out)
+        return out
+
+    def compute_cold_pool_depth(self,tidx,lvidx,lonidx,latidx,other):
+        env = other if other else None
+        return self.cold_pool(tidx,lonidx,latidx,env)[0]
+
+    def compute_cold_pool_strength(self,tidx,lvidx,lonidx,latidx,other):
+        env = other if other else None
+        return self.cold_pool(tidx,lonidx,latidx,env)[1]
+
     def compute_cpdz(self,x,y,dpt,heights,dpt_env):
         """
         Cold pool depth
@@ -1310,7 +1877,6 @@ class WRFOut(NC):
         """
 
         dz, zidx = self.cold_pool_depth(dpt,heights,dpt_env)
-        # import pdb; pdb.set_trace()
         return dz
 
     def compute_C2(self,x,y,dpt,heights,dpt_env):
@@ -1323,172 +1889,247 @@ class WRFOut(NC):
         heights :   height AGL slice
         dpt_env :   environmental dpt, column
         """
-
-        dz, zidx = self.cold_pool_depth(dpt,heights,dpt_env)
-        C2 = -2*mc.g*((dpt[zidx]-dpt_env[zidx])/dpt_env[zidx])*dz
-        # print("dpt = {0} ... dpt_env = {1} ... C2 = {2}".format(dpt[0],dpt_env[0],C2))
+        dz, C2 = self.cold_pool_columns(dpt,heights,dpt_env)
         return C2
 
     def cold_pool_depth(self,dpt,heights,dpt_env):
-        dz = 0
-        # thresh = -2.0
-        thresh = -1.0
-        for d,z, de in zip(dpt[1:],heights[1:],dpt_env[1:]):
-            dptp = d - de
-            if dptp > thresh:
-                break
-            dz = z
-
-        if isinstance(dz,float):
+        dz, C2 = self.cold_pool_columns(dpt,heights,dpt_env)
+        if dz > 0:
             zidx = N.where(heights==dz)[0]
         else:
             zidx = 0
-        # import pdb; pdb.set_trace()
         return dz, zidx
 
     def find_gust_front(self,wind_slice,T2_slice,angle,method=3):
         """
         Find location of maximum shear in the horizontal wind along a
-        1D slice.
+        1D slice, or along each row of 2D slices.
 
-        wind_slice      :   1D numpy array
+        wind_slice      :   numpy array, points along last axis
         T2_slice        :   temp 2m slice
         angle           :   angle of slice cross-section
         method          :   way to locate gust front
         """
+        npts = wind_slice.shape[-1]
 
-        shp = wind_slice.shape
-
-        # Compute gradient quantities
-        shear = N.zeros(shp)
-        T2grad = N.zeros(shp)
-
-        for n in range(shp[0]):
-            if n == 0 or n == shp[0]-1:
-                shear[n] = 0
-            else:
-                len1 = abs(self.dx / N.sin(angle))
-                len2 = abs(self.dx / N.cos(angle))
-                hyp = min((len1,len2))
-                # In kilometres:
-                shear[n] = ((wind_slice[n+1]-wind_slice[n-1])/(2*hyp))*1000.0
-                T2grad[n] = ((T2_slice[n+1]-T2_slice[n-1])/(2*hyp))*1000.0
-                # N.W.DX
-
-        # pdb.set_trace()
-
-        # Go from B to A
-        # Find first location where T2 drops and shear is ?
+        # Compute gradient quantities, zero at the ends
+        len1 = abs(self.dx / N.sin(angle))
+        len2 = abs(self.dx / N.cos(angle))
+        hyp = min((len1,len2))
+        shear = N.zeros(wind_slice.shape)
+        T2grad = N.zeros(wind_slice.shape)
+        # In kilometres:
+        shear[...,1:-1] = ((wind_slice[...,2:]-wind_slice[...,:-2])/(2*hyp))*1000.0
+        T2grad[...,1:-1] = ((T2_slice[...,2:]-T2_slice[...,:-2])/(2*hyp))*1000.0
 
         if method==1:
             ### METHOD 1: USING THRESHOLDS
-            # By default
-            gfidx = shp/2
-            for n, s, t in zip(list(range(shp))[::-1],shear[::-1],T2grad[::-1]):
-                if (abs(s)>2.0) and (t<2.0):
-                    gfidx = n
-                    break
+            # Last point where T2 drops and shear is large; default midway
+            cond = (abs(shear)>2.0) & (T2grad<2.0)
+            last = npts - 1 - cond[...,::-1].argmax(axis=-1)
+            gfidx = N.where(cond.any(axis=-1),last,npts//2)
 
         elif method==2 or method==3:
 
             ### METHOD 2: FINDING MAX GRADIENTS AND AVERAGING
-            shear = abs(shear)
-            T2grad = abs(T2grad)
-
-            xsh_idx = N.where(shear == shear.max())[0][0]
-            xtg_idx = N.where(T2grad == T2grad.max())[0][0]
-            print(("Max shear loc: {0} ... max tempgrad loc: {1}".format(xsh_idx,xtg_idx)))
+            xsh_idx = abs(shear).argmax(axis=-1)
+            xtg_idx = abs(T2grad).argmax(axis=-1)
 
             if method==2:
-                gfidx = int((xsh_idx + xtg_idx)/2.0)
+                gfidx = ((xsh_idx + xtg_idx)/2.0).astype(int)
             else:
-                gfidx = max([xsh_idx,xtg_idx])
+                gfidx = N.maximum(xsh_idx,xtg_idx)
 
+        if wind_slice.ndim == 1:
+            return int(gfidx)
         return gfidx
-        # maxshearloc[0][0] returns the integer
 
     def compute_frontogenesis(self,time,level):
         """
-        Note that all variables fetched with self.get have been
-        destaggered and are at the same location.
+        Frontogenesis at one time, as a 2D array (see
+        return_frontogenesis). Returns None at the first and last
+        time of the file, where there is no centred time derivative.
+
+        :param level:       pressure level in hPa (e.g. 850), or 2000 for
+                            the lowest model levels.
+        :type level:        int
+        """
+        tidx = int(self.get_time_idx(time)[0])
+        if (tidx == 0) or (tidx == self.t_dim-1):
+            return None
+        if level == 2000:
+            level = '2000hPa'
+        return self.get('frontogenesis',utc=tidx,level=level)[0,0,...]
+
+    def frontogenesis_fields(self,tidx,level,lonidx,latidx,dp=15):
+        """
+        Fields needed for frontogenesis at a block of times.
+
+        :param level:       pressure level (e.g. '850hPa' or 850) or
+                            model level index. Index 0 is treated as 1
+                            so there is a level below.
+        :param dp:          half-depth in hPa of the layer used for
+                            vertical derivatives on pressure levels.
+        :returns:           gradtheta (time,3,lat,lon) -- magnitude of the
+                            horizontal theta gradient below, at and
+                            above the level; U, V, omega (Pa/s) and the
+                            pressure difference (Pa) across the three
+                            levels (time,lat,lon).
+        """
+        if isinstance(level,str) or (level >= 100):
+            hPa = int(level.split('h')[0]) if isinstance(level,str) else level
+            TH = self.get_p('theta',tidx,[hPa+dp,hPa,hPa-dp],lonidx,latidx)
+            U = self.get_p('U',tidx,hPa,lonidx,latidx)[:,0,...]
+            V = self.get_p('V',tidx,hPa,lonidx,latidx)[:,0,...]
+            W = self.get_p('W',tidx,hPa,lonidx,latidx)[:,0,...]
+            P = 100.0*hPa
+            dP = -200.0*dp
+        else:
+            k = max(int(level),1)
+            # An array of indices; create_slice reads every level for a list
+            levs = N.arange(k-1,k+2)
+            TH = self.get('theta',tidx,levs,latidx,lonidx)
+            Ps = self.get('pressure',tidx,levs,latidx,lonidx)
+            U = self.get('U',tidx,k,latidx,lonidx)[:,0,...]
+            V = self.get('V',tidx,k,latidx,lonidx)[:,0,...]
+            W = self.get('W',tidx,k,latidx,lonidx)[:,0,...]
+            P = Ps[:,1,...]
+            dP = Ps[:,2,...] - Ps[:,0,...]
+
+        drybulb = TH[:,1,...]*(P/mc.P0)**(mc.Rd/mc.cp)
+        omega = -(P/(mc.Rd*drybulb)) * mc.g * W
+
+        if 'MAPFAC_M' in self.fields:
+            mapfac = self.get('MAPFAC_M',tidx,None,latidx,lonidx)
+        else:
+            mapfac = 1.0
+        dTHdy, dTHdx = N.gradient(TH,self.dy,self.dx,axis=(-2,-1))
+        gradtheta = mapfac*N.hypot(dTHdx,dTHdy)
+        return gradtheta, U, V, omega, dP*N.ones_like(U)
+
+    def return_frontogenesis(self,tidx,lvidx,lonidx,latidx,other):
+        """
+        Lagrangian rate of change of the horizontal potential
+        temperature gradient on a pressure or model level,
+        d|grad theta|/dt + u d/dx + v d/dy + omega d/dp,
+        in K/m/s.
+
+        Times are processed in blocks of self.chunk_t with a sliding
+        window: the last two times of each block are kept for the next,
+        so each time's fields are interpolated once. Time derivatives
+        are centred, except one-sided at the start and end of the file.
+        """
+        if (lvidx is None) or isinstance(lvidx,(list,tuple,N.ndarray)):
+            raise Exception("Frontogenesis needs one pressure or model level.")
+        times = self.time_indices(tidx)
+        lo = max(int(times.min())-1,0)
+        hi = min(int(times.max())+2,self.t_dim)
+        if hi - lo < 2:
+            raise Exception("Frontogenesis needs at least two times.")
+
+        want = set(int(t) for t in times)
+        front = {}
+        carry = None
+        for a in range(lo,hi,self.chunk_t):
+            b = min(a+self.chunk_t,hi)
+            block = self.frontogenesis_fields(slice(a,b),lvidx,lonidx,latidx)
+            if carry is None:
+                buf, bt = block, N.arange(a,b)
+            else:
+                buf = [N.concatenate((c,x),axis=0) for c,x in zip(carry,block)]
+                bt = N.arange(a-carry[0].shape[0],b)
+            if len(bt) < 2:
+                continue
+            carry = [x[-2:] for x in buf]
 
-        Output:
-        Front       :   Frontgenesis in Kelvin per second.
+            gradtheta, U, V, omega, dP = buf
+            g = gradtheta[:,1,...]
+            dgdt = N.gradient(g,self.utc[bt],axis=0)
+            dgdy, dgdx = N.gradient(g,self.dy,self.dx,axis=(-2,-1))
+            if 'MAPFAC_M' in self.fields:
+                mapfac = self.get('MAPFAC_M',slice(bt[0],bt[-1]+1),None,
+                                    latidx,lonidx)[:,0,...]
+                dgdx, dgdy = dgdx*mapfac, dgdy*mapfac
+            dgdp = (gradtheta[:,2,...] - gradtheta[:,0,...])/dP
+            F = dgdt + U*dgdx + V*dgdy + omega*dgdp
+
+            for i,t in enumerate(bt):
+                centred = 0 < i < len(bt)-1
+                if (t in want) and (centred or t in (0,self.t_dim-1)):
+                    front[t] = F[i]
+        return N.array([front[int(t)] for t in times])[:,N.newaxis,...]
+
+    @property
+    def times64(self):
+        """Output times as numpy datetime64.
         """
-        # import pdb; pdb.set_trace()
-        #ds = 1 # Number of grid point to compute horizontal gradient over
-        #dx = ds
-        #dy = ds
-        #dz = 1 # Normal for vertical
-        tidx = self.get_time_idx(time)
-        tidxs = (tidx-1,tidx,tidx+1)
+        return self.utc.astype(N.int64).astype('datetime64[s]')
 
-        if (tidx == 0) or (tidx == self.wrf_times.shape[0]-1):
-            Front = None
-        else:
-            nt,nl,ny,nx = self.get('U',utc=tidx,level=1).shape
-            U = N.zeros([3,3,ny,nx])
-            V = N.zeros_like(U)
-            W = N.zeros_like(U)
-            T = N.zeros_like(U)
-            if level == 2000:
-                # Use the bottom three model levels
-                P = N.zeros_like(U)
-                for n, t in enumerate(tidxs):
-                    U[n,...] = self.get('U',utc=t,level=1)
-                    V[n,...] = self.get('V',utc=t,level=1)
-                    W[n,...] = self.get('W',utc=t,level=1)
-                    T[n,...] = self.get('T',utc=t,level=N.arange(3))
-                    P[n,...] = self.get('pressure',utc=t,level=N.arange(3))
-                    # Average different in pressure between model levels
-                    # This field is passed into the gradient
-                    # THIS IS NOT USED RIGHT NOW
-                    dp = N.average(abs(0.5*(0.5*(P[2,2,:,:]-P[2,0,:,:]) +
-                                0.5*(P[0,2,:,:]-P[0,0,:,:]))))
-
-            elif isinstance(level,int):
-                dp = 15 # hPa to compute vertical gradients
-
-                for n, t in enumerate(tidxs):
-                    U[n,...] = self.get_p('U',t,level)
-                    V[n,...] = self.get_p('V',t,level)
-                    W[n,...] = self.get_p('W',t,level)
-
-                    # 3D array has dimensions (vertical, horz, horz)
-                    T[n,...] = self.get_p('T',t,(level-dp,level,level+dp))
-
-                    # Compute omega
-                    # P = rho* R* drybulb
-                    # drybulb = T/((P0/P)^(R/cp)
-
-            drybulb = 273.15 + (T/((100000.0/(level*100.0))**(mc.R/mc.cp)))
-            rho = (level*100.0)/(mc.R*drybulb)
-            omega = -rho * mc.g * W
-
-            # Time difference in sec
-            dt = self.utc[tidx+1]-self.utc[tidx]
-            dTdt, dTdz, dTdy, dTdx = N.gradient(T,dt,dp*100.0,self.dy, self.dx)
-            # Gradient part
-            grad = (dTdx**2 + dTdy**2)**0.5
-            # Full derivative - value wrong for dgraddz here
-            dgraddt, dgraddz, dgraddy, dgraddx = N.gradient(grad,dt,dp*100.0,self.dy, self.dx)
-            # Full equation
-            Front = dgraddt[1,1,:,:] + U[1,1,:,:]*dgraddx[1,1,:,:] + V[1,1,:,:]*dgraddy[1,1,:,:] # + omega[1,1,:,:]*dgraddz[1,1,:,:]
-        return Front
-
-    def compute_accum_rain(self,utc,accum_hr):
-        """
-        Needs to be expanded to include other precip
+    def cumulative_precip(self,ptype='total',utc=None,lats=None,lons=None,
+                            Nlim=None,Elim=None,Slim=None,Wlim=None):
+        """
+        Precipitation (mm) accumulated since the start of the simulation.
+        Each field is read once for all requested times, and bucket
+        counters (I_RAINNC etc.) are added back if present.
+
+        :param ptype:       'total' (RAINNC+RAINC), 'rainnc', 'snow' or
+                            'graupel'. See precip.PRECIP_FIELDS.
+        :type ptype:        str
+
+        Other arguments are as for get().
+
+        :returns:           N.ndarray -- 4D (time,1,lat,lon)
+        """
+        fields = [f for f in precip.PRECIP_FIELDS[ptype] if f in self.fields]
+        if not fields:
+            raise Exception("No {0} precipitation fields in {1}".format(
+                                ptype,self.fpath))
+        buckets = [precip.BUCKET_FIELDS[f] for f in fields
+                    if precip.BUCKET_FIELDS.get(f) in self.fields]
+        bucket_mm = getattr(self.nc,'BUCKET_MM',-1) if buckets else -1
+        if bucket_mm <= 0:
+            buckets = []
+
+        # Differences of large totals need double precision
+        data = self.get_many(fields+buckets,utc=utc,lats=lats,lons=lons,
+                        Nlim=Nlim,Elim=Elim,Slim=Slim,Wlim=Wlim,
+                        dtype=N.float64)
+        total = sum(data[f] for f in fields)
+        for b in buckets:
+            total = total + bucket_mm*data[b]
+        return total
+
+    def accumulated(self,window,ptype='total',lats=None,lons=None,
+                        Nlim=None,Elim=None,Slim=None,Wlim=None):
+        """
+        Precipitation over a window ending at every output time, from
+        a single read of the cumulative fields.
+
+        :param window:      length of window in hours, or name such as
+                            '06h' (as for StageIV).
+        :type window:       int,str
+
+        Other arguments are as for cumulative_precip().
+
+        :returns:           N.ndarray -- 4D (time,1,lat,lon). NaN where
+                            the window starts before the first output.
+        """
+        cumul = self.cumulative_precip(ptype,lats=lats,lons=lons,
+                        Nlim=Nlim,Elim=Elim,Slim=Slim,Wlim=Wlim)
+        return precip.rolling_accum(cumul,self.times64,window)
+
+    def compute_accum_rain(self,utc,accum_hr,ptype='total'):
+        """
+        Precipitation over accum_hr hours ending at utc.
+
+        :returns:           N.ndarray -- 4D (1,1,lat,lon)
         """
         dn = utils.ensure_datenum(utc)
-        idx0 = self.get_time_idx(dn-(3600*accum_hr))
-        idx1 = self.get_time_idx(dn)
-        # range_idx = range(start_idx,end_idx+1)
-        total0 = (self.get('RAINNC',utc=idx0) +
-                    self.get('RAINC',utc=idx0))
-        total1 = (self.get('RAINNC',utc=idx1) +
-                    self.get('RAINC',utc=idx1))
-        accum = total1 - total0
+        tidx = N.concatenate((self.get_time_idx(dn-(3600*accum_hr)),
+                                self.get_time_idx(dn)))
+        # Both times in one read
+        total = self.cumulative_precip(ptype,utc=tidx)
+        accum = total[1:] - total[:1]
         return accum
 
     def compute_satvappres(self,tidx,lvidx,lonidx,latidx,other):
@@ -1519,106 +2160,132 @@ class WRFOut(NC):
             Td =+ 273.15
         return Td
 
-    def compute_derivatives(self,U,V,axis=None):
-        dargs = (self.dx,self.dx)
-        dkwargs = {'axis':None}
-        if len(U.shape) == 2:
-            dudx, dudy = N.gradient(U,self.dx,self.dx)
-            dvdx, dvdy = N.gradient(V,self.dx,self.dx)
-        elif len(U.shape) == 3:
-            nt = U.shape[0]
-            dudx = N.zeros_like(U)
-            dvdx = N.zeros_like(U)
-            dudy = N.zeros_like(U)
-            dvdy = N.zeros_like(U)
-            for t in range(nt):
-                dudx[t,...], dudy[t,...] = N.gradient(U[t,...],self.dx,self.dx)
-                dvdx[t,...], dvdy[t,...] = N.gradient(V[t,...],self.dx,self.dx)
+    def compute_derivatives(self,U,V,mapfac=None):
+        """
+        Horizontal derivatives of a wind field, in one pass over every
+        time and level.
+
+        :param U,V:         wind components, with latitude and longitude
+                            as the last two dimensions (any others,
+                            e.g. time and level, are leading).
+        :type U,V:          N.ndarray
+        :param mapfac:      map scale factor (MAPFAC_M), broadcastable to
+                            U. Converts grid distance to distance on
+                            the earth. Default is 1.
+        :type mapfac:       N.ndarray
+        :returns:           dudx, dudy, dvdx, dvdy
+        """
+        axes = (U.ndim-2,U.ndim-1)
+        dudy, dudx = N.gradient(U,self.dy,self.dx,axis=axes)
+        dvdy, dvdx = N.gradient(V,self.dy,self.dx,axis=axes)
+        if mapfac is not None:
+            dudx, dudy, dvdx, dvdy = [d*mapfac for d in (dudx,dudy,dvdx,dvdy)]
         return dudx, dudy, dvdx, dvdy
 
+    def compute_kinematics(self,U,V,mapfac=None):
+        """
+        Vorticity, divergence and deformation from one set of
+        derivatives (see compute_derivatives()).
+
+        :returns:           dict of arrays with keys 'vorticity',
+                            'divergence', 'stretch', 'shear' and
+                            'deformation' (total).
+        """
+        dudx, dudy, dvdx, dvdy = self.compute_derivatives(U,V,mapfac)
+        kin = {}
+        kin['vorticity'] = dvdx - dudy
+        kin['divergence'] = dudx + dvdy
+        kin['stretch'] = dudx - dvdy
+        kin['shear'] = dudy + dvdx
+        kin['deformation'] = (kin['stretch']**2 + kin['shear']**2)**0.5
+        return kin
+
+    def kinematics(self,tidx,lvidx,lonidx,latidx,wind='U'):
+        """
+        Kinematic fields of the 3D (wind='U') or 10 m (wind='U10') wind
+        at a selection, with map factors applied. Cached, so the
+        diagnostics below share one set of derivatives.
+
+        :returns:           dict -- see compute_kinematics()
+        """
+        names = ('vorticity','divergence','stretch','shear','deformation')
+        key = ('kinematics',wind,self._selection_key(tidx),
+                    self._selection_key(lvidx),self._selection_key(lonidx),
+                    self._selection_key(latidx))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return dict(zip(names,cached))
+
+        U = self.get(wind,tidx,lvidx,latidx,lonidx)
+        V = self.get(wind.replace('U','V'),tidx,lvidx,latidx,lonidx)
+        if 'MAPFAC_M' in self.fields:
+            mapfac = self.get('MAPFAC_M',tidx,None,latidx,lonidx)
+        else:
+            mapfac = None
+        kin = self.compute_kinematics(U,V,mapfac)
+        self.cache.put(key,N.array([kin[k] for k in names]))
+        return kin
+
     def compute_stretch_deformation(self,U,V):
-        dudx, dudy, dvdx, dvdy = self.compute_derivatives(U,V)
-        Est = dudx - dvdy
-        return Est
+        return self.compute_kinematics(U,V)['stretch']
 
     def compute_shear_deformation(self,U,V):
-        dudx, dudy, dvdx, dvdy = self.compute_derivatives(U,V)
-        Esh = dudy + dvdx
-        return Esh
+        return self.compute_kinematics(U,V)['shear']
 
     def compute_total_deformation(self,U,V):
-        Esh = self.compute_shear_deformation(U,V)
-        Est = self.compute_stretch_deformation(U,V)
-        E = (Est**2 + Esh**2)**0.5
-        return E
+        return self.compute_kinematics(U,V)['deformation']
 
     def compute_vorticity(self,U,V):
-        # Axis = 1 for vertical vorticity, if there's no time selected?
-        dudx, dudy, dvdx, dvdy = self.compute_derivatives(U,V,)#axis=1)
-        zeta = dvdx - dudy
-        return zeta
+        return self.compute_kinematics(U,V)['vorticity']
+
+    def compute_divergence(self,U,V):
+        return self.compute_kinematics(U,V)['divergence']
 
     def return_vorticity(self,tidx,lvidx,lonidx,latidx,other):
-        # pdb.set_trace()
-        U = self.get('U',tidx,lvidx,lonidx,latidx)[:,0,:,:]
-        V = self.get('V',tidx,lvidx,lonidx,latidx)[:,0,:,:]
-        zeta = self.compute_vorticity(U,V)
-        return zeta
+        return self.kinematics(tidx,lvidx,lonidx,latidx)['vorticity']
+
+    def return_divergence(self,tidx,lvidx,lonidx,latidx,other):
+        return self.kinematics(tidx,lvidx,lonidx,latidx)['divergence']
+
+    def return_deformation(self,tidx,lvidx,lonidx,latidx,other):
+        return self.kinematics(tidx,lvidx,lonidx,latidx)['deformation']
 
     def compute_fluid_trapping_diagnostic(self,tidx,lvidx,lonidx,latidx,other):
-        U = self.get('U10',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        V = self.get('V10',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        E = self.compute_total_deformation(U,V)
-        zeta = self.compute_vorticity(U,V)
-        omega2 = 0.25*(E**2 - zeta**2)
+        kin = self.kinematics(tidx,lvidx,lonidx,latidx,wind='U10')
+        omega2 = 0.25*(kin['deformation']**2 - kin['vorticity']**2)
         return omega2
 
-    def compute_divergence(self,U,V):
-        dudx, dudy, dvdx, dvdy = self.compute_derivatives(U,V)
-        div = dudx + dvdy
-        return div
-
     def compute_instantaneous_local_Lyapunov(self,tidx,lvidx,lonidx,latidx,other):
-        # import pdb; pdb.set_trace()
-        U = self.get('U',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        V = self.get('V',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        E = self.compute_total_deformation(U,V)
-        zeta = self.compute_vorticity(U,V)
-        div = self.compute_divergence(U,V)
-        EzArr = (E**2  - zeta**2)**0.5
+        kin = self.kinematics(tidx,lvidx,lonidx,latidx)
+        with N.errstate(invalid='ignore'):
+            EzArr = (kin['deformation']**2 - kin['vorticity']**2)**0.5
         Ez_nonan = N.nan_to_num(EzArr)
-        # D =  0.5*(div + (E**2  - zeta**2)**0.5)
-        D =  0.5*(div + Ez_nonan)
-        # import pdb; pdb.set_trace()
+        D =  0.5*(kin['divergence'] + Ez_nonan)
         return D
 
     def return_axis_of_dilatation_components(self,tidx,lvidx=False,lonidx=False,
                                                 latidx=False,other=False):
-        U = self.get('U10',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        V = self.get('V10',tidx,lvidx,lonidx,latidx)[0,0,:,:]
-        Esh = self.compute_shear_deformation(U,V)
-        Est = self.compute_stretch_deformation(U,V)
-        E = self.compute_total_deformation(U,V)
-        zeta = self.compute_vorticity(U,V)
-
-        psi1 = 0.5 * N.arctan2(Esh,Est)
+        # First time only, as 2D arrays for plotting
+        kin = {k:v[0,0,...] for k,v in self.kinematics(tidx,lvidx,lonidx,
+                                    latidx,wind='U10').items()}
+        psi1 = 0.5 * N.arctan2(kin['shear'],kin['stretch'])
         # chi1 = psi1 + 0.5*N.nan_to_num(N.arcsin(zeta/E))
-        chi1 = psi1 + 0.5*(N.arcsin(zeta/E))
+        chi1 = psi1 + 0.5*(N.arcsin(kin['vorticity']/kin['deformation']))
 
         return N.cos(chi1), N.sin(chi1)
 
     def compute_omega(self,tidx,lvidx,lonidx,latidx,other):
         # Rising motion in Pa/s
         # dp/dt of air parcel
-        W = self.get('W',tidx,lvidx,lonidx,latidx)[0,:,:,:]
-        rho = self.get('density',tidx,lvidx,lonidx,latidx)[0,:,:,:]
+        W = self.get('W',tidx,lvidx,latidx,lonidx)[0,:,:,:]
+        rho = self.get('density',tidx,lvidx,latidx,lonidx)[0,:,:,:]
         omega = -rho * -mc.g * W # I think it's meant to be minus g?
         # import pdb; pdb.set_trace()
         return omega
 
     def compute_density(self,tidx,lvidx,lonidx,latidx,other):
-        drybulb = self.get('drybulb',tidx,lvidx,lonidx,latidx,other='K')
-        P = self.get('pressure',tidx,lvidx,lonidx,latidx)
+        drybulb = self.get('drybulb',tidx,lvidx,latidx,lonidx,other='K')
+        P = self.get('pressure',tidx,lvidx,latidx,lonidx)
         rho = P/(mc.R*drybulb)
         # drybulb = 273.15 + (T/((100000.0/(level*100.0))**(mc.R/mc.cp)))
         return rho
@@ -42,48 +42,83 @@ class CrossSection(Figure):
     
         self.get_xs_slice()
 
+    def shift_direction(self):
+        """
+        Grid-point step (x,y) for translating the cross-section one point
+        up or down. For simplicity with grid spacing, the logic allows for
+        45 degree translation only.
+        """
+        angle = N.degrees(self.angle)
+        if (angle > 0.0) and (angle < 22.5):
+            return -1, 0
+        elif (angle > 22.5) and (angle < 67.5):
+            return -1, 1
+        elif (angle > 67.5) and (angle < 112.5):
+            return 0, 1
+        elif (angle > 112.5) and (angle < 157.5):
+            return 1, 1
+        elif (angle > 157.5) and (angle < 202.5):
+            return 1, 0
+        elif (angle > 202.5) and (angle < 247.5):
+            return 1, -1
+        elif (angle > 247.5) and (angle < 292.5):
+            return 0, -1
+        elif (angle > 292.5) and (angle < 337.5):
+            return -1, -1
+        elif (angle > 337.5) and (angle < 360.0):
+            return -1, 0
+        else:
+            print(("Angle {0} is weird.".format(angle)))
+            raise Exception
+
     def translate_xs(self,sh):
         """
         Translate the cross-section up or down a certain number of
         points.
-        For simplicity with grid spacing, the logic allows for
-        45 degree translation only.
         
         sh  :   number of points to shift
         """
-        self.angle = N.degrees(self.angle) 
-        if (self.angle > 0.0) and (self.angle < 22.5):
-            shxa = -sh; shxb = -sh; shya = 0;  shyb = 0
-        elif (self.angle > 22.5) and (self.angle < 67.5):
-            shxa = -sh; shxb = -sh; shya = sh;  shyb = sh
-        elif (self.angle > 67.5) and (self.angle < 112.5):
-            shxa = 0; shxb = 0; shya = sh;  shyb = sh
-        elif (self.angle > 112.5) and (self.angle < 157.5):
-            shxa = sh; shxb = sh; shya = sh;  shyb = sh
-        elif (self.angle > 157.5) and (self.angle < 202.5):
-            shxa = sh; shxb = sh; shya = 0;  shyb = 0
-        elif (self.angle > 202.5) and (self.angle < 247.5):
-            shxa = sh; shxb = sh; shya = -sh;  shyb = -sh
-        elif (self.angle > 247.5) and (self.angle < 292.5):
-            shxa = 0; shxb = 0; shya = -sh;  shyb = -sh
-        elif (self.angle > 292.5) and (self.angle < 337.5):
-            shxa = -sh; shxb = -sh; shya = -sh;  shyb = -sh
-        elif (self.angle > 337.5) and (self.angle < 360.0):
-            shxa = -sh; shxb = -sh; shya = 0;  shyb = 0
-        else:
-            print(("Angle {0} is weird.".format(self.angle)))
-            raise Exception
-            
+        shx, shy = self.shift_direction()
         print(("Old coordinates:",self.xA,self.xB,self.yA,self.yB))
-        self.xA += shxa
-        self.xB += shxb
-        self.yA += shya
-        self.yB += shyb
+        self.xA += sh*shx
+        self.xB += sh*shx
+        self.yA += sh*shy
+        self.yB += sh*shy
         self.xx = N.linspace(self.xA,self.xB,self.hyp_pts)
         self.yy = N.linspace(self.yA,self.yB,self.hyp_pts)
+        self.weights = self.bilinear_weights(self.xx,self.yy)
         print(("New coordinates:",self.xA,self.xB,self.yA,self.yB))
 
-        self.angle = N.radians(self.angle) 
+    def parallel_transects(self,shifts):
+        """
+        Points of many cross-sections parallel to this one, without
+        moving it.
+
+        shifts  :   numbers of points to shift each (see translate_xs)
+
+        Returns x and y arrays with shape (transect, point).
+        """
+        shx, shy = self.shift_direction()
+        shifts = N.atleast_1d(shifts)[:,N.newaxis]
+        return self.xx + shifts*shx, self.yy + shifts*shy
+
+    def linenormal_transects(self,along=None,length_pts=3):
+        """
+        Points of cross-sections normal to this one, centred on points
+        along it.
+
+        along       :   indices of the centre points along this
+                        cross-section. Default is every point.
+        length_pts  :   half-length of normal lines in grid points
+
+        Returns x and y arrays with shape (transect, point).
+        """
+        if along is None:
+            along = N.arange(self.hyp_pts)
+        s = N.arange(-length_pts,length_pts+1)
+        xx = self.xx[along,N.newaxis] - s*N.sin(self.angle)
+        yy = self.yy[along,N.newaxis] + s*N.cos(self.angle)
+        return xx, yy
 
     def get_xs_slice(self):
         self.xA, self.yA = self.get_xy_from_latlon(self.latA,self.lonA)
@@ -93,10 +128,11 @@ class CrossSection(Figure):
         self.yy = N.linspace(self.yA,self.yB,self.hyp_pts)
         # self.angle = N.radians(90.0) + N.arctan((self.yy[0]-self.yy[-1])/(self.xx[-1]-self.xx[0]))
         # self.angle = N.math.atan2((self.yy[-1]-self.yy[0]),(self.xx[-1]-self.xx[0])) + N.pi
-        self.angle = N.math.atan2((self.yy[0]-self.yy[-1]),(self.xx[0]-self.xx[-1])) + N.pi
+        self.angle = N.arctan2((self.yy[0]-self.yy[-1]),(self.xx[0]-self.xx[-1])) + N.pi
         # print('angle = ',self.angle)
         # self.angle = N.math.atan2((self.yy[0]-self.yy[-1]),(self.xx[0]-self.xx[-1])) + N.pi
         # pdb.set_trace()
+        self.weights = self.bilinear_weights(self.xx,self.yy)
         return
     
     def popup_transect(self):
@@ -138,177 +174,147 @@ class CrossSection(Figure):
 
     def get_xy_from_latlon(self,lat,lon):
         """
-        Return x and y coordinates for given lat/lon.
-
-        exactlat, exactlon      :   exact coordinates of closest x/y
+        Return x and y coordinates for given lat/lon (scalars or
+        arrays), from the grid's spatial index.
         """
-        y,x,exactlat,exactlon = utils.getXY(self.W.lats1D,self.W.lons1D,lat,lon)
+        y,x = self.W.get_latlon_idx(lat,lon)
         return x,y
 
-    def get_wrfout_slice(self,vrbl,utc=False,level=False,x=False,y=False):
-        data = self.W.get(vrbl,utc=utc,level=level)
-        sliced = data[:,:,y,x]
-        return sliced
+    def bilinear_weights(self,xx,yy):
+        """
+        Bilinear interpolation weights for points at (fractional) grid
+        coordinates xx, yy of any shape. Compute once per transect and
+        reuse for every variable and time.
 
-    def get_height(self,t,x,y,z,pts):
+        Returns yidx, xidx, wgt: arrays with shape (...,4), for use with
+        utils.interp_points.
         """
-        Return terrain heights along cross-section
-        
-        TODO: What's the diff between the outputs?
+        ny, nx = self.W.y_dim, self.W.x_dim
+        x = N.clip(N.asarray(xx,dtype=float),0,nx-1)
+        y = N.clip(N.asarray(yy,dtype=float),0,ny-1)
+        x0 = N.minimum(N.floor(x).astype(int),nx-2)
+        y0 = N.minimum(N.floor(y).astype(int),ny-2)
+        fx = x-x0
+        fy = y-y0
+        yidx = N.stack((y0,y0,y0+1,y0+1),axis=-1)
+        xidx = N.stack((x0,x0+1,x0,x0+1),axis=-1)
+        wgt = N.stack(((1-fy)*(1-fx),(1-fy)*fx,fy*(1-fx),fy*fx),axis=-1)
+        return yidx, xidx, wgt
+
+    def get_xs_data(self,vrbl,utc=None,level=None,weights=None):
+        """
+        Data along the cross-section(s). Only the box bounding the
+        transect points is read from the file.
 
-        Inputs:
-        t       :   time index as int
-        x       :   x indices, as int
-        y       :   y imdices, as int
-        z       :   number of levels, as int
-        pts     :   number of points along the x-sec
+        vrbl    :   variable, or 'parawind'/'perpwind' for the wind
+                    parallel/perpendicular to the cross-section
+        weights :   from bilinear_weights(); default is this
+                    cross-section.
 
-        Outputs:
-        terrain_z   :   ter0,rain height
-        heighthalf  :   who knows?
+        Returns array (time, level, [transect,] point).
+        """
+        if weights is None:
+            weights = self.weights
+        yidx, xidx, wgt = weights
+        ysl = slice(int(yidx.min()),int(yidx.max())+1)
+        xsl = slice(int(xidx.min()),int(xidx.max())+1)
+
+        if vrbl in ('parawind','perpwind'):
+            u = self.W.get('U',utc,level,ysl,xsl)
+            v = self.W.get('V',utc,level,ysl,xsl)
+            if vrbl == 'parawind':
+                data = N.cos(self.angle)*u + N.sin(self.angle)*v
+            else:
+                # Note the negative here. I think it's alright? TODO
+                data = -N.cos(self.angle)*v + N.sin(self.angle)*u
+        else:
+            data = self.W.get(vrbl,utc,level,ysl,xsl)
+        return utils.interp_points(data,yidx-ysl.start,xidx-xsl.start,wgt)
 
-        Assuming t=0
+    def get_height(self,t,weights=None):
         """
-        # TODO: change API of W.get()
-        # geopot = self.W.get('geopot',utc=t,lats=y,lons=x)
-        geopot = N.swapaxes(self.get_wrfout_slice('geopot',utc=t,y=y,x=x)[0,:,:],1,0) # 2D
-        
-        # dryairmass = self.W.get('dryairmass',utc=t,lats=y,lons=x)
-        dryairmass = self.get_wrfout_slice('dryairmass',utc=t,y=y,x=x)[0,0,:] #1D
-        znu = self.W.get('ZNU',utc=t)[0,:,0,0] # 1D
-        znw = self.W.get('ZNW',utc=t)[0,:,0,0] # 1D
-
-        heighthalf = N.zeros((pts,z))
-        for i in range(pts):
-            pfull = dryairmass[i] * znw[:]+self.W.P_top
-            phalf = dryairmass[i] * znu[:]+self.W.P_top
-            for k in range(z):
-                # import pdb; pdb.set_trace()
-                heighthalf[i,k] = self.interp(geopot[i,:],pfull[:],phalf[k])/mc.g
-
-        terrain_z = geopot[:]/mc.g
-        # pdb.set_trace()
-        # TODO: import metconstants as mc
-        # return heighthalf, terrain_z
-        return terrain_z,heighthalf
-
-    def interp(self,geopot, pres, p):
-        """ Returns the interpolated geopotential at p using the values in pres.
-        The geopotential for an element in pres must be given by the corresponding
-        element in geopot. The length of the geopot and pres arrays must be the same.
+        Return terrain height and height of the model (half) levels
+        along cross-section(s), for time index t.
+
+        Half levels are midway in eta between full levels, so their
+        heights are the destaggered geopotential heights.
+
+        Outputs:
+        terrain_z   :   terrain height, shape ([transect,] point, 1)
+        heighthalf  :   height of each level, ([transect,] point, level)
         """
-        if (len(geopot) != len(pres)):
-            raise Exception("Arrays geopot and pres must have same length")
-    
-        k = len(pres)-1
-        while (k > 1 and pres[k-1] <= p):
-            k = k-1
-    
-        if (pres[k] > p):
-            w = 0.0
-        elif (pres[k-1] < p):
-            w = 1.0
-        else:
-            w = (p-pres[k])/(pres[k-1]-pres[k])
-    
-        return (1.0-w)*geopot[k] + w*geopot[k-1]
+        heighthalf = N.moveaxis(self.get_xs_data('Z',t,weights=weights)[0],0,-1)
+        terrain_z = N.moveaxis(self.get_xs_data('HGT',t,weights=weights)[0],0,-1)
+        return terrain_z, heighthalf
 
+    def swath_average(self,vrbl,avepts,utc=None):
+        """
+        Average of vrbl over the 2*avepts+1 parallel cross-sections
+        centred on this one, for many times in one read.
+
+        Returns:
+        data        :   (time, level, point)
+        heighthalf  :   (time, level, point)
+        """
+        weights = self.bilinear_weights(*self.parallel_transects(
+                                            N.arange(-avepts,avepts+1)))
+        data = self.get_xs_data(vrbl,utc,weights=weights).mean(axis=2)
+        heighthalf = self.get_xs_data('Z',utc,weights=weights).mean(axis=2)
+        return data, heighthalf
 
     def plot_average(self,vrbl,avepts,ttime,outpath,clvs=0,ztop=0,f_suffix=False,
             cmap='jet',contour_vrbl='skip',contour_clvs=False,
             cflabel=False,cftix=False):
 
         self.tidx = self.W.get_time_idx(ttime)
-        AVEDATA = {'cf_vrbl':{},'ct_vrbl':{}}
-        for shn in range(-avepts,avepts+1):
-            if shn == -avepts:
-                self.translate_xs(shn)
-            else:
-                self.translate_xs(1)
-            xint = self.xx.astype(int)
-            yint = self.yy.astype(int)
-
-            # Get terrain heights
-            terrain_z, heighthalf = self.get_height(self.tidx,xint,yint,self.W.z_dim,self.hyp_pts)
-            
-            # Set up plot
-            # Length of x-section in km
-            xs_len = (1/1000.0) * N.sqrt((-1.0*self.hyp_pts*self.W.dy*N.cos(self.angle))**2 +
-                                        (self.hyp_pts*self.W.dy*N.sin(self.angle))**2)
-            
-            # Generate ticks along cross-section
-            xticks = N.arange(0,xs_len,xs_len/self.hyp_pts)
-            xlabels = [r"%3.0f" %t for t in xticks]
-            grid = N.repeat(N.array(xticks).reshape(self.hyp_pts,1),self.W.z_dim,axis=1)
-
-            # Plotting
-            if self.W.dx != self.W.dy:
-                print("Square domains only here")
-            else:
-                # TODO: allow easier change of defaults?
-                self.fig.gca().axis([0,(self.hyp_pts*self.W.dx/1000.0)-1,self.D.plot_zmin,self.D.plot_zmax+self.D.plot_dz])
-           
-            for nn, v in enumerate([vrbl,contour_vrbl]):
-                print(v)
-                if v == 'skip':
-                    continue
-                elif v in self.W.available_vrbls:
-                    # data = self.W.get(vrbl,**ps)
-                    data = self.get_wrfout_slice(v,utc=self.tidx,y=yint,x=xint)
-                    
-                elif v is 'parawind':
-                    # u = self.W.get('U',**ps)
-                    # v = self.W.get('V',**ps)
-                    u = self.get_wrfout_slice('U',utc=self.tidx,y=yint,x=xint)
-                    v = self.get_wrfout_slice('V',utc=self.tidx,y=yint,x=xint)
-                    data = N.cos(self.angle)*u + N.sin(self.angle)*v
-                    # data = N.cos(self.angle)*u - N.sin(self.angle)*v
-                    # import pdb; pdb.set_trace()
-                    # clvs = u_wind_levels
-                    extends = 'both'
-                    CBlabel = r'Wind Speed (ms$^{-1}$)'
-
-                elif v is 'perpwind':
-                    u = self.get_wrfout_slice('U',utc=self.tidx,y=yint,x=xint)
-                    v = self.get_wrfout_slice('V',utc=self.tidx,y=yint,x=xint)
-                    # u = self.W.get('U',ps)
-                    # v = self.W.get('V',ps)
-                    # Note the negative here. I think it's alright? TODO
-                    data = -N.cos(self.angle)*v + N.sin(self.angle)*u
-                    # clvs = u_wind_levels
-                    extends = 'both'
-                    CBlabel = r'Wind Speed (ms$^{-1}$)'
-
-                else:
-                    print(("Unsupported variable",v))
-                    raise Exception
-
-                if nn == 0:
-                    data = N.swapaxes(data[0,:,:],1,0)    
-                    AVEDATA['cf_vrbl'][shn] = data
-                else:
-                    data = N.swapaxes(data[0,:,:],1,0)    
-                    AVEDATA['ct_vrbl'][shn] = data
+
+        # All parallel cross-sections at once
+        weights = self.bilinear_weights(*self.parallel_transects(
+                                            N.arange(-avepts,avepts+1)))
+
+        # Get terrain heights, averaged over the cross-sections
+        terrain_z, heighthalf = self.get_height(self.tidx,weights)
+        terrain_z = terrain_z.mean(axis=0)
+        heighthalf = heighthalf.mean(axis=0)
+
+        # Set up plot
+        # Length of x-section in km
+        xs_len = (1/1000.0) * N.sqrt((-1.0*self.hyp_pts*self.W.dy*N.cos(self.angle))**2 +
+                                    (self.hyp_pts*self.W.dy*N.sin(self.angle))**2)
+
+        # Generate ticks along cross-section
+        xticks = N.arange(0,xs_len,xs_len/self.hyp_pts)
+        xlabels = [r"%3.0f" %t for t in xticks]
+        grid = N.repeat(N.array(xticks).reshape(self.hyp_pts,1),self.W.z_dim,axis=1)
+
+        # Plotting
+        if self.W.dx != self.W.dy:
+            print("Square domains only here")
+        else:
+            # TODO: allow easier change of defaults?
+            self.fig.gca().axis([0,(self.hyp_pts*self.W.dx/1000.0)-1,self.D.plot_zmin,self.D.plot_zmax+self.D.plot_dz])
 
         for nn, v in enumerate([vrbl,contour_vrbl]):
+            print(v)
+            if v == 'skip':
+                continue
+            elif (v not in self.W.available_vrbls) and (
+                        v not in ('parawind','perpwind')):
+                print(("Unsupported variable",v))
+                raise Exception
+
+            # Average over cross-sections; dimensions (point, level)
+            avedata = N.swapaxes(self.get_xs_data(v,self.tidx,
+                                    weights=weights)[0].mean(axis=1),1,0)
             if nn == 0:
                 kwargs = {}
                 kwargs['alpha'] = 0.6
                 kwargs['extend'] = 'both'
                 if isinstance(clvs,N.ndarray):
                     kwargs['levels'] = clvs
-               
-                alldata = N.zeros(((2*avepts)+1,grid.shape[0],grid.shape[1]))
-                for n,nn in enumerate(AVEDATA['cf_vrbl'].keys()):
-                    alldata[n,:,:] = AVEDATA['cf_vrbl'][nn]
-                avedata = N.mean(alldata,axis=0)
                 cf = self.ax.contourf(grid,heighthalf,avedata,cmap=cmap,**kwargs)#,
-            elif contour_vrbl is not 'skip':
-                alldata = N.zeros(((2*avepts)+1,grid.shape[0],grid.shape[1]))
-                for n,nn in enumerate(AVEDATA['ct_vrbl'].keys()):
-                    alldata[n,:,:] = AVEDATA['ct_vrbl'][nn]
-                avedata = N.mean(alldata,axis=0)
-                ct = self.ax.contour(grid,heighthalf,data,colors=['k',],levels=contour_clvs,linewidths=0.3)
+            else:
+                ct = self.ax.contour(grid,heighthalf,avedata,colors=['k',],levels=contour_clvs,linewidths=0.3)
                 self.ax.clabel(ct,inline=1,fontsize=6,fmt='%d')
 
         self.ax.fill_between(xticks,terrain_z[:,0],0,facecolor='lightgrey')
@@ -350,11 +356,8 @@ class CrossSection(Figure):
         """
         self.tidx = self.W.get_time_idx(ttime)
 
-        xint = self.xx.astype(int)
-        yint = self.yy.astype(int)
-
         # Get terrain heights
-        terrain_z, heighthalf = self.get_height(self.tidx,xint,yint,self.W.z_dim,self.hyp_pts)
+        terrain_z, heighthalf = self.get_height(self.tidx)
         
         # Set up plot
         # Length of x-section in km
@@ -390,33 +393,9 @@ class CrossSection(Figure):
             print(v)
             if v == 'skip':
                 continue
-            elif v in self.W.available_vrbls:
-                # data = self.W.get(vrbl,**ps)
-                data = self.get_wrfout_slice(v,utc=self.tidx,y=yint,x=xint)
-                
-            elif v is 'parawind':
-                # u = self.W.get('U',**ps)
-                # v = self.W.get('V',**ps)
-                u = self.get_wrfout_slice('U',utc=self.tidx,y=yint,x=xint)
-                v = self.get_wrfout_slice('V',utc=self.tidx,y=yint,x=xint)
-                data = N.cos(self.angle)*u + N.sin(self.angle)*v
-                # data = N.cos(self.angle)*u - N.sin(self.angle)*v
-                # import pdb; pdb.set_trace()
-                # clvs = u_wind_levels
-                extends = 'both'
-                CBlabel = r'Wind Speed (ms$^{-1}$)'
-
-            elif v is 'perpwind':
-                u = self.get_wrfout_slice('U',utc=self.tidx,y=yint,x=xint)
-                v = self.get_wrfout_slice('V',utc=self.tidx,y=yint,x=xint)
-                # u = self.W.get('U',ps)
-                # v = self.W.get('V',ps)
-                # Note the negative here. I think it's alright? TODO
-                data = -N.cos(self.angle)*v + N.sin(self.angle)*u
-                # clvs = u_wind_levels
-                extends = 'both'
-                CBlabel = r'Wind Speed (ms$^{-1}$)'
-
+            elif (v in self.W.available_vrbls) or (
+                        v in ('parawind','perpwind')):
+                data = self.get_xs_data(v,self.tidx)
             else:
                 print(("Unsupported variable",v))
                 raise Exception
@@ -488,22 +467,15 @@ class CrossSection(Figure):
         
     def create_linenormal_xs(self,x,y,length_pts=3):
         """
-        Return a cross-section that runs normal to the
+        Return points of a cross-section that runs normal to the
         existing cross-section contained in self.
         
         x,y         :   coordinates of intersection
         length_pts  :   length of normal line in grid points
-        """
-    
-        self.hyp_pts, self.xx, self.yy = self.get_xs_slice()
 
-        xint = self.xx.astype(int)
-        yint = self.yy.astype(int)
-        self.angle = N.arctan((self.yy[-1]-self.yy[0])/(self.xx[-1]-self.xx[0])) # In radians
-        
-        normal_angle = self.angle + N.radians(90)
-        # pdb.set_trace()
-        
-        
-        #return norm_xx, norm_yy
-        return 1,2
+        Many normal cross-sections at once: see linenormal_transects.
+        """
+        s = N.arange(-length_pts,length_pts+1)
+        norm_xx = x - s*N.sin(self.angle)
+        norm_yy = y + s*N.cos(self.angle)
+        return norm_xx, norm_yy
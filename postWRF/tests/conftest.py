@@ -0,0 +1,78 @@
+"""Fixtures for the postWRF tests: small synthetic wrfout files.
+
+Run from the directory containing the WEM checkout, e.g.
+python -m pytest WEM/postWRF/tests
+"""
+import datetime
+
+import numpy as N
+import pytest
+from netCDF4 import Dataset
+
+def write_wrfout(fpath,nt=3,nz=10,ny=20,nx=25,
+                    t0=datetime.datetime(2013,8,15,0),dt=3600,seed=0):
+    """Write a wrfout-like file with the fields most computations need.
+    """
+    rs = N.random.RandomState(seed)
+    nc = Dataset(fpath,'w')
+    for dname, size in (('Time',None),('DateStrLen',19),('bottom_top',nz),
+                        ('bottom_top_stag',nz+1),('south_north',ny),
+                        ('south_north_stag',ny+1),('west_east',nx),
+                        ('west_east_stag',nx+1)):
+        nc.createDimension(dname,size)
+    nc.DX = 3000.0
+    nc.DY = 3000.0
+    nc.CEN_LAT = 40.0
+    nc.CEN_LON = -100.0
+    nc.TRUELAT1 = 30.0
+    nc.TRUELAT2 = 60.0
+    nc.MAP_PROJ = 1
+    nc.STAND_LON = -100.0
+
+    times = nc.createVariable('Times','S1',('Time','DateStrLen'))
+    for n in range(nt):
+        t = t0 + datetime.timedelta(seconds=dt*n)
+        times[n,:] = N.array(list(t.strftime('%Y-%m-%d_%H:%M:%S')),dtype='S1')
+
+    def write(vrbl,dims,arr):
+        v = nc.createVariable(vrbl,'f4',dims)
+        v[:] = arr
+
+    lons, lats = N.meshgrid(N.linspace(-105,-95,nx),N.linspace(35,45,ny))
+    write('XLAT',('Time','south_north','west_east'),N.repeat(lats[None],nt,0))
+    write('XLONG',('Time','south_north','west_east'),N.repeat(lons[None],nt,0))
+    write('P_TOP',('Time',),5000.0)
+
+    mass = ('Time','bottom_top','south_north','west_east')
+    sh = (nt,nz,ny,nx)
+    eta = N.linspace(0,1,nz)[None,:,None,None]
+    write('PB',mass,100000.0*N.exp(-2.5*eta)*N.ones(sh))
+    write('P',mass,300*rs.randn(*sh))
+    write('T',mass,60*eta + rs.randn(*sh) - 5)
+    write('QVAPOR',mass,0.015*N.exp(-4*eta)*(1+0.1*rs.rand(*sh)))
+    write('QRAIN',mass,0.002*rs.rand(*sh)**4)
+    write('QSNOW',mass,0.001*rs.rand(*sh)**4)
+    write('U',('Time','bottom_top','south_north','west_east_stag'),
+            10*rs.randn(nt,nz,ny,nx+1))
+    write('V',('Time','bottom_top','south_north_stag','west_east'),
+            10*rs.randn(nt,nz,ny+1,nx))
+    write('W',('Time','bottom_top_stag','south_north','west_east'),
+            rs.randn(nt,nz+1,ny,nx))
+    etas = N.linspace(0,1,nz+1)[None,:,None,None]
+    HGT = 500 + 200*rs.rand(ny,nx)
+    write('PHB',('Time','bottom_top_stag','south_north','west_east'),
+            9.81*(HGT[None,None] + 15000.0*etas)*N.ones((nt,nz+1,ny,nx)))
+    write('PH',('Time','bottom_top_stag','south_north','west_east'),
+            10*rs.randn(nt,nz+1,ny,nx)*(etas > 0))
+    flat = ('Time','south_north','west_east')
+    write('HGT',flat,N.repeat(HGT[None],nt,0))
+    for vrbl, base, scale in (('T2',295.0,3.0),('PSFC',95000.0,200.0),
+                    ('U10',0.0,5.0),('V10',0.0,5.0),('MAPFAC_M',1.0,0.01)):
+        write(vrbl,flat,base + scale*rs.randn(nt,ny,nx))
+    nc.close()
+    return fpath
+
+@pytest.fixture
+def wrfout(tmp_path):
+    """Path to a synthetic wrfout file."""
+    return write_wrfout(str(tmp_path/'wrfout_d01_2013-08-15_00:00:00'))
@@ -0,0 +1,25 @@
+import os
+import time
+
+from WEM.postWRF.postWRF.cache import DirectoryManifest, cache_path
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+def test_caches_leave_data_directories_alone(wrfout,tmp_path_factory,
+                                                monkeypatch):
+    monkeypatch.setenv('WEM_CACHE_DIR',str(tmp_path_factory.mktemp('cache')))
+    datadir = os.path.dirname(wrfout)
+    past = time.time_ns() - 10**10
+    os.utime(datadir,ns=(past,past))
+
+    M = DirectoryManifest(cache_path('manifest',datadir,'json'))
+    files, subdirs = M.listdir(datadir)
+    M.save()
+    WRFOut.metacache.clear()
+    WRFOut(wrfout)
+    assert os.path.exists(WRFOut.metacache.cache_path(wrfout))
+    assert os.stat(datadir).st_mtime_ns == past
+    assert sorted(os.listdir(datadir)) == ['wrfout_d01_2013-08-15_00:00:00']
+
+    M = DirectoryManifest(cache_path('manifest',datadir,'json'))
+    assert M.listdir(datadir) == (files,subdirs)
+    assert (M.hits, M.misses) == (1,0)
@@ -0,0 +1,17 @@
+import numpy as N
+import pytest
+
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+@pytest.mark.parametrize('prefetch',[False,True])
+def test_chunks_cover_every_time(wrfout,prefetch):
+    W = WRFOut(wrfout)
+    T = W.get('T2',None)
+    chunks = list(W.iter_chunks('T2',chunk_t=2,prefetch=prefetch))
+    assert [list(t) for t,d in chunks] == [[0,1],[2]]
+    assert N.array_equal(N.concatenate([d for t,d in chunks]),T)
+
+@pytest.mark.parametrize('prefetch',[False,True])
+def test_no_chunks_for_no_times(wrfout,prefetch):
+    W = WRFOut(wrfout)
+    assert list(W.iter_chunks('T2',utc=[],prefetch=prefetch)) == []
@@ -0,0 +1,77 @@
+"""Vectorised composite reflectivity against the original
+column-by-column loop, at every time of a synthetic wrfout file.
+
+The two agree to about 1e-6 dBZ (single-precision rounding); the
+comparison allows 1e-4 dBZ. Graupel, which the loop ignored, is checked
+separately.
+"""
+import numpy as N
+from netCDF4 import Dataset
+
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+def loop_cref(W,t):
+    """The original compute_comp_ref (one time, Python loop over
+    columns), with one deliberate fix. The original read QRAIN and
+    QSNOW with level=False, i.e. the lowest level only, and then
+    raised IndexError indexing level 1, so it gave no output to
+    compare with. This reads every level, so it is the column maximum
+    the loop was written to find.
+    """
+    T2 = W.get('T2',t)
+    QR = W.get('QRAIN',t)
+    PSFC = W.get('PSFC',t)
+    if 'QSNOW' in W.fields:
+        QS = W.get('QSNOW',t)
+    else:
+        QS = N.zeros(N.shape(QR))
+    rhor = 1000.0
+    no_rain = 8.0E6
+    no_snow = 2.0E6 * N.exp(-0.12*(T2-273.15))
+    density = N.divide(PSFC,(287.0 * T2))
+    Qra_all = QR[0,...]
+    Qsn_all = QS[0,...]
+
+    for j in range(len(Qra_all[1,:,1])):
+        curcol_r = []
+        curcol_s = []
+        for i in range(len(Qra_all[1,1,:])):
+            curcol_r.append(N.max(Qra_all[:,j,i]))
+            curcol_s.append(N.max(Qsn_all[:,j,i]))
+        if j == 0:
+            Qra = N.array(curcol_r)
+            Qsn = N.array(curcol_s)
+        else:
+            Qra = N.vstack((Qra, N.array(curcol_r)))
+            Qsn = N.vstack((Qsn, N.array(curcol_s)))
+
+    lambr = (N.divide((3.14159 * no_rain * rhor), N.multiply(density, Qra)+N.nextafter(0,1))) ** 0.25
+    lambs = N.exp(-0.0536 * (T2 - 273.15))
+    Zer = (720.0 * no_rain * (lambr ** -7.0)) * 1E18
+    Zes_int = N.divide((lambs * Qsn * density), no_snow)
+    Zes = ((0.224 * 720 * 1E18) / (3.14159 * rhor) ** 2) * Zes_int ** 2
+    return N.nan_to_num(10*N.log10(N.add(Zer, Zes)))
+
+def test_cref_matches_loop(wrfout):
+    W = WRFOut(wrfout,cache_mb=0)
+    old = N.concatenate([loop_cref(W,t) for t in range(W.t_dim)],axis=0)
+    new = W.get('cref')
+    assert new.shape == old.shape
+    assert N.allclose(new,old,atol=1e-4)
+
+def test_cref_graupel(wrfout):
+    W = WRFOut(wrfout,cache_mb=0)
+    nograu = W.get('cref')
+    W.close()
+    nc = Dataset(wrfout,'a')
+    v = nc.createVariable('QGRAUP','f4',nc.variables['QRAIN'].dimensions)
+    v[:] = N.zeros(v.shape)
+    v[:,3] = 0.004
+    nc.close()
+
+    W = WRFOut(wrfout,cache_mb=0)
+    density = W.get('PSFC')/(287.0*W.get('T2'))
+    lambg = (N.pi*4.0E6*400.0/(density*0.004))**0.25
+    Zeg = 0.224*(400.0/1000.0)**2*720.0*4.0E6*lambg**-7*1E18
+    ref = 10*N.log10(10**(nograu/10) + Zeg)
+    assert N.allclose(W.get('cref'),ref,atol=1e-3)
@@ -0,0 +1,19 @@
+import numpy as N
+import pytest
+
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+@pytest.mark.parametrize('k',[1,3,7])
+def test_model_level_fields_match_level_k(wrfout,k):
+    W = WRFOut(wrfout)
+    gradtheta, U, V, omega, dP = W.frontogenesis_fields(1,k,None,None)
+
+    TH = W.get('theta',1,k)[:,0,...]
+    dTHdy, dTHdx = N.gradient(TH,W.dy,W.dx,axis=(-2,-1))
+    mapfac = W.get('MAPFAC_M',1,None)[:,0,...]
+    assert N.allclose(gradtheta[:,1,...],mapfac*N.hypot(dTHdx,dTHdy))
+    assert N.allclose(U,W.get('U',1,k)[:,0,...])
+
+    Pabove = W.get('pressure',1,k+1)[:,0,...]
+    Pbelow = W.get('pressure',1,k-1)[:,0,...]
+    assert N.allclose(dP,Pabove-Pbelow)
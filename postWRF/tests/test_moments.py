@@ -0,0 +1,29 @@
+import numpy as N
+
+from WEM.postWRF.postWRF.moments import Moments
+
+def test_merge_matches_all_members():
+    rs = N.random.RandomState(0)
+    data = rs.randn(7,3,4,5).astype(N.float32)
+    parts = [Moments((0.5,)) for n in range(3)]
+    for n,d in enumerate(data):
+        parts[n%3].add(d)
+    M = Moments((0.5,))
+    for P in parts:
+        M.merge(P)
+    assert M.n == 7
+    assert N.allclose(M.mean,data.mean(axis=0))
+    assert N.allclose(M.std(),data.std(axis=0))
+    assert N.array_equal(M.min,data.min(axis=0))
+    assert N.array_equal(M.above(0.5),(data > 0.5).sum(axis=0))
+
+def test_merge_into_empty_copies():
+    rs = N.random.RandomState(1)
+    other = Moments((0.0,)).add(rs.randn(4,5)).add(rs.randn(4,5))
+    before = {k: getattr(other,k).copy()
+                for k in ('mean','M2','min','max','counts')}
+    M = Moments((0.0,)).merge(other)
+    M.add(10+rs.randn(4,5)).merge(Moments((0.0,)).add(-10+rs.randn(4,5)))
+    for k,v in before.items():
+        assert N.array_equal(getattr(other,k),v)
+    assert other.n == 2
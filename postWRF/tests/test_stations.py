@@ -0,0 +1,35 @@
+import numpy as N
+import pytest
+
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+def test_station_series_at_level(wrfout):
+    W = WRFOut(wrfout)
+    weights = W.station_weights(N.array([38.0,41.5]),N.array([-101.0,-97.5]))
+    yidx, xidx, wgt = weights
+    out = W.get_stations(['T','T2'],level=3,weights=weights)
+    assert out.shape == (2,3,2)
+    T = W.get('T',None,3)[:,0,...]
+    assert N.allclose(out[:,:,0],(T[:,yidx,xidx]*wgt).sum(axis=-1).T)
+
+@pytest.mark.parametrize('method',['nearest','idw'])
+def test_station_series_read_only_neighbours(wrfout,method):
+    W = WRFOut(wrfout)
+    lats = N.array([35.5,38.0,38.2,44.5])
+    lons = N.array([-104.5,-101.0,-96.0,-95.5])
+    weights = W.station_weights(lats,lons,method=method)
+    yidx, xidx, wgt = weights
+    out = W.get_stations(['T2','theta','pressure'],level=2,weights=weights)
+    for n,vrbl in enumerate(('T2','theta','pressure')):
+        ref = W.get(vrbl,None,2)[:,0,...]
+        assert N.allclose(out[:,:,n],(ref[:,yidx,xidx]*wgt).sum(axis=-1).T)
+
+    W.cache.clear()
+    W.get_stations('T2',level=0,weights=weights)
+    # Nothing is kept once the series are extracted
+    assert len(W.cache) == 0
+
+def test_stations_need_a_single_level(wrfout):
+    W = WRFOut(wrfout)
+    with pytest.raises(Exception,match='single level'):
+        W.get_stations('T',N.array([38.0]),N.array([-101.0]))
@@ -0,0 +1,75 @@
+import numpy as N
+import pytest
+import scipy.optimize
+
+from WEM.utils import metconstants as mc
+from WEM.postWRF.postWRF import thermo
+from WEM.postWRF.postWRF.wrfout import WRFOut
+
+# Pressure (Pa) and height (m) of 40 levels
+P = N.linspace(100000.0,20000.0,40)
+Z = N.linspace(0.0,12000.0,40)
+
+def column(x):
+    """4D (time, level, lat, lon) array of one column."""
+    return N.asarray(x,dtype=float)[N.newaxis,:,N.newaxis,N.newaxis]
+
+def test_linear_buoyancy():
+    """A saturated surface parcel in dry air cooled so that, above the
+    ground (where it is the environment), buoyancy is a*(z-z1). Layers
+    are trapezoids and the zero crossing is exact for linear buoyancy,
+    so CAPE, CIN and the LFC (z1) are known exactly.
+    """
+    a, z1, H = 1e-5, 3000.0, Z[-1]
+    T0 = 300.0
+    w0 = thermo.sat_mixing_ratio(P[0],T0)
+    the0 = thermo.theta_e(P[0],T0,w0,T0)
+    Tp = [T0]
+    for p in P[1:]:
+        Tp.append(thermo.moist_temperature(p,the0,Tp[-1]))
+    Tp = N.array(Tp)
+    Tvp = thermo.virtual_temperature(Tp,thermo.sat_mixing_ratio(P,Tp))
+    B = a*(Z-z1)
+    Te = Tvp/(1+B/mc.g)
+    w = N.zeros(P.shape)
+    Te[0], w[0] = T0, w0
+
+    cape, cin, lcl, lfc = thermo.lift_parcels(column(P),column(Te),
+                                    column(w),column(Z),'SB')
+    assert lcl.item() == 0.0
+    assert lfc.item() == pytest.approx(z1)
+    cin_ref = 0.5*B[1]*Z[1] - a*(z1-Z[1])**2/2
+    assert cin.item() == pytest.approx(cin_ref,rel=1e-6)
+    assert cape.item() == pytest.approx(a*(H-z1)**2/2,rel=1e-6)
+
+def test_dry_parcel_lcl():
+    """The LCL of an unsaturated parcel is where its dry-adiabatic
+    temperature meets its dewpoint. A parcel that only cools in warm,
+    dry air has no LFC, CAPE or CIN.
+    """
+    T0, w0 = 303.0, 0.012
+    th0 = thermo.theta(P[0],T0)
+    Te = N.full(P.shape,T0+5.0)
+    w = N.full(P.shape,1e-4)
+    w[0] = w0
+    Te[0] = T0
+
+    cape, cin, lcl, lfc = thermo.lift_parcels(column(P),column(Te),
+                                    column(w),column(Z),'SB')
+    p_lcl = scipy.optimize.brentq(lambda p: thermo.temperature(p,th0) -
+                    thermo.dewpoint(p,w0),P[-1],P[0])
+    z_lcl = N.interp(-N.log(p_lcl),-N.log(P),Z)
+    # Bolton's formula is within 0.1 K of the exact LCL temperature
+    assert lcl.item() == pytest.approx(z_lcl,abs=20.0)
+    assert N.isnan(lfc.item())
+    assert cape.item() == 0.0
+    assert cin.item() == 0.0
+
+@pytest.mark.parametrize('parcel',['SB','ML','MU'])
+def test_tiles_match_whole_domain(wrfout,parcel):
+    W = WRFOut(wrfout)
+    whole = W.lift_parcels(None,None,None,parcel)
+    W = WRFOut(wrfout)
+    W.tile = 7
+    tiled = W.lift_parcels(None,None,None,parcel)
+    assert N.array_equal(whole,tiled,equal_nan=True)
@@ -2,6 +2,7 @@
 from netCDF4 import Dataset
 import calendar
 import collections
+import collections.abc
 import fnmatch
 import math
 import matplotlib as M
@@ -17,6 +18,7 @@ import datetime
 import heapq
 
 from . import getdata
+from .gridindex import GridIndex
 
 def decompose_wind(wspd,wdir,convert=0):
     # Split wind speed/wind direction into u,v
@@ -776,7 +778,7 @@ def check_vertical_coordinate(level):
         raise Exception
 
     # import pdb; pdb.set_trace()
-    if isinstance(lv,int):
+    if isinstance(lv,(int,N.integer)):
         if lv<100:
             return 'index'
         else:
@@ -800,7 +802,7 @@ def check_vertical_coordinate(level):
     elif lv.endswith('PVU'):
         return 'PV-surface'
 
-    elif lv.endswith('km'):
+    elif lv.endswith('km') or lv.endswith('m'):
         return 'geometric'
 
     else:
@@ -824,12 +826,35 @@ def closest(arr,val):
     idx = N.argmin(N.abs(arr - val))
     return idx
 
+def closest_sorted(arr,vals):
+    """
+    Find index of closest value in a sorted 1D array, for many
+    values at once (binary search rather than a scan per value).
+
+    Inputs:
+    arr     :   array of values, sorted ascending
+    vals    :   required value(s)
+
+    Output:
+
+    idx     :   array of index of closest value to each of vals
+    """
+    arr = N.asarray(arr)
+    vals = N.atleast_1d(vals)
+    if len(arr) == 1:
+        return N.zeros(vals.shape,dtype=int)
+    idx = N.clip(N.searchsorted(arr,vals),1,len(arr)-1)
+    # Ties go to the earlier value, like N.argmin
+    idx = idx - ((vals - arr[idx-1]) <= (arr[idx] - vals))
+    return idx
+
 def closest_datetime(times,t,round=False):
     """Find closest value in list of datetimes.
     Return index of closest.
 
     Arguments:
-        times (list,tuple): collection of datetimes.
+        times (list,tuple,N.ndarray): collection of datetimes, or
+            an array of numpy datetime64 (faster if reused).
         t (datetime.datetime): required time
         round (bool,str): If False, return closest index only.
             If 'afterinc', return index of first time after t.
@@ -840,47 +865,26 @@ def closest_datetime(times,t,round=False):
             If 'beforeexc', same, but if closest time = t, return one before.
 
     Returns:
-        idx (int): Index of times requests
+        idx (int): Index of times requests, in sorted order of times.
         dtss[idx] (int): Number of seconds difference between the two.
     """
-    stimes = N.array(sorted(times))
-    dts = stimes-t
-    dtss = [(d.days*86400)+d.seconds for d in dts]
-
-    # Closest index
-    cidx = N.argmin(N.abs(dtss))
+    stimes = N.sort(N.array(times,dtype='datetime64[s]'))
+    t = N.datetime64(t,'s')
 
     if round is False:
-        idx = cidx
+        idx = int(closest_sorted(stimes,t)[0])
+    elif round == 'afterinc':
+        idx = int(N.searchsorted(stimes,t,side='left'))
+    elif round == 'afterexc':
+        idx = int(N.searchsorted(stimes,t,side='right'))
+    elif round == 'beforeinc':
+        idx = int(N.searchsorted(stimes,t,side='right'))-1
+    elif round == 'beforeexc':
+        idx = int(N.searchsorted(stimes,t,side='left'))-1
     else:
-        if dtss[cidx] == 0:
-            bidx_inc = cidx
-            aidx_inc = cidx
-            bidx_exc = cidx-1
-            aidx_exc = cidx+1
-        elif times[cidx] < t:
-            bidx_inc = cidx
-            bidx_exc = cidx
-            aidx_inc = cidx+1
-            aidx_exc = cidx+1
-        else:
-            bidx_exc = cidx-1
-            bidx_inc = cidx-1
-            aidx_exc = cidx
-            aidx_nxc = cidx
-
-        if round is 'afterinc':
-            idx = aidx_inc
-        elif round is 'afterexc':
-            idx = aidx_exc
-        elif round is 'beforeinc':
-            idx = bidx_inc
-        elif round is 'beforeexc':
-            idx = bidx_exc
-        else:
-            raise Exception("Enter valid value for round.")
-    
-    return idx, dtss[idx]
+        raise Exception("Enter valid value for round.")
+
+    return idx, int((stimes[idx]-t).astype(int))
 
 def dstack_loop(data, obj):
     """
@@ -985,7 +989,7 @@ def get_sequence(x,sos=0):
     else:
         y = x
 
-    if isinstance(y, collections.Sequence) and not isinstance(y, str):
+    if isinstance(y, collections.abc.Sequence) and not isinstance(y, str):
         # i.e., if y is a list or tuple
         return x
     else:
@@ -1311,13 +1315,20 @@ def interp_latlon(data,lat,lon,lats,lons):
     ntimes = data.shape[0]
     nlvs = data.shape[1]
     dataout = N.zeros([ntimes,nlvs,1,1])
+    index = GridIndex.for_grid(lats,lons)
     for lv in range(nlvs):
     # for t in range(ntimes):
-        dataout[:,lv,0,0] = interp2point(data[:,lv:lv+1,:,:],lat,lon,lats,lons)
+        dataout[:,lv,0,0] = interp2point(data[:,lv:lv+1,:,:],lat,lon,lats,lons,
+                                            index=index)
     return dataout
 
 
-def interp2point(data,lat_loc,lon_loc,lat,lon,lvidx=0,xyidx=False):
+def interp2point(data,lat_loc,lon_loc,lat,lon,lvidx=0,xyidx=False,
+                    index=None):
+        """
+        index   :   GridIndex of lat/lon, built once for many calls.
+                    Default is the cached index from GridIndex.for_grid().
+        """
         er = 6370000
         if xyidx:
             # Don't need data, ignore
@@ -1326,26 +1337,26 @@ def interp2point(data,lat_loc,lon_loc,lat,lon,lvidx=0,xyidx=False):
         else:
             field = data[:,lvidx,:,:]
             # field = self.make_4D(data)[:,lvidx,:,:]
-        templat = lat.ravel()
-        templon = lon.ravel()
-
-        #calculates the great circle distance from the inquired point
-        delta = haversine_baker(lon_loc,lat_loc,templon,templat,earth_rad=er)
-        #grid distance
-        dxdy = haversine_baker(templon[0],templat[0],templon[1],templat[0],earth_rad=er)
 
-        #9 smallest values to find the index of
-        smallest = heapq.nsmallest(9,delta.ravel())
-
-        wtf = N.in1d(delta.ravel(),smallest)
-        tf2d = N.in1d(delta.ravel(),smallest).reshape(lat.shape)
-        ix,iy = N.where(tf2d == True)
+        #9 nearest grid points, from the spatial index
+        if index is None:
+            index = GridIndex.for_grid(lat,lon)
+        ix,iy,_ = index.query(lat_loc,lon_loc,k=9)
+        ix = ix.ravel()
+        iy = iy.ravel()
         if xyidx:
             xidx = N.median(ix)
             yidx = N.median(iy)
             return xidx, yidx
 
-        weights =  1.0 - delta.ravel()[wtf]/(dxdy.ravel() * 2)
+        #calculates the great circle distance from the inquired point
+        delta = haversine_baker(lon_loc,lat_loc,lon[ix,iy],lat[ix,iy],earth_rad=er)
+        #grid distance
+        templat = lat.ravel()
+        templon = lon.ravel()
+        dxdy = haversine_baker(templon[0],templat[0],templon[1],templat[0],earth_rad=er)
+
+        weights =  1.0 - delta/(dxdy.ravel() * 2)
         weighted_mean = N.average(field[:,ix,iy],axis=1,weights=weights.ravel())
 
         return weighted_mean
@@ -1402,11 +1413,16 @@ def haversine_baker(lon1, lat1, lon2, lat2, radians=False, earth_rad=6371.227):
         i += 1
     return distance.ravel()
 
-def get_latlon_idx(lats,lons,lat,lon):
-    coords = N.unravel_index(N.argmin((lat-lats)**2+
-                (lon-lons)**2),lons.shape)
-    # lon, lat
-    return [int(c) for c in coords]
+def get_latlon_idx(lats,lons,lat,lon,index=None):
+    """
+    Indices (lat, lon) of the grid point closest to lat/lon, using a
+    spatial index of the grid that is built once and reused. For many
+    queries, pass the GridIndex of lats/lons as index.
+    """
+    if index is None:
+        index = GridIndex.for_grid(lats,lons)
+    yidx, xidx = index.nearest(lat,lon)
+    return [int(yidx[0]),int(xidx[0])]
 
 def make_subplot_label(ax,label):
     if not label.endswith(')'):
@@ -4,3 +4,4 @@ References these utilities in WEM.utils.
 from .unix_tools import *
 from .GIS_tools import *
 from .getdata import *
+from .gridindex import GridIndex, interp_points
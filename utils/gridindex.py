@@ -0,0 +1,125 @@
+"""
+Spatial index for finding grid points near given latitudes/longitudes.
+"""
+
+import collections
+
+import numpy as N
+import scipy.spatial
+
+def latlon_to_xyz(lats,lons):
+    """
+    Convert latitude/longitude (degrees) to Cartesian coordinates
+    on the unit sphere. Returns array with shape (...,3).
+    """
+    lats = N.radians(lats)
+    lons = N.radians(lons)
+    coslat = N.cos(lats)
+    return N.stack((coslat*N.cos(lons),coslat*N.sin(lons),N.sin(lats)),
+                        axis=-1)
+
+class GridIndex(object):
+    """
+    KD-tree of the points of a 2D latitude/longitude grid, built on
+    3D unit-sphere coordinates so distances are valid on any map
+    projection and across the dateline.
+
+    Trees are slow to build, so use GridIndex.for_grid() to share one
+    index between all files on the same grid, and build it once for
+    many queries (see e.g. WRFOut.gridindex).
+    """
+    # Indices already built, keyed by grid_key()
+    grids = collections.OrderedDict()
+    max_grids = 8
+
+    def __init__(self,lats,lons):
+        """
+        lats, lons  :   2D arrays (or 1D vectors of a regular grid)
+        """
+        lats = N.ma.getdata(lats)
+        lons = N.ma.getdata(lons)
+        if lats.ndim == 1:
+            lons, lats = N.meshgrid(lons,lats)
+        self.shape = lats.shape
+        self.tree = scipy.spatial.cKDTree(
+                        latlon_to_xyz(lats,lons).reshape(-1,3))
+
+    @staticmethod
+    def grid_key(lats,lons):
+        """
+        Cheap key for a grid: its shape, type, and a sample of 9 x 9
+        points including the corners. Finding a cached index then costs
+        nothing like a pass over the grid.
+        """
+        key = []
+        for arr in (lats,lons):
+            arr = N.ma.getdata(arr)
+            idx = [N.unique(N.linspace(0,n-1,9).astype(int))
+                        for n in arr.shape]
+            key.append((arr.shape,arr.dtype.str,
+                        N.ascontiguousarray(arr[N.ix_(*idx)]).tobytes()))
+        return tuple(key)
+
+    @classmethod
+    def for_grid(cls,lats,lons):
+        """
+        Return the (cached) index for this grid.
+        """
+        key = cls.grid_key(lats,lons)
+        if key in cls.grids:
+            cls.grids.move_to_end(key)
+        else:
+            cls.grids[key] = cls(lats,lons)
+            while len(cls.grids) > cls.max_grids:
+                cls.grids.popitem(last=False)
+        return cls.grids[key]
+
+    def query(self,lats,lons,k=1):
+        """
+        Find the k nearest grid points to each of many locations.
+
+        Returns:
+            yidx, xidx  :   grid indices, shape (npts,) if k is 1,
+                            else (npts,k)
+            dist        :   chord distance on the unit sphere
+        """
+        xyz = latlon_to_xyz(N.atleast_1d(lats),N.atleast_1d(lons))
+        dist, idx = self.tree.query(xyz,k=k)
+        yidx, xidx = N.unravel_index(idx,self.shape)
+        return yidx, xidx, dist
+
+    def nearest(self,lats,lons):
+        """
+        Grid indices (y, x) of the nearest point to each location.
+        """
+        yidx, xidx, _ = self.query(lats,lons)
+        return yidx, xidx
+
+    def weights(self,lats,lons,k=4,power=2):
+        """
+        Inverse-distance weights of the k nearest grid points to each
+        location. Compute once and reuse with interp_points() for any
+        number of fields.
+
+        Returns:
+            yidx, xidx, wgt     :   arrays with shape (npts,k)
+        """
+        yidx, xidx, dist = self.query(lats,lons,k=k)
+        yidx = yidx.reshape(-1,k)
+        xidx = xidx.reshape(-1,k)
+        dist = dist.reshape(-1,k)
+        with N.errstate(divide='ignore'):
+            wgt = 1.0/dist**power
+        # A location on a grid point takes its value
+        exact = dist[:,0] == 0
+        wgt[exact,:] = 0.0
+        wgt[exact,0] = 1.0
+        wgt /= wgt.sum(axis=1,keepdims=True)
+        return yidx, xidx, wgt
+
+def interp_points(data,yidx,xidx,wgt):
+    """
+    Interpolate data (...,lat,lon) to locations, with weights from
+    GridIndex.weights(). Returns array with shape (...,npts).
+    """
+    return (data[...,yidx,xidx]*wgt).sum(axis=-1)